@@ -0,0 +1,122 @@
+# Copyright 2016 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Incremental decoding of large JSON documents.
+
+Allows walking the top levels of a document read from a file, decoding only one
+value at a time, so that the whole document never needs to be held in memory as
+Python objects.
+"""
+
+import json
+
+
+class JsonStream(object):
+  """Reads a JSON document from a file, one value at a time.
+
+  Example, for a document {"a": 1, "b": [{...}, {...}]}:
+    stream = JsonStream(f)
+    for key in stream.IterObjectKeys():
+      if key == 'b':
+        for _ in stream.IterArrayItems():
+          value, text = stream.ReadValueAndText()
+      else:
+        stream.ReadValue()
+
+  Each key or array item that is yielded must be consumed (using one of the
+  Read or Iter methods) before the iteration continues.
+  """
+  _CHUNK_SIZE = 1 << 20
+  _WHITESPACE = ' \t\n\r'
+
+  def __init__(self, input_file):
+    self._file = input_file
+    self._buffer = ''
+    self._pos = 0
+    self._eof = False
+    self._decoder = json.JSONDecoder()
+
+  def _Fill(self, min_size=0):
+    """Reads more data. Returns False at the end of the file."""
+    if self._eof:
+      return False
+    chunk = self._file.read(max(self._CHUNK_SIZE, min_size))
+    self._buffer = self._buffer[self._pos:] + chunk
+    self._pos = 0
+    if not chunk:
+      self._eof = True
+    return bool(chunk)
+
+  def Peek(self):
+    """Returns the next non-whitespace character, or '' at the end."""
+    while True:
+      buf = self._buffer
+      pos = self._pos
+      while pos < len(buf) and buf[pos] in self._WHITESPACE:
+        pos += 1
+      self._pos = pos
+      if pos < len(buf) or not self._Fill():
+        return buf[pos:pos + 1]
+
+  def _Consume(self, expected_chars):
+    c = self.Peek()
+    if not c or c not in expected_chars:
+      raise ValueError('Expected one of "%s" at offset %d, found "%s"' % (
+          expected_chars, self._pos, c))
+    self._pos += 1
+    return c
+
+  def ReadValueAndText(self):
+    """Decodes the next value.
+
+    Returns:
+      (value, text), where text is the JSON text of the value.
+    """
+    self.Peek()
+    while True:
+      try:
+        value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        # A number that reaches the end of the buffer may be truncated.
+        if end < len(self._buffer) or self._eof:
+          break
+      except ValueError:
+        if self._eof:
+          raise
+      # Read at least as much again so that large values are not re-parsed
+      # too many times.
+      self._Fill(len(self._buffer) - self._pos)
+    text = self._buffer[self._pos:end]
+    self._pos = end
+    return value, text
+
+  def ReadValue(self):
+    """Decodes and returns the next value."""
+    return self.ReadValueAndText()[0]
+
+  def IterObjectKeys(self):
+    """Yields the keys of the next value, which must be an object."""
+    self._Consume('{')
+    if self.Peek() == '}':
+      self._pos += 1
+      return
+    while True:
+      key = self.ReadValue()
+      self._Consume(':')
+      yield key
+      if self._Consume(',}') == '}':
+        return
+
+  def IterArrayItems(self):
+    """Yields the index of each item of the next value, which must be an array.
+    """
+    self._Consume('[')
+    if self.Peek() == ']':
+      self._pos += 1
+      return
+    index = 0
+    while True:
+      yield index
+      index += 1
+      if self._Consume(',]') == ']':
+        return
@@ -0,0 +1,71 @@
+# Copyright 2016 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import json
+import StringIO
+import unittest
+
+import json_stream
+
+
+class JsonStreamTestCase(unittest.TestCase):
+  _DOCUMENT = {
+      'url': 'http://example.com',
+      'number': 1234567,
+      'empty_list': [],
+      'empty_dict': {},
+      'events': [{'ts': 12345, 'name': u'caf\xe9', 'args': {'a': [1, 2]}},
+                 {'ts': 1.5, 'name': 'b'}, 3, None],
+  }
+
+  def setUp(self):
+    self._chunk_size = json_stream.JsonStream._CHUNK_SIZE
+    # Exercise values spanning multiple reads.
+    json_stream.JsonStream._CHUNK_SIZE = 3
+
+  def tearDown(self):
+    json_stream.JsonStream._CHUNK_SIZE = self._chunk_size
+
+  def _Stream(self, value, indent=None):
+    return json_stream.JsonStream(
+        StringIO.StringIO(json.dumps(value, indent=indent)))
+
+  def testReadValue(self):
+    for value in (self._DOCUMENT, 123456789, 'abc', [], None):
+      self.assertEquals(value, self._Stream(value).ReadValue())
+
+  def testIterate(self):
+    for indent in (None, 2):
+      stream = self._Stream(self._DOCUMENT, indent)
+      result = {}
+      for key in stream.IterObjectKeys():
+        if key in ('events', 'empty_list'):
+          result[key] = []
+          for index in stream.IterArrayItems():
+            self.assertEquals(len(result[key]), index)
+            value, text = stream.ReadValueAndText()
+            self.assertEquals(value, json.loads(text))
+            result[key].append(value)
+        elif key == 'empty_dict':
+          result[key] = {}
+          for _ in stream.IterObjectKeys():
+            self.fail()
+        else:
+          result[key] = stream.ReadValue()
+      self.assertEquals(self._DOCUMENT, result)
+      self.assertEquals('', stream.Peek())
+
+  def testInvalid(self):
+    def ReadAll(text):
+      stream = json_stream.JsonStream(StringIO.StringIO(text))
+      for _ in stream.IterArrayItems():
+        stream.ReadValue()
+    ReadAll('[1, [2], {"3": 4}]')
+    for text in ('[1, 2', '[1 2]', '[1, {"a": }]', '{}'):
+      with self.assertRaises(ValueError):
+        ReadAll(text)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -12,6 +12,7 @@ except ImportError:
 import time
 
 import devtools_monitor
+import json_stream
 import page_track
 import request_track
 import tracing_track
@@ -40,7 +41,6 @@ class LoadingTrace(object):
     self.page_track = page
     self.request_track = request
     self._tracing_track = track
-    self._tracing_json_str = None
 
   def ToJsonDict(self):
     """Returns a dictionary representing this instance."""
@@ -63,19 +63,39 @@ class LoadingTrace(object):
     keys = (cls._URL_KEY, cls._METADATA_KEY, cls._PAGE_KEY, cls._REQUEST_KEY,
             cls._TRACING_KEY)
     assert all(key in json_dict for key in keys)
+    track = tracing_track.TracingTrack.FromJsonDict(
+        json_dict[cls._TRACING_KEY])
+    return cls._FromJsonDictAndTrack(json_dict, track)
+
+  @classmethod
+  def _FromJsonDictAndTrack(cls, json_dict, track):
     page = page_track.PageTrack.FromJsonDict(json_dict[cls._PAGE_KEY])
     request = request_track.RequestTrack.FromJsonDict(
         json_dict[cls._REQUEST_KEY])
-    track = tracing_track.TracingTrack.FromJsonDict(
-        json_dict[cls._TRACING_KEY])
     return LoadingTrace(json_dict[cls._URL_KEY], json_dict[cls._METADATA_KEY],
                         page, request, track)
 
   @classmethod
   def FromJsonFile(cls, json_path):
-    """Returns an instance from a json file saved by ToJsonFile()."""
+    """Returns an instance from a json file saved by ToJsonFile().
+
+    The tracing track is decoded incrementally, and its events are kept in a
+    compact form (see TracingTrack.FromJsonStream()).
+    """
+    json_dict = {}
+    track = None
     with open(json_path) as input_file:
-      return cls.FromJsonDict(json.load(input_file))
+      stream = json_stream.JsonStream(input_file)
+      for key in stream.IterObjectKeys():
+        if key == cls._TRACING_KEY:
+          track = tracing_track.TracingTrack.FromJsonStream(stream)
+          json_dict[key] = None
+        else:
+          json_dict[key] = stream.ReadValue()
+    keys = (cls._URL_KEY, cls._METADATA_KEY, cls._PAGE_KEY, cls._REQUEST_KEY,
+            cls._TRACING_KEY)
+    assert all(key in json_dict for key in keys)
+    return cls._FromJsonDictAndTrack(json_dict, track)
 
   @classmethod
   def RecordUrlNavigation(
@@ -112,21 +132,13 @@ class LoadingTrace(object):
 
   @property
   def tracing_track(self):
-    if not self._tracing_track:
-      self._RestoreTracingTrack()
     return self._tracing_track
 
   def Slim(self):
     """Slims the memory usage of a trace by dropping the TraceEvents from it.
 
-    The tracing track is restored on-demand when accessed.
+    The events are kept in a compact form, and are restored on-demand when
+    accessed.
     """
-    self._tracing_json_str = json.dumps(self._tracing_track.ToJsonDict())
-    self._tracing_track = None
-
-  def _RestoreTracingTrack(self):
-    if not self._tracing_json_str:
-      return None
-    self._tracing_track = tracing_track.TracingTrack.FromJsonDict(
-        json.loads(self._tracing_json_str))
-    self._tracing_json_str = None
+    if self._tracing_track:
+      self._tracing_track.Slim()
@@ -151,8 +151,7 @@ class PrefetchSimulationView(object):
         lambda e:  e.args.get('step') == 'Preload',
         resource_events.GetEvents())
     preloaded_urls = set()
-    for preload_step_event in preload_step_events:
-      preload_event = resource_events.EventFromStep(preload_step_event)
+    for preload_event in resource_events.EventsFromSteps(preload_step_events):
       if preload_event:
         preloaded_urls.add(preload_event.args['data']['url'])
     parser_requests = cls.ParserDiscoverableRequests(
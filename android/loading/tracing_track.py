@@ -4,7 +4,14 @@
 
 """Monitor tracing events on chrome via chrome remote debugging."""
 
+import array
+import bisect
+import heapq
 import itertools
+try:
+  import ujson as json
+except ImportError:
+  import json
 import logging
 import operator
 
@@ -48,6 +55,8 @@ class TracingTrack(devtools_monitor.Track):
     self._main_frame_id = None
 
   def Handle(self, method, event):
+    if isinstance(self._events, _CompactEvents):
+      self._events = list(self._events)
     for e in event['params']['value']:
       event = Event(e)
       self._events.append(event)
@@ -70,11 +79,16 @@ class TracingTrack(devtools_monitor.Track):
     return self._base_msec
 
   def GetEvents(self):
-    """Returns a list of tracing.Event. Not sorted."""
+    """Returns a list of tracing.Event. Not sorted.
+
+    For tracks loaded by FromJsonStream(), this is a read-only sequence.
+    """
     return self._events
 
   def GetMatchingEvents(self, category, name):
     """Gets events matching |category| and |name|."""
+    if isinstance(self._events, _CompactEvents):
+      return self._events.MatchingEvents(category, name)
     return [e for e in self.GetEvents() if e.Matches(category, name)]
 
   def GetMatchingMainFrameEvents(self, category, name):
@@ -123,6 +137,21 @@ class TracingTrack(devtools_monitor.Track):
     self._IndexEvents()
     return self._interval_tree.EventsAt(msec)
 
+  def EventsAtTimestamps(self, msecs):
+    """Gets events active at each of several timestamps.
+
+    Equivalent to [self.EventsAt(msec) for msec in msecs], but faster for
+    many timestamps.
+
+    Args:
+      msecs: list of tracing milliseconds to query.
+
+    Returns:
+      A list containing one list of events per timestamp.
+    """
+    self._IndexEvents()
+    return self._interval_tree.EventsAtTimestamps(msecs)
+
   def Filter(self, pid=None, tid=None, categories=None):
     """Returns a new TracingTrack with a subset of the events.
 
@@ -133,11 +162,14 @@ class TracingTrack(devtools_monitor.Track):
                   categories.
     """
     events = self._events
+    if isinstance(events, _CompactEvents):
+      events = events.Filter(pid, tid, categories)
+      pid = tid = None
     if pid is not None:
       events = filter(lambda e : e.tracing_event['pid'] == pid, events)
     if tid is not None:
       events = filter(lambda e : e.tracing_event['tid'] == tid, events)
-    if categories is not None:
+    if categories is not None and not isinstance(events, _CompactEvents):
       events = filter(
           lambda e : set(e.category.split(',')).intersection(categories),
           events)
@@ -149,8 +181,11 @@ class TracingTrack(devtools_monitor.Track):
     return tracing_track
 
   def ToJsonDict(self):
-    return {'categories': list(self._categories),
-            'events': [e.ToJsonDict() for e in self._events]}
+    if isinstance(self._events, _CompactEvents):
+      events = self._events.ToJsonDicts()
+    else:
+      events = [e.ToJsonDict() for e in self._events]
+    return {'categories': list(self._categories), 'events': events}
 
   @classmethod
   def FromJsonDict(cls, json_dict):
@@ -161,16 +196,70 @@ class TracingTrack(devtools_monitor.Track):
     tracing_track = TracingTrack(None, clovis_constants.DEFAULT_CATEGORIES)
     tracing_track._categories = set(json_dict.get('categories', []))
     tracing_track._events = events
-    tracing_track._base_msec = events[0].start_msec if events else 0
-    for e in events[1:]:
-      if e.type == 'M':
-        continue  # No timestamp for metadata events.
-      assert e.start_msec > 0
-      if e.start_msec < tracing_track._base_msec:
-        tracing_track._base_msec = e.start_msec
+    tracing_track._base_msec = cls._BaseMsec(
+        (e.start_msec, e.type) for e in events)
     return tracing_track
 
+  @classmethod
+  def FromJsonStream(cls, stream):
+    """Like FromJsonDict(), but reads from a json_stream.JsonStream.
+
+    Events are stored compactly, and are only decoded into Event objects when
+    accessed.
+    """
+    if stream.Peek() != '{':
+      return cls.FromJsonDict(stream.ReadValue())
+    categories = []
+    events = _CompactEvents()
+    has_events = False
+    for key in stream.IterObjectKeys():
+      if key == 'events':
+        has_events = True
+        for _ in stream.IterArrayItems():
+          events.Append(*stream.ReadValueAndText())
+      elif key == 'categories':
+        categories = stream.ReadValue()
+      else:
+        stream.ReadValue()
+    assert has_events
+    tracing_track = TracingTrack(None, clovis_constants.DEFAULT_CATEGORIES)
+    tracing_track._categories = set(categories)
+    tracing_track._events = events
+    tracing_track._base_msec = cls._BaseMsec(events.StartMsecsAndTypes())
+    return tracing_track
+
+  @classmethod
+  def _BaseMsec(cls, start_msecs_and_types):
+    base_msec = None
+    for start_msec, event_type in start_msecs_and_types:
+      if base_msec is None:
+        base_msec = start_msec
+        continue
+      if event_type == 'M':
+        continue  # No timestamp for metadata events.
+      assert start_msec > 0
+      if start_msec < base_msec:
+        base_msec = start_msec
+    return base_msec or 0
+
+  def Slim(self):
+    """Reduces memory usage by dropping Event objects.
+
+    Events are kept in compact form, and Event objects are created again when
+    accessed.
+    """
+    if isinstance(self._events, _CompactEvents):
+      self._events.ReleaseEvents()
+    else:
+      self._events = _CompactEvents.FromEvents(self._events)
+    self._interval_tree = None
+
   def OverlappingEvents(self, start_msec, end_msec):
+    """Gets the list of events overlapping with [start_msec, end_msec).
+
+    Instant events are included if they are within the range. Events are sorted
+    by start time.
+    """
     self._IndexEvents()
     return self._interval_tree.OverlappingEvents(start_msec, end_msec)
 
@@ -200,6 +289,31 @@ class TracingTrack(devtools_monitor.Track):
     self._IndexEvents()
     assert 'step' in step_event.args and step_event.tracing_event['ph'] == 'T'
     candidates = self._interval_tree.EventsAt(step_event.start_msec)
+    return self._EventMatchingStep(step_event, candidates)
+
+  def EventsFromSteps(self, step_events):
+    """Returns the Event associated with each of several step events.
+
+    Equivalent to [self.EventFromStep(e) for e in step_events], but faster for
+    many step events.
+
+    Args:
+      step_events: ([Event]) Step events.
+
+    Returns:
+      A list containing an Event or None per step event.
+    """
+    self._IndexEvents()
+    for step_event in step_events:
+      assert ('step' in step_event.args
+              and step_event.tracing_event['ph'] == 'T')
+    candidates_per_step = self._interval_tree.EventsAtTimestamps(
+        [step_event.start_msec for step_event in step_events])
+    return [self._EventMatchingStep(step_event, candidates)
+            for step_event, candidates in zip(step_events, candidates_per_step)]
+
+  @classmethod
+  def _EventMatchingStep(cls, step_event, candidates):
     for event in candidates:
       # IDs are only unique within a process (often they are pointers).
       if (event.pid == step_event.pid and event.tracing_event['ph'] != 'T'
@@ -492,26 +606,165 @@ class Event(object):
     return Event(json_dict)
 
 
+class _CompactEvents(object):
+  """A read-only sequence of Events, stored compactly.
+
+  Each event is stored as its JSON text, alongside the fields used to select
+  events. Field values are interned, since most are repeated many times. Event
+  objects are created when first accessed.
+  """
+  def __init__(self):
+    self._texts = []
+    self._start_msecs = array.array('d')
+    self._types = []
+    self._names = []
+    self._categories = []
+    self._pids = []
+    self._tids = []
+    self._events = []
+    self._interned = {}
+    self._split_categories = {}
+
+  @classmethod
+  def FromEvents(cls, events):
+    """Returns an instance holding the (serialized) |events|."""
+    ret = cls()
+    for event in events:
+      ret.Append(event.tracing_event)
+    return ret
+
+  def Append(self, tracing_event, text=None):
+    """Adds an event.
+
+    Args:
+      tracing_event: JSON tracing event, as defined in https://goo.gl/Qabkqk.
+      text: The JSON text of |tracing_event|, if available.
+    """
+    if tracing_event['ph'] in ['s', 't', 'f']:
+      raise devtools_monitor.DevToolsConnectionException(
+          'Unsupported event: %s' % tracing_event)
+    intern_value = self._interned.setdefault
+    self._texts.append(text or json.dumps(tracing_event))
+    self._start_msecs.append(tracing_event['ts'] / 1000.0)
+    self._types.append(intern_value(tracing_event['ph'], tracing_event['ph']))
+    name = tracing_event.get('name')
+    self._names.append(intern_value(name, name))
+    category = tracing_event.get('cat')
+    self._categories.append(intern_value(category, category))
+    pid = tracing_event.get('pid')
+    self._pids.append(intern_value(pid, pid))
+    tid = tracing_event.get('tid')
+    self._tids.append(intern_value(tid, tid))
+    self._events.append(None)
+
+  def __len__(self):
+    return len(self._texts)
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return [self[i] for i in xrange(*index.indices(len(self)))]
+    event = self._events[index]
+    if event is None:
+      event = Event(json.loads(self._texts[index]))
+      self._events[index] = event
+    return event
+
+  def __iter__(self):
+    for i in xrange(len(self._texts)):
+      yield self[i]
+
+  def ReleaseEvents(self):
+    """Drops references to Event objects created so far."""
+    self._events = [None] * len(self._texts)
+
+  def StartMsecsAndTypes(self):
+    return itertools.izip(self._start_msecs, self._types)
+
+  def ToJsonDicts(self):
+    return [e.ToJsonDict() if e is not None else json.loads(text)
+            for e, text in itertools.izip(self._events, self._texts)]
+
+  def _SplitCategories(self, category):
+    ret = self._split_categories.get(category)
+    if ret is None:
+      ret = frozenset(category.split(',')) if category else frozenset()
+      self._split_categories[category] = ret
+    return ret
+
+  def MatchingEvents(self, category, name):
+    """Returns the events matching |category| and |name| (see Event.Matches).
+    """
+    return [self[i] for i, event_name in enumerate(self._names)
+            if event_name == name
+            and category in self._SplitCategories(self._categories[i])]
+
+  def Filter(self, pid, tid, categories):
+    """Returns a _CompactEvents with a subset of events.
+
+    Args:
+      pid, tid, categories: As in TracingTrack.Filter().
+    """
+    indices = xrange(len(self._texts))
+    if pid is not None:
+      indices = [i for i in indices if self._pids[i] == pid]
+    if tid is not None:
+      indices = [i for i in indices if self._tids[i] == tid]
+    if categories is not None:
+      indices = [i for i in indices if not self._SplitCategories(
+          self._categories[i]).isdisjoint(categories)]
+    ret = _CompactEvents()
+    ret._interned = self._interned
+    ret._split_categories = self._split_categories
+    for i in indices:
+      ret._texts.append(self._texts[i])
+      ret._start_msecs.append(self._start_msecs[i])
+      ret._types.append(self._types[i])
+      ret._names.append(self._names[i])
+      ret._categories.append(self._categories[i])
+      ret._pids.append(self._pids[i])
+      ret._tids.append(self._tids[i])
+      # Events that were already created are shared, as with a list.
+      ret._events.append(self._events[i])
+    return ret
+
+
 class _IntervalTree(object):
-  """Simple interval tree. This is not an optimal one, as the split is done with
-  an equal number of events on each side, according to start time.
+  """Index of events by time interval.
+
+  Events are sorted by start time, and split into blocks of _TRESHOLD
+  consecutive events. An implicit binary tree over the blocks records the
+  maximum end time within each subtree, so that subtrees containing only events
+  that end before a timestamp are skipped. Stabbing and overlap queries take
+  O(log(n) + k) for k results.
   """
   _TRESHOLD = 100
-  def __init__(self, start, end, events):
+  def __init__(self, events):
     """Builds an interval tree.
 
     Args:
-      start: start timestamp of this node, in ms.
-      end: end timestamp covered by this node, in ms.
-      events: Iterable of objects having start_msec and end_msec fields. Has to
-              be sorted by start_msec.
+      events: List of objects having start_msec and end_msec fields. Has to be
+              sorted by start_msec.
     """
-    self.start = start
-    self.end = end
     self._events = events
-    self._left = self._right = None
-    if len(self._events) > self._TRESHOLD:
-      self._Divide()
+    self._starts = [e.start_msec for e in events]
+    self._ends = [e.end_msec for e in events]
+    self.start = self._starts[0] if events else None
+    self.end = max(self._ends) if events else None
+    self._block_size = self._TRESHOLD
+    num_blocks = max(1, (len(events) + self._block_size - 1) / self._block_size)
+    self._num_leaves = 1
+    while self._num_leaves < num_blocks:
+      self._num_leaves *= 2
+    # Node i has children 2i and 2i + 1. Leaves start at _num_leaves.
+    self._max_ends = [float('-inf')] * (2 * self._num_leaves)
+    for block in xrange(num_blocks):
+      block_ends = self._ends[block * self._block_size:
+                              (block + 1) * self._block_size]
+      if block_ends:
+        self._max_ends[self._num_leaves + block] = max(block_ends)
+    for node in xrange(self._num_leaves - 1, 0, -1):
+      self._max_ends[node] = max(self._max_ends[2 * node],
+                                 self._max_ends[2 * node + 1])
 
   @classmethod
   def FromEvents(cls, events):
@@ -519,53 +772,91 @@ class _IntervalTree(object):
     filtered_events = [e for e in events
                        if e.start_msec is not None and e.end_msec is not None]
     filtered_events.sort(key=operator.attrgetter('start_msec'))
-    start = min(event.start_msec for event in filtered_events)
-    end = max(event.end_msec for event in filtered_events)
-    return _IntervalTree(start, end, filtered_events)
+    return _IntervalTree(filtered_events)
+
+  def _IndicesEndingAfter(self, count, timestamp):
+    """Returns the sorted indices i < |count| such that ends[i] > timestamp."""
+    max_ends = self._max_ends
+    if count <= 0 or max_ends[1] <= timestamp:
+      return []
+    ends = self._ends
+    block_size = self._block_size
+    num_leaves = self._num_leaves
+    last_block = (count - 1) / block_size
+    result = []
+    # Depth-first, left child first so that indices come out sorted.
+    stack = [(1, 0, num_leaves - 1)]
+    while stack:
+      node, first_block, last_node_block = stack.pop()
+      if first_block > last_block or max_ends[node] <= timestamp:
+        continue
+      if node >= num_leaves:
+        for i in xrange(first_block * block_size,
+                        min(count, (first_block + 1) * block_size)):
+          if ends[i] > timestamp:
+            result.append(i)
+      else:
+        middle = (first_block + last_node_block) / 2
+        stack.append((2 * node + 1, middle + 1, last_node_block))
+        stack.append((2 * node, first_block, middle))
+    return result
 
   def OverlappingEvents(self, start, end):
-    """Returns a set of events overlapping with [start, end)."""
-    if min(end, self.end) - max(start, self.start) <= 0:
-      return set()
-    elif self._IsLeaf():
-      result = set()
-      for event in self._events:
-        if self._Overlaps(event, start, end):
-          result.add(event)
-      return result
-    else:
-      return (self._left.OverlappingEvents(start, end)
-              | self._right.OverlappingEvents(start, end))
+    """Returns a list of events overlapping with [start, end).
+
+    Instant events are included when they are within [start, end). Events are
+    sorted by start time.
+    """
+    if end <= start:
+      return []
+    events = self._events
+    # Events starting before |start| overlap iff they end after it, and events
+    # starting within [start, end) always overlap.
+    first_inside = bisect.bisect_left(self._starts, start)
+    first_after = bisect.bisect_left(self._starts, end, first_inside)
+    result = [events[i]
+              for i in self._IndicesEndingAfter(first_inside, start)]
+    result.extend(events[first_inside:first_after])
+    return result
 
   def EventsAt(self, timestamp):
-    result = set()
-    if self._IsLeaf():
-      for event in self._events:
-        if event.start_msec <= timestamp < event.end_msec:
-          result.add(event)
-    else:
-      if self._left.start <= timestamp < self._left.end:
-        result |= self._left.EventsAt(timestamp)
-      if self._right.start <= timestamp < self._right.end:
-        result |= self._right.EventsAt(timestamp)
+    """Returns a list of events such that start_msec <= timestamp < end_msec.
+
+    Events are sorted by start time.
+    """
+    count = bisect.bisect_right(self._starts, timestamp)
+    events = self._events
+    return [events[i] for i in self._IndicesEndingAfter(count, timestamp)]
+
+  def EventsAtTimestamps(self, timestamps):
+    """Runs EventsAt() for each of |timestamps|.
+
+    Sweeps over events and timestamps in time order, which is faster than
+    separate queries when there are many timestamps.
+
+    Returns:
+      A list with one list of events per timestamp, in the same order.
+    """
+    events = self._events
+    starts = self._starts
+    ends = self._ends
+    result = [None] * len(timestamps)
+    # Heap of (end, index) for events that have started.
+    active = []
+    next_index = 0
+    for position in sorted(xrange(len(timestamps)),
+                           key=timestamps.__getitem__):
+      timestamp = timestamps[position]
+      while next_index < len(events) and starts[next_index] <= timestamp:
+        heapq.heappush(active, (ends[next_index], next_index))
+        next_index += 1
+      while active and active[0][0] <= timestamp:
+        heapq.heappop(active)
+      result[position] = [events[i] for i in sorted(i for _, i in active)]
     return result
 
   def GetEvents(self):
     return self._events
 
-  def _Divide(self):
-    middle = len(self._events) / 2
-    left_events = self._events[:middle]
-    right_events = self._events[middle:]
-    left_end = max(e.end_msec for e in left_events)
-    right_start = min(e.start_msec for e in right_events)
-    self._left = _IntervalTree(self.start, left_end, left_events)
-    self._right = _IntervalTree(right_start, self.end, right_events)
-
   def _IsLeaf(self):
-    return self._left is None
-
-  @classmethod
-  def _Overlaps(cls, event, start, end):
-    return (min(end, event.end_msec) - max(start, event.start_msec) > 0
-            or start <= event.start_msec < end)  # For instant events.
+    return self._num_leaves == 1
@@ -4,11 +4,15 @@
 
 import collections
 import copy
+import json
 import logging
 import operator
+import random
+import StringIO
 import unittest
 
 import devtools_monitor
+import json_stream
 
 from tracing_track import (Event, TracingTrack, _IntervalTree)
 
@@ -223,6 +227,46 @@ class TracingTrackTestCase(unittest.TestCase):
     for (e1, e2) in zip(self.track._events, deserialized_track._events):
       self.assertEquals(e1.tracing_event, e2.tracing_event)
 
+  def testTracingTrackStreamSerialization(self):
+    self._HandleEvents(self._EVENTS)
+    streamed_track = self._StreamTrack(self.track)
+    self.assertEquals(self.track.GetFirstEventMillis(),
+                      streamed_track.GetFirstEventMillis())
+    self.assertEquals(self.track.ToJsonDict(), streamed_track.ToJsonDict())
+    self.assertEquals(
+        [e.tracing_event for e in self.track.GetEvents()],
+        [e.tracing_event for e in streamed_track.GetEvents()])
+    # Events are created only once.
+    self.assertIs(streamed_track.GetEvents()[0], streamed_track.GetEvents()[0])
+    # Slices create the events they contain.
+    events = self._StreamTrack(self.track).GetEvents()
+    self.assertEquals(
+        [e.tracing_event for e in self.track.GetEvents()[1:-1]],
+        [e.tracing_event for e in events[1:-1]])
+    self.assertEquals([events[2], events[0]], events[2::-2])
+    self.assertEquals(4, len(streamed_track.Filter(2, 1).GetEvents()))
+    self.assertEquals(0, len(streamed_track.Filter(2, 42).GetEvents()))
+    for msec in xrange(16):
+      self.assertEqual(
+          set(e.args['name'] for e in self.track.EventsAt(msec)),
+          set(e.args['name'] for e in streamed_track.EventsAt(msec)))
+
+  def testSlim(self):
+    self._HandleEvents(self._EVENTS)
+    json_dict = self.track.ToJsonDict()
+    expected_names = set(e.args['name'] for e in self.track.EventsAt(12))
+    self.assertTrue(expected_names)
+    for track in (self.track, self._StreamTrack(self.track)):
+      track.Slim()
+      self.assertEquals(json_dict, track.ToJsonDict())
+      self.assertEqual(
+          expected_names, set(e.args['name'] for e in track.EventsAt(12)))
+      event = track.GetEvents()[0]
+      track.Slim()
+      self.assertIsNot(event, track.GetEvents()[0])
+      self.assertEquals(event.tracing_event,
+                        track.GetEvents()[0].tracing_event)
+
   def testEventsEndingBetween(self):
     self._HandleEvents(self._EVENTS)
     self.assertEqual(set('ABCDEF'),
@@ -286,6 +330,12 @@ class TracingTrackTestCase(unittest.TestCase):
       self.track.EventFromStep(wrong_phase)
     with self.assertRaises(AssertionError):
       self.track.EventFromStep(no_step)
+    valid_step_events = [step_event, outside, wrong_pid, wrong_id, wrong_name]
+    self.assertEquals([self.track.EventFromStep(e) for e in valid_step_events],
+                      self.track.EventsFromSteps(valid_step_events))
+    self.assertEquals([], self.track.EventsFromSteps([]))
+    with self.assertRaises(AssertionError):
+      self.track.EventsFromSteps([step_event, no_step])
 
   def testFilterPidTid(self):
     self._HandleEvents(self._EVENTS)
@@ -360,6 +410,31 @@ class TracingTrackTestCase(unittest.TestCase):
     self.assertSetEqual(
         set('A'), self.track.Filter(categories=set('A')).Categories())
 
+  def testStreamedGetMatchingEventsAndFilterCategories(self):
+    events = [
+        {'ts': 5, 'ph': 'X', 'dur': 10, 'pid': 2, 'tid': 1, 'cat': 'A',
+         'name': 'foo'},
+        {'ts': 5, 'ph': 'X', 'dur': 10, 'pid': 2, 'tid': 1, 'cat': 'B',
+         'name': 'foo'},
+        {'ts': 5, 'ph': 'X', 'dur': 10, 'pid': 2, 'tid': 1, 'cat': 'C,D',
+         'name': 'bar'},
+        {'ts': 5, 'ph': 'X', 'dur': 10, 'pid': 2, 'tid': 1, 'cat': 'A,B,C,D',
+         'name': 'foo'}]
+    self._HandleEvents(events)
+    track = self._StreamTrack(self.track)
+    tracing_events = list(track.GetEvents())
+    self.assertListEqual([tracing_events[0], tracing_events[3]],
+                         track.GetMatchingEvents('A', 'foo'))
+    self.assertListEqual([], track.GetMatchingEvents('A', 'bar'))
+    filtered_events = track.Filter(categories=set(['A'])).GetEvents()
+    self.assertListEqual([tracing_events[0], tracing_events[3]],
+                         list(filtered_events))
+    filtered_events = track.Filter(categories=set(['B', 'C'])).GetEvents()
+    self.assertListEqual(tracing_events[1:], list(filtered_events))
+    self.assertEquals(0, len(track.Filter(categories=set(['Z'])).GetEvents()))
+    self.assertSetEqual(
+        set('A'), track.Filter(categories=set('A')).Categories())
+
   def testHasLoadingSucceeded(self):
     cat = 'navigation'
     on_navigate = 'RenderFrameImpl::OnNavigate'
@@ -405,6 +480,10 @@ class TracingTrackTestCase(unittest.TestCase):
             'ts': 5, 'ph': 'X', 'dur': 10, 'pid': 1, 'tid': 1}]})
     self.assertFalse(track.HasLoadingSucceeded())
 
+  def _StreamTrack(self, track):
+    json_file = StringIO.StringIO(json.dumps(track.ToJsonDict()))
+    return TracingTrack.FromJsonStream(json_stream.JsonStream(json_file))
+
   def _HandleEvents(self, events):
     self.track.Handle('Tracing.dataCollected', {'params': {'value': [
         self.EventToMicroseconds(e) for e in events]}})
@@ -471,6 +550,42 @@ class IntervalTreeTestCase(unittest.TestCase):
     self.assertEquals(3 + 10, len(tree.OverlappingEvents(450, 550)))
     self.assertEquals(8 + 10, len(tree.OverlappingEvents(450, 800)))
 
+  def testEventsAtTimestamps(self):
+    events = ([self.FakeEvent(100 * i, 100 * (i + 1))
+               for i in range(self._COUNT)]
+              + [self.FakeEvent(100 * i + 50, 100 * i + 150)
+                 for i in range(self._COUNT)]
+              + [self.FakeEvent(100 * i + 75, 100 * i + 75)
+                 for i in range(self._COUNT)]
+              + [self.FakeEvent(0, 100 * self._COUNT)])
+    tree = _IntervalTree.FromEvents(events)
+    timestamps = [100 * i + 75 for i in range(self._COUNT)]
+    timestamps += [50 * i for i in range(2 * self._COUNT + 2)]
+    timestamps.reverse()
+    batched = tree.EventsAtTimestamps(timestamps)
+    self.assertEquals(len(timestamps), len(batched))
+    for timestamp, events_at in zip(timestamps, batched):
+      self.assertEquals(tree.EventsAt(timestamp), events_at)
+
+  def testMatchesLinearScan(self):
+    random.seed(0)
+    events = []
+    for _ in range(self._COUNT):
+      start = random.randint(0, 1000)
+      events.append(self.FakeEvent(start, start + random.randint(0, 50)))
+    tree = _IntervalTree.FromEvents(events)
+    for _ in range(200):
+      start = random.randint(-10, 1060)
+      end = start + random.randint(0, 30)
+      self.assertEquals(
+          set(e for e in events
+              if min(end, e.end_msec) - max(start, e.start_msec) > 0
+              or start <= e.start_msec < end),
+          set(tree.OverlappingEvents(start, end)))
+      self.assertEquals(
+          set(e for e in events if e.start_msec <= start < e.end_msec),
+          set(tree.EventsAt(start)))
+
   def testEventMatches(self):
     event = Event({'name': 'foo',
                    'cat': 'bar',
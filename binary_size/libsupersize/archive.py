@@ -5,20 +5,26 @@
 """Main Python API for analyzing binary size."""
 
 import argparse
+import array
 import calendar
 import collections
+import contextlib
 import datetime
 import gzip
+import itertools
 import logging
+import multiprocessing
 import os
 import posixpath
 import re
 import subprocess
 import sys
 import tempfile
+import time
 import zipfile
 
 import concurrent
+import demangle
 import describe
 import file_format
 import function_signature
@@ -29,6 +35,29 @@ import nm
 import paths
 
 
+# Fewer symbols than this are not worth forking a process to normalize.
+_MIN_SYMBOLS_PER_NORMALIZE_JOB = 20000
+
+
+class _StageTimer(object):
+  """Records how long each stage of creating a SizeInfo takes."""
+
+  def __init__(self):
+    self._timings = []
+
+  @contextlib.contextmanager
+  def Stage(self, desc):
+    logging.info(desc)
+    start_time = time.time()
+    yield
+    self._timings.append((desc, time.time() - start_time))
+
+  def LogTimings(self):
+    logging.info('Stage timings:')
+    for desc, elapsed in self._timings:
+      logging.info('  %6.2fs  %s', elapsed, desc)
+
+
 def _OpenMaybeGz(path, mode=None):
   """Calls `gzip.open()` if |path| ends in ".gz", otherwise calls `open()`."""
   if path.endswith('.gz'):
@@ -59,98 +88,153 @@ def _StripLinkerAddedSymbolPrefixes(raw_symbols):
       symbol.full_name = full_name[4:]
 
 
-def _UnmangleRemainingSymbols(raw_symbols, tool_prefix):
+def _UnmangleRemainingSymbols(raw_symbols, tool_prefix, demangle_cache_dir):
   """Uses c++filt to unmangle any symbols that need it."""
   to_process = [s for s in raw_symbols if s.full_name.startswith('_Z')]
   if not to_process:
     return
 
   logging.info('Unmangling %d names', len(to_process))
-  proc = subprocess.Popen([tool_prefix + 'c++filt'], stdin=subprocess.PIPE,
-                          stdout=subprocess.PIPE)
-  stdout = proc.communicate('\n'.join(s.full_name for s in to_process))[0]
-  assert proc.returncode == 0
+  with demangle.Demangler(tool_prefix + 'c++filt',
+                          cache_dir=demangle_cache_dir) as demangler:
+    names = demangler.Demangle([s.full_name for s in to_process])
+  for symbol, name in itertools.izip(to_process, names):
+    symbol.full_name = name
 
-  for i, line in enumerate(stdout.splitlines()):
-    to_process[i].full_name = line
 
-
-def _NormalizeNames(raw_symbols):
-  """Ensures that all names are formatted in a useful way.
+def _NormalizeName(full_name, section, flags, found_prefixes):
+  """Returns (full_name, template_name, name, flags) for the given symbol.
 
   This includes:
     - Deriving |name| and |template_name| from |full_name|.
     - Stripping of return types (for functions).
     - Moving "vtable for" and the like to be suffixes rather than prefixes.
   """
+  if full_name.startswith('*'):
+    # See comment in _CalculatePadding() about when this
+    # can happen.
+    return full_name, full_name, full_name, flags
+
+  # Remove [clone] suffix, and set flag accordingly.
+  # Search from left-to-right, as multiple [clone]s can exist.
+  # Example name suffixes:
+  #     [clone .part.322]  # GCC
+  #     [clone .isra.322]  # GCC
+  #     [clone .constprop.1064]  # GCC
+  #     [clone .11064]  # clang
+  # http://unix.stackexchange.com/questions/223013/function-symbol-gets-part-suffix-after-compilation
+  idx = full_name.find(' [clone ')
+  if idx != -1:
+    full_name = full_name[:idx]
+    flags |= models.FLAG_CLONE
+
+  # Clones for C symbols.
+  if section == 't':
+    idx = full_name.rfind('.')
+    if idx != -1 and full_name[idx + 1:].isdigit():
+      new_name = full_name[:idx]
+      # Generated symbols that end with .123 but are not clones.
+      # Find these via:
+      #   size_info.symbols.WhereInSection('t').WhereIsGroup().SortedByCount()
+      if new_name not in ('__tcf_0', 'startup'):
+        full_name = new_name
+        flags |= models.FLAG_CLONE
+        # Remove .part / .isra / .constprop.
+        idx = full_name.rfind('.', 0, idx)
+        if idx != -1:
+          full_name = full_name[:idx]
+
+  # E.g.: vtable for FOO
+  idx = full_name.find(' for ', 0, 30)
+  if idx != -1:
+    found_prefixes.add(full_name[:idx + 4])
+    full_name = '{} [{}]'.format(full_name[idx + 5:], full_name[:idx])
+
+  # E.g.: virtual thunk to FOO
+  idx = full_name.find(' to ', 0, 30)
+  if idx != -1:
+    found_prefixes.add(full_name[:idx + 3])
+    full_name = '{} [{}]'.format(full_name[idx + 4:], full_name[:idx])
+
+  # Strip out return type, and split out name, template_name.
+  # Function parsing also applies to non-text symbols. E.g. Function statics.
+  full_name, template_name, name = function_signature.Parse(full_name)
+
+  # Remove anonymous namespaces (they just harm clustering).
+  template_name = template_name.replace('(anonymous namespace)::', '')
+  full_name = full_name.replace('(anonymous namespace)::', '')
+  non_anonymous_name = name.replace('(anonymous namespace)::', '')
+  if name != non_anonymous_name:
+    flags |= models.FLAG_ANONYMOUS
+    name = non_anonymous_name
+  return full_name, template_name, name, flags
+
+
+def _NormalizeNamesJob(raw_symbols, start, end):
+  """Normalizes names of raw_symbols[start:end].
+
+  Runs in a forked process, so returns results encoded as strings (pickling
+  many small objects is slow).
+  """
   found_prefixes = set()
-  for symbol in raw_symbols:
-    full_name = symbol.full_name
-    if full_name.startswith('*'):
-      # See comment in _CalculatePadding() about when this
-      # can happen.
-      symbol.template_name = full_name
-      symbol.name = full_name
-      continue
+  full_names = []
+  template_names = []
+  names = []
+  flags = array.array('i')
+  for symbol in itertools.islice(raw_symbols, start, end):
+    parts = _NormalizeName(symbol.full_name, symbol.section, symbol.flags,
+                           found_prefixes)
+    full_names.append(parts[0])
+    template_names.append(parts[1])
+    names.append(parts[2])
+    flags.append(parts[3])
+  return (start, '\x01'.join(full_names), '\x01'.join(template_names),
+          '\x01'.join(names), flags.tostring(), '\x01'.join(found_prefixes))
+
+
+def _NormalizeNames(raw_symbols, string_cache=None):
+  """Ensures that all names are formatted in a useful way.
+
+  See _NormalizeName() for details. Large lists of symbols are processed by
+  multiple forked processes.
 
-    # Remove [clone] suffix, and set flag accordingly.
-    # Search from left-to-right, as multiple [clone]s can exist.
-    # Example name suffixes:
-    #     [clone .part.322]  # GCC
-    #     [clone .isra.322]  # GCC
-    #     [clone .constprop.1064]  # GCC
-    #     [clone .11064]  # clang
-    # http://unix.stackexchange.com/questions/223013/function-symbol-gets-part-suffix-after-compilation
-    idx = full_name.find(' [clone ')
-    if idx != -1:
-      full_name = full_name[:idx]
-      symbol.flags |= models.FLAG_CLONE
-
-    # Clones for C symbols.
-    if symbol.section == 't':
-      idx = full_name.rfind('.')
-      if idx != -1 and full_name[idx + 1:].isdigit():
-        new_name = full_name[:idx]
-        # Generated symbols that end with .123 but are not clones.
-        # Find these via:
-        #   size_info.symbols.WhereInSection('t').WhereIsGroup().SortedByCount()
-        if new_name not in ('__tcf_0', 'startup'):
-          full_name = new_name
-          symbol.flags |= models.FLAG_CLONE
-          # Remove .part / .isra / .constprop.
-          idx = full_name.rfind('.', 0, idx)
-          if idx != -1:
-            full_name = full_name[:idx]
-
-    # E.g.: vtable for FOO
-    idx = full_name.find(' for ', 0, 30)
-    if idx != -1:
-      found_prefixes.add(full_name[:idx + 4])
-      full_name = '{} [{}]'.format(full_name[idx + 5:], full_name[:idx])
-
-    # E.g.: virtual thunk to FOO
-    idx = full_name.find(' to ', 0, 30)
-    if idx != -1:
-      found_prefixes.add(full_name[:idx + 3])
-      full_name = '{} [{}]'.format(full_name[idx + 4:], full_name[:idx])
-
-    # Strip out return type, and split out name, template_name.
-    # Function parsing also applies to non-text symbols. E.g. Function statics.
-    symbol.full_name, symbol.template_name, symbol.name = (
-        function_signature.Parse(full_name))
-
-    # Remove anonymous namespaces (they just harm clustering).
-    symbol.template_name = symbol.template_name.replace(
-        '(anonymous namespace)::', '')
-    symbol.full_name = symbol.full_name.replace(
-        '(anonymous namespace)::', '')
-    non_anonymous_name = symbol.name.replace('(anonymous namespace)::', '')
-    if symbol.name != non_anonymous_name:
-      symbol.flags |= models.FLAG_ANONYMOUS
-      symbol.name = non_anonymous_name
-
-    # Allow using "is" to compare names (and should help with RAM).
-    function_signature.InternSameNames(symbol)
+  Args:
+    string_cache: See file_format.LoadSizeInfo(). The normalized names are
+        interned in it.
+  """
+  num_jobs = max(1, min(multiprocessing.cpu_count(),
+                        len(raw_symbols) // _MIN_SYMBOLS_PER_NORMALIZE_JOB))
+  job_size = (len(raw_symbols) + num_jobs - 1) // num_jobs
+  if num_jobs == 1:
+    results = [_NormalizeNamesJob(raw_symbols, 0, len(raw_symbols))]
+  else:
+    job_params = [(raw_symbols, i, i + job_size)
+                  for i in xrange(0, len(raw_symbols), job_size)]
+    results = concurrent.BulkForkAndCall(_NormalizeNamesJob, job_params)
+
+  found_prefixes = set()
+  for (start, full_names, template_names, names, encoded_flags,
+       encoded_prefixes) in results:
+    flags = array.array('i')
+    flags.fromstring(encoded_flags)
+    full_names = full_names.split('\x01')
+    template_names = template_names.split('\x01')
+    names = names.split('\x01')
+    if string_cache is not None:
+      setdefault = string_cache.setdefault
+      full_names = [setdefault(n, n) for n in full_names]
+      template_names = [setdefault(n, n) for n in template_names]
+      names = [setdefault(n, n) for n in names]
+    symbols = itertools.islice(raw_symbols, start, start + len(flags))
+    for i, symbol in enumerate(symbols):
+      symbol.full_name = full_names[i]
+      symbol.template_name = template_names[i]
+      symbol.name = names[i]
+      symbol.flags = flags[i]
+      # Allow using "is" to compare names (and should help with RAM).
+      function_signature.InternSameNames(symbol)
+    if encoded_prefixes:
+      found_prefixes.update(encoded_prefixes.split('\x01'))
 
   logging.debug('Found name prefixes of: %r', found_prefixes)
 
@@ -386,12 +470,16 @@ def _AddSymbolAliases(raw_symbols, aliases_by_address):
   assert dst_cursor_end == src_cursor_end
 
 
-def LoadAndPostProcessSizeInfo(path):
-  """Returns a SizeInfo for the given |path|."""
+def LoadAndPostProcessSizeInfo(path, string_cache=None):
+  """Returns a SizeInfo for the given |path|.
+
+  Args:
+    string_cache: See file_format.LoadSizeInfo().
+  """
   logging.debug('Loading results from: %s', path)
-  size_info = file_format.LoadSizeInfo(path)
+  size_info = file_format.LoadSizeInfo(path, string_cache=string_cache)
   logging.info('Normalizing symbol names')
-  _NormalizeNames(size_info.raw_symbols)
+  _NormalizeNames(size_info.raw_symbols, string_cache=string_cache)
   logging.info('Calculating padding')
   _CalculatePadding(size_info.raw_symbols)
   logging.info('Loaded %d symbols', len(size_info.raw_symbols))
@@ -431,7 +519,7 @@ def CreateMetadata(map_path, elf_path, apk_path, tool_prefix, output_directory):
 
 
 def CreateSizeInfo(map_path, elf_path, tool_prefix, output_directory,
-                   normalize_names=True):
+                   normalize_names=True, demangle_cache_dir=None):
   """Creates a SizeInfo.
 
   Args:
@@ -441,14 +529,17 @@ def CreateSizeInfo(map_path, elf_path, tool_prefix, output_directory,
     tool_prefix: Prefix for c++filt & nm (required).
     output_directory: Build output directory. If None, source_paths and symbol
         alias information will not be recorded.
+    demangle_cache_dir: Directory of the persistent demangle cache. If None,
+        no cache is used.
   """
+  timer = _StageTimer()
   source_mapper = None
   if output_directory:
     # Start by finding the elf_object_paths, so that nm can run on them while
     # the linker .map is being parsed.
-    logging.info('Parsing ninja files.')
-    source_mapper, elf_object_paths = ninja_parser.Parse(
-        output_directory, elf_path)
+    with timer.Stage('Parsing ninja files.'):
+      source_mapper, elf_object_paths = ninja_parser.Parse(
+          output_directory, elf_path)
     logging.debug('Parsed %d .ninja files.', source_mapper.parsed_file_count)
     assert not elf_path or elf_object_paths, (
         'Failed to find link command in ninja files for ' +
@@ -474,10 +565,10 @@ def CreateSizeInfo(map_path, elf_path, tool_prefix, output_directory,
       bulk_analyzer = nm.BulkObjectFileAnalyzer(tool_prefix, output_directory)
       bulk_analyzer.AnalyzePaths(elf_object_paths)
 
-  logging.info('Parsing Linker Map')
-  with _OpenMaybeGz(map_path) as map_file:
-    section_sizes, raw_symbols = (
-        linker_map_parser.MapFileParser().Parse(map_file))
+  with timer.Stage('Parsing Linker Map'):
+    with _OpenMaybeGz(map_path) as map_file:
+      section_sizes, raw_symbols = (
+          linker_map_parser.MapFileParser().Parse(map_file))
 
   if elf_path:
     logging.debug('Validating section sizes')
@@ -496,53 +587,54 @@ def CreateSizeInfo(map_path, elf_path, tool_prefix, output_directory,
     bulk_analyzer.Close()
 
   if source_mapper:
-    logging.info('Looking up source paths from ninja files')
-    _ExtractSourcePaths(raw_symbols, source_mapper)
+    with timer.Stage('Looking up source paths from ninja files'):
+      _ExtractSourcePaths(raw_symbols, source_mapper)
     assert source_mapper.unmatched_paths_count == 0, (
         'One or more source file paths could not be found. Likely caused by '
         '.ninja files being generated at a different time than the .map file.')
 
-  logging.info('Stripping linker prefixes from symbol names')
-  _StripLinkerAddedSymbolPrefixes(raw_symbols)
+  with timer.Stage('Stripping linker prefixes from symbol names'):
+    _StripLinkerAddedSymbolPrefixes(raw_symbols)
   # Map file for some reason doesn't unmangle all names.
-  # Unmangle prints its own log statement.
-  _UnmangleRemainingSymbols(raw_symbols, tool_prefix)
+  with timer.Stage('Unmangling remaining symbols'):
+    _UnmangleRemainingSymbols(raw_symbols, tool_prefix, demangle_cache_dir)
 
   if elf_path:
-    logging.info('Adding aliased symbols, as reported by nm')
-    # This normally does not block (it's finished by this time).
-    aliases_by_address = elf_nm_result.get()
-    _AddSymbolAliases(raw_symbols, aliases_by_address)
+    with timer.Stage('Adding aliased symbols, as reported by nm'):
+      # This normally does not block (it's finished by this time).
+      aliases_by_address = elf_nm_result.get()
+      _AddSymbolAliases(raw_symbols, aliases_by_address)
 
     if output_directory:
       # For aliases, this provides path information where there wasn't any.
-      logging.info('Computing ancestor paths for inline functions and '
-                   'normalizing object paths')
-
-      object_paths_by_name = bulk_analyzer.Get()
-      logging.debug('Fetched path information for %d symbols from %d files',
-                    len(object_paths_by_name),
-                    len(elf_object_paths) + len(missed_object_paths))
-      _ComputeAncestorPathsAndNormalizeObjectPaths(
-          raw_symbols, object_paths_by_name, source_mapper)
+      with timer.Stage('Computing ancestor paths for inline functions and '
+                       'normalizing object paths'):
+        object_paths_by_name = bulk_analyzer.Get()
+        logging.debug('Fetched path information for %d symbols from %d files',
+                      len(object_paths_by_name),
+                      len(elf_object_paths) + len(missed_object_paths))
+        _ComputeAncestorPathsAndNormalizeObjectPaths(
+            raw_symbols, object_paths_by_name, source_mapper)
 
   if not elf_path or not output_directory:
-    logging.info('Normalizing object paths.')
-    for symbol in raw_symbols:
-      symbol.object_path = _NormalizeObjectPath(symbol.object_path)
+    with timer.Stage('Normalizing object paths.'):
+      for symbol in raw_symbols:
+        symbol.object_path = _NormalizeObjectPath(symbol.object_path)
 
   # Padding not really required, but it is useful to check for large padding and
   # log a warning.
-  logging.info('Calculating padding')
-  _CalculatePadding(raw_symbols)
+  with timer.Stage('Calculating padding'):
+    _CalculatePadding(raw_symbols)
 
   # Do not call _NormalizeNames() during archive since that method tends to need
   # tweaks over time. Calling it only when loading .size files allows for more
   # flexability.
   if normalize_names:
-    _NormalizeNames(raw_symbols)
+    with timer.Stage('Normalizing names'):
+      _NormalizeNames(raw_symbols)
 
   logging.info('Processed %d symbols', len(raw_symbols))
+  timer.LogTimings()
   size_info = models.SizeInfo(section_sizes, raw_symbols)
 
   if logging.getLogger().isEnabledFor(logging.INFO):
@@ -640,6 +732,15 @@ def AddArguments(parser):
                       help='Path prefix for c++filt, nm, readelf.')
   parser.add_argument('--output-directory',
                       help='Path to the root build directory.')
+  parser.add_argument('--demangle-cache-dir',
+                      help='Keep the output of c++filt in a persistent cache '
+                           'in this directory, which can be shared with '
+                           'cyglog_to_orderfile.py (e.g. %s). No cache is '
+                           'used by default.' % demangle.DefaultCacheDir())
+  parser.add_argument('--format-version', type=int, choices=(1, 2), default=1,
+                      help='Version of the .size file format to write. 2 '
+                           'loads much faster, but makes larger files '
+                           '(default: %(default)s).')
 
 
 def Run(args, parser):
@@ -695,7 +796,8 @@ def Run(args, parser):
         _ElfInfoFromApk, (apk_path, apk_so_path, tool_prefix))
 
   size_info = CreateSizeInfo(map_path, elf_path, tool_prefix, output_directory,
-                             normalize_names=False)
+                             normalize_names=False,
+                             demangle_cache_dir=args.demangle_cache_dir)
 
   if metadata:
     size_info.metadata = metadata
@@ -727,5 +829,6 @@ def Run(args, parser):
   logging.info('Recording metadata: \n  %s',
                '\n  '.join(describe.DescribeMetadata(size_info.metadata)))
   logging.info('Saving result to %s', args.size_file)
-  file_format.SaveSizeInfo(size_info, args.size_file)
+  file_format.SaveSizeInfo(size_info, args.size_file,
+                           format_version=args.format_version)
   logging.info('Done')
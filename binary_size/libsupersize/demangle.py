@@ -0,0 +1,305 @@
+# Copyright 2017 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Demangles C++ symbol names using a pool of c++filt processes.
+
+Results can be stored in a persistent on-disk cache. Consecutive builds share
+almost all of their symbols, so repeated runs need to demangle only a few new
+names.
+
+Cache layout:
+  <cache_dir>/<toolchain hash>/<xx>.txt
+    * <toolchain hash> identifies the c++filt binary, since different versions
+      can demangle differently.
+    * <xx> is the first byte of the SHA-1 of the mangled name (256 shards).
+    * Each line is "mangled\\tdemangled\\tlast_used_day".
+  When the cache exceeds its maximum size, the least recently used entries are
+  evicted. Entries used on the current day are never evicted, so the cache can
+  stay over its maximum size until the next day.
+
+Also used by tools/cygprofile.
+"""
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import threading
+import time
+
+
+_DEFAULT_MAX_CACHE_SIZE = 200 * 1024 * 1024
+# Evicting to less than the max size means eviction is not needed every run.
+_EVICT_TO_FRACTION = 0.75
+_NUM_SHARDS = 256
+# Fewer names than this are not worth sending to another c++filt process.
+_MIN_NAMES_PER_WORKER = 5000
+
+
+def _Today():
+  return int(time.time() // (24 * 60 * 60))
+
+
+def _ShardIndex(mangled_name):
+  return ord(hashlib.sha1(mangled_name).digest()[0])
+
+
+def DefaultCacheDir():
+  """Returns a suggested directory for the persistent cache."""
+  cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+      os.path.expanduser('~'), '.cache')
+  return os.path.join(cache_home, 'chromium-demangle')
+
+
+def _ToolchainHash(cppfilt_path):
+  """Returns a string that changes whenever the c++filt binary does."""
+  real_path = os.path.realpath(cppfilt_path)
+  if not os.path.exists(real_path):
+    from distutils import spawn
+    real_path = os.path.realpath(spawn.find_executable(cppfilt_path) or
+                                 cppfilt_path)
+  key = real_path
+  if os.path.exists(real_path):
+    stat = os.stat(real_path)
+    key = '%s:%d:%d' % (real_path, stat.st_size, int(stat.st_mtime))
+  return hashlib.sha1(key).hexdigest()[:16]
+
+
+class DemangleCache(object):
+  """A persistent map of mangled name -> demangled name.
+
+  Shards are loaded on demand, and are written only by Flush().
+  """
+
+  def __init__(self, cache_dir, cppfilt_path,
+               max_size=_DEFAULT_MAX_CACHE_SIZE):
+    self._dir = os.path.join(cache_dir, _ToolchainHash(cppfilt_path))
+    self._max_size = max_size
+    self._today = _Today()
+    # Shard index -> {mangled: [demangled, last_used_day]}.
+    self._shards = {}
+    self._dirty_shards = set()
+
+  def _ShardPath(self, shard_index):
+    return os.path.join(self._dir, '%02x.txt' % shard_index)
+
+  def _GetShard(self, shard_index):
+    shard = self._shards.get(shard_index)
+    if shard is None:
+      shard = {}
+      path = self._ShardPath(shard_index)
+      if os.path.exists(path):
+        try:
+          with open(path) as f:
+            for line in f:
+              mangled, demangled, day = line[:-1].split('\t')
+              shard[mangled] = [demangled, int(day)]
+        except (IOError, ValueError):
+          logging.warning('Ignoring corrupt demangle cache file: %s', path)
+          shard = {}
+      self._shards[shard_index] = shard
+    return shard
+
+  def Get(self, mangled_names):
+    """Returns a dict of mangled -> demangled for names that are in the cache.
+    """
+    ret = {}
+    today = self._today
+    for name in mangled_names:
+      shard_index = _ShardIndex(name)
+      entry = self._GetShard(shard_index).get(name)
+      if entry is not None:
+        ret[name] = entry[0]
+        if entry[1] != today:
+          entry[1] = today
+          self._dirty_shards.add(shard_index)
+    return ret
+
+  def Put(self, demangled_by_mangled):
+    today = self._today
+    for mangled, demangled in demangled_by_mangled.iteritems():
+      if '\t' in mangled or '\t' in demangled or '\n' in demangled:
+        continue
+      shard_index = _ShardIndex(mangled)
+      self._GetShard(shard_index)[mangled] = [demangled, today]
+      self._dirty_shards.add(shard_index)
+
+  def _WriteShard(self, shard_index):
+    if not os.path.exists(self._dir):
+      os.makedirs(self._dir)
+    # Write to a temporary file and rename so that concurrent readers never
+    # see partial files.
+    fd, temp_path = tempfile.mkstemp(dir=self._dir, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+      for mangled, (demangled, day) in self._shards[shard_index].iteritems():
+        f.write('%s\t%s\t%d\n' % (mangled, demangled, day))
+    os.rename(temp_path, self._ShardPath(shard_index))
+
+  def _TotalSize(self):
+    total = 0
+    for shard_index in xrange(_NUM_SHARDS):
+      path = self._ShardPath(shard_index)
+      if os.path.exists(path):
+        total += os.path.getsize(path)
+    return total
+
+  def _Evict(self, total_size):
+    """Removes the least recently used entries until under the size limit.
+
+    Only entries last used before today are removed, since the others are
+    likely to be needed again by the current build.
+    """
+    target_size = int(self._max_size * _EVICT_TO_FRACTION)
+    sizes_by_day = {}
+    for shard_index in xrange(_NUM_SHARDS):
+      for mangled, (demangled, day) in self._GetShard(shard_index).iteritems():
+        size = len(mangled) + len(demangled) + 8
+        sizes_by_day[day] = sizes_by_day.get(day, 0) + size
+    # Find the oldest day to keep.
+    cutoff_day = None
+    for day in sorted(sizes_by_day):
+      if total_size <= target_size or day >= self._today:
+        break
+      total_size -= sizes_by_day[day]
+      cutoff_day = day
+    if cutoff_day is None:
+      return
+    logging.info('Evicting demangle cache entries last used before day %d',
+                 cutoff_day + 1)
+    for shard_index in xrange(_NUM_SHARDS):
+      shard = self._shards[shard_index]
+      stale = [k for k, v in shard.iteritems() if v[1] <= cutoff_day]
+      if stale:
+        for mangled in stale:
+          del shard[mangled]
+        self._dirty_shards.add(shard_index)
+
+  def Flush(self):
+    """Writes changes to disk, evicting entries if the cache is too large."""
+    try:
+      for shard_index in sorted(self._dirty_shards):
+        self._WriteShard(shard_index)
+      self._dirty_shards.clear()
+      total_size = self._TotalSize()
+      if total_size > self._max_size:
+        self._Evict(total_size)
+        for shard_index in sorted(self._dirty_shards):
+          self._WriteShard(shard_index)
+        self._dirty_shards.clear()
+    except (IOError, OSError):
+      # The cache is only an optimization.
+      logging.warning('Failed to write demangle cache to %s', self._dir)
+
+
+class _CppFiltWorker(object):
+  """A long-lived c++filt process."""
+
+  def __init__(self, cppfilt_path):
+    self._proc = subprocess.Popen([cppfilt_path], stdin=subprocess.PIPE,
+                                  stdout=subprocess.PIPE)
+
+  def Demangle(self, mangled_names):
+    """Returns the demangled forms of |mangled_names|.
+
+    c++filt writes exactly one line per line of input, and flushes after each.
+    """
+    def write_names():
+      self._proc.stdin.write(''.join(n + '\n' for n in mangled_names))
+      self._proc.stdin.flush()
+
+    # Write from another thread so that neither pipe's buffer can fill up.
+    writer = threading.Thread(target=write_names)
+    writer.start()
+    readline = self._proc.stdout.readline
+    ret = [readline()[:-1] for _ in xrange(len(mangled_names))]
+    writer.join()
+    return ret
+
+  def Close(self):
+    self._proc.stdin.close()
+    self._proc.wait()
+
+
+class CppFiltPool(object):
+  """A set of long-lived c++filt processes, created on demand."""
+
+  def __init__(self, cppfilt_path, max_workers=None):
+    self._cppfilt_path = cppfilt_path
+    self._max_workers = max_workers or multiprocessing.cpu_count()
+    self._workers = []
+
+  def Demangle(self, mangled_names):
+    """Returns a list of the demangled forms of |mangled_names|."""
+    if not mangled_names:
+      return []
+    num_workers = max(1, min(self._max_workers,
+                             len(mangled_names) // _MIN_NAMES_PER_WORKER))
+    while len(self._workers) < num_workers:
+      self._workers.append(_CppFiltWorker(self._cppfilt_path))
+    if num_workers == 1:
+      return self._workers[0].Demangle(mangled_names)
+
+    chunk_size = (len(mangled_names) + num_workers - 1) // num_workers
+    results = [None] * num_workers
+    def run(i):
+      chunk = mangled_names[i * chunk_size:(i + 1) * chunk_size]
+      results[i] = self._workers[i].Demangle(chunk)
+    threads = [threading.Thread(target=run, args=(i,))
+               for i in xrange(num_workers)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    ret = []
+    for result in results:
+      ret.extend(result)
+    return ret
+
+  def Close(self):
+    for worker in self._workers:
+      worker.Close()
+    self._workers = []
+
+
+class Demangler(object):
+  """Demangles names using a CppFiltPool and (optionally) a DemangleCache."""
+
+  def __init__(self, cppfilt_path, cache_dir=None, max_workers=None):
+    self._pool = CppFiltPool(cppfilt_path, max_workers=max_workers)
+    self._cache = None
+    if cache_dir:
+      self._cache = DemangleCache(cache_dir, cppfilt_path)
+    # Names demangled by this instance, for when there is no cache.
+    self._memo = {}
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *_):
+    self.Close()
+
+  def Demangle(self, mangled_names):
+    """Returns a list of the demangled forms of |mangled_names|."""
+    memo = self._memo
+    missing = [n for n in set(mangled_names) if n not in memo]
+    if missing and self._cache:
+      hits = self._cache.Get(missing)
+      memo.update(hits)
+      missing = [n for n in missing if n not in hits]
+    logging.debug('Demangling %d of %d names', len(missing),
+                  len(mangled_names))
+    if missing:
+      demangled = dict(zip(missing, self._pool.Demangle(missing)))
+      memo.update(demangled)
+      if self._cache:
+        self._cache.Put(demangled)
+    return [memo[n] for n in mangled_names]
+
+  def Close(self):
+    """Flushes the cache and terminates c++filt processes."""
+    self._pool.Close()
+    if self._cache:
+      self._cache.Flush()
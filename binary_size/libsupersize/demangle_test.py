@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# Copyright 2017 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import demangle
+
+
+_CPPFILT_PATH = os.path.join(
+    os.path.abspath(os.path.dirname(__file__)), 'testdata', 'mock_toolchain',
+    'c++filt')
+_MANGLED = [
+    '_ZL35kMethodsAnimationFrameTimeHistogram',
+    '_ZN4base7androidL22kBaseRegisteredMethodsE',
+    '_ZL18extFromUUseMapping2aji',
+    'not_mangled',
+]
+_DEMANGLED = [
+    'kMethodsAnimationFrameTimeHistogram',
+    'base::android::kBaseRegisteredMethods',
+    'extFromUUseMapping(aj, int)',
+    'not_mangled',
+]
+
+
+class DemangleTest(unittest.TestCase):
+
+  def setUp(self):
+    self._cache_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self._cache_dir)
+
+  def testPool(self):
+    old_min_names = demangle._MIN_NAMES_PER_WORKER
+    demangle._MIN_NAMES_PER_WORKER = 1
+    try:
+      pool = demangle.CppFiltPool(_CPPFILT_PATH, max_workers=3)
+      self.assertEquals(_DEMANGLED, pool.Demangle(_MANGLED))
+      # Workers are reused between calls.
+      self.assertEquals(_DEMANGLED[::-1], pool.Demangle(_MANGLED[::-1]))
+      pool.Close()
+    finally:
+      demangle._MIN_NAMES_PER_WORKER = old_min_names
+
+  def testDemangler_Cached(self):
+    names = _MANGLED + _MANGLED[:2]
+    with demangle.Demangler(_CPPFILT_PATH,
+                            cache_dir=self._cache_dir) as demangler:
+      self.assertEquals(_DEMANGLED + _DEMANGLED[:2], demangler.Demangle(names))
+
+    cache = demangle.DemangleCache(self._cache_dir, _CPPFILT_PATH)
+    self.assertEquals(dict(zip(_MANGLED, _DEMANGLED)),
+                      cache.Get(_MANGLED + ['_ZMissing']))
+    # A different c++filt uses a separate namespace.
+    other_cache = demangle.DemangleCache(self._cache_dir, _CPPFILT_PATH + 'x')
+    self.assertEquals({}, other_cache.Get(_MANGLED))
+
+  def testDemangleCache_Evict(self):
+    cache = demangle.DemangleCache(self._cache_dir, _CPPFILT_PATH)
+    cache._today = 1
+    cache.Put({'_ZOld%d' % i: 'old%d' % i for i in xrange(100)})
+    cache.Flush()
+    self.assertGreater(cache._TotalSize(), 1000)
+
+    cache = demangle.DemangleCache(self._cache_dir, _CPPFILT_PATH,
+                                   max_size=1000)
+    cache._today = 2
+    # Hits mark entries as recently used.
+    self.assertEquals({'_ZOld0': 'old0'}, cache.Get(['_ZOld0']))
+    cache.Put({'_ZNew': 'new'})
+    cache.Flush()
+
+    cache = demangle.DemangleCache(self._cache_dir, _CPPFILT_PATH,
+                                   max_size=1000)
+    self.assertEquals({'_ZOld0': 'old0', '_ZNew': 'new'},
+                      cache.Get(['_ZOld0', '_ZOld1', '_ZNew']))
+    self.assertLess(cache._TotalSize(), 1000)
+
+  def testDemangleCache_EvictKeepsToday(self):
+    cache = demangle.DemangleCache(self._cache_dir, _CPPFILT_PATH,
+                                   max_size=1000)
+    cache._today = 1
+    cache.Put({'_ZOld%d' % i: 'old%d' % i for i in xrange(50)})
+    cache.Flush()
+    cache = demangle.DemangleCache(self._cache_dir, _CPPFILT_PATH,
+                                   max_size=1000)
+    cache._today = 2
+    cache.Put({'_ZNew%d' % i: 'new%d' % i for i in xrange(100)})
+    cache.Flush()
+
+    # Only older entries are evicted, even though today's exceed the limit.
+    cache = demangle.DemangleCache(self._cache_dir, _CPPFILT_PATH)
+    self.assertEquals({}, cache.Get(['_ZOld%d' % i for i in xrange(50)]))
+    self.assertEquals(100, len(cache.Get(['_ZNew%d' % i for i in xrange(100)])))
+    self.assertGreater(cache._TotalSize(), 1000)
+
+
+if __name__ == '__main__':
+  unittest.main()
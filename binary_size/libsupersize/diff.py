@@ -4,11 +4,43 @@
 """Logic for diffing two SizeInfo objects."""
 
 import collections
+import itertools
 import re
 
 import models
 
 
+_SYMBOL_GAP_SUFFIX_PATTERN = re.compile(r'\s+\d+( \(.*\))?$')
+_NUMBERS_AND_DOTS_PATTERN = re.compile(r'[.0-9]')
+_KEY_FIELDS = ('section', 'full_name', 'object_path')
+
+
+def _NormalizeName(full_name):
+  """Returns (name, is_generated) for use in symbol keys."""
+  name = full_name
+  clone_idx = name.find(' [clone ')
+  if clone_idx != -1:
+    name = name[:clone_idx]
+  if name.startswith('*'):
+    # "symbol gap 3 (bar)" -> "symbol gaps"
+    name = _SYMBOL_GAP_SUFFIX_PATTERN.sub('s', name)
+
+  if '.' not in name:
+    return name, False
+
+  # Compiler or Linker generated symbol.
+  return _NUMBERS_AND_DOTS_PATTERN.sub('', name), True
+
+
+def _MakeKey(section, full_name, object_path):
+  name, is_generated = _NormalizeName(full_name)
+  # Use section rather than section_name since clang & gcc use
+  # .data.rel.ro vs .data.rel.ro.local.
+  if is_generated:
+    return (section, name, object_path)
+  return (section, name)
+
+
 def _SymbolKey(symbol):
   """Returns a tuple that can be used to see if two Symbol are the same.
 
@@ -24,40 +56,91 @@ def _SymbolKey(symbol):
     "._468", "._467"
     ".L__unnamed_1193", ".L__unnamed_712"
   """
-  name = symbol.full_name
-  clone_idx = name.find(' [clone ')
-  if clone_idx != -1:
-    name = name[:clone_idx]
-  if name.startswith('*'):
-    # "symbol gap 3 (bar)" -> "symbol gaps"
-    name = re.sub(r'\s+\d+( \(.*\))?$', 's', name)
+  return _MakeKey(symbol.section, symbol.full_name, symbol.object_path)
 
-  # Use section rather than section_name since clang & gcc use
-  # .data.rel.ro vs .data.rel.ro.local.
-  if '.' not in name:
-    return (symbol.section, name)
 
-  # Compiler or Linker generated symbol.
-  name = re.sub(r'[.0-9]', '', name)  # Strip out all numbers and dots.
-  return (symbol.section, name, symbol.object_path)
+def _SymbolKeys(symbols, normalized_names=None):
+  """Returns a list of _SymbolKey() for each of |symbols|.
 
+  Args:
+    normalized_names: Dict of full_name -> _NormalizeName(full_name). Names
+        that are not in it yet are added to it.
+  """
+  ret = []
+  # Regexes are slow, and many names repeat, so normalize each name only once.
+  if normalized_names is None:
+    normalized_names = {}
+  for section, full_name, object_path in symbols.IterFieldValues(_KEY_FIELDS):
+    # Fast path for the common case (clone suffixes always contain a ".").
+    if '.' not in full_name and not full_name.startswith('*'):
+      ret.append((section, full_name))
+      continue
+    normalized = normalized_names.get(full_name)
+    if normalized is None:
+      normalized = _NormalizeName(full_name)
+      normalized_names[full_name] = normalized
+    name, is_generated = normalized
+    if is_generated:
+      ret.append((section, name, object_path))
+    else:
+      ret.append((section, name))
+  return ret
+
+
+def _GetSymbolKeys(size_info):
+  """Returns _SymbolKeys(size_info.raw_symbols).
+
+  The names normalized by regexes are cached on |size_info|. The cache is keyed
+  by name, so it does not go stale when symbols are renamed or replaced.
+  """
+  if size_info._diff_normalized_names is None:
+    size_info._diff_normalized_names = {}
+  return _SymbolKeys(size_info.raw_symbols, size_info._diff_normalized_names)
 
-def _DiffSymbolGroups(before, after):
-  before_symbols_by_key = collections.defaultdict(list)
-  for s in before:
-    before_symbols_by_key[_SymbolKey(s)].append(s)
+
+def _DiffSymbolGroups(before, after, before_keys=None, after_keys=None):
+  """Matches up symbols of |before| and |after|.
+
+  Symbols are bucketed by key, and only indices are stored in the buckets, so
+  that groups backed by a SymbolTable create symbol objects only for the
+  DeltaSymbols that are returned.
+  """
+  if before_keys is None:
+    before_keys = _SymbolKeys(before)
+  if after_keys is None:
+    after_keys = _SymbolKeys(after)
+
+  # Most keys are unique, so buckets are ints until a second symbol is added.
+  before_indices_by_key = {}
+  for i, key in enumerate(before_keys):
+    bucket = before_indices_by_key.get(key)
+    if bucket is None:
+      before_indices_by_key[key] = i
+    elif bucket.__class__ is int:
+      before_indices_by_key[key] = collections.deque((bucket, i))
+    else:
+      bucket.append(i)
 
   delta_symbols = []
   # For changed symbols, padding is zeroed out. In order to not lose the
   # information entirely, store it in aggregate.
   padding_by_section_name = collections.defaultdict(int)
+  matched = bytearray(len(before_keys))
 
   # Create a DeltaSymbol for each after symbol.
-  for after_sym in after:
-    matching_syms = before_symbols_by_key.get(_SymbolKey(after_sym))
+  for after_sym, key in itertools.izip(after, after_keys):
+    bucket = before_indices_by_key.get(key)
     before_sym = None
-    if matching_syms:
-      before_sym = matching_syms.pop(0)
+    if bucket is not None:
+      if bucket.__class__ is int:
+        before_idx = bucket
+        del before_indices_by_key[key]
+      else:
+        before_idx = bucket.popleft()
+        if not bucket:
+          del before_indices_by_key[key]
+      matched[before_idx] = 1
+      before_sym = before[before_idx]
       # Padding tracked in aggregate, except for padding-only symbols.
       if before_sym.size_without_padding:
         padding_by_section_name[before_sym.section_name] += (
@@ -65,9 +148,9 @@ def _DiffSymbolGroups(before, after):
     delta_symbols.append(models.DeltaSymbol(before_sym, after_sym))
 
   # Create a DeltaSymbol for each unmatched before symbol.
-  for remaining_syms in before_symbols_by_key.itervalues():
-    for before_sym in remaining_syms:
-      delta_symbols.append(models.DeltaSymbol(before_sym, None))
+  for before_idx, was_matched in enumerate(matched):
+    if not was_matched:
+      delta_symbols.append(models.DeltaSymbol(before[before_idx], None))
 
   # Create a DeltaSymbol to represent the zero'd out padding of matched symbols.
   for section_name, padding in padding_by_section_name.iteritems():
@@ -90,6 +173,10 @@ def Diff(before, after):
     if k not in section_sizes:
       section_sizes[k] = v
 
-  symbol_diff = _DiffSymbolGroups(before.raw_symbols, after.raw_symbols)
+  # Normalized names are cached on each SizeInfo, since the same SizeInfo is
+  # often diffed against several others (e.g. when diffing a series of builds).
+  symbol_diff = _DiffSymbolGroups(
+      before.raw_symbols, after.raw_symbols, _GetSymbolKeys(before),
+      _GetSymbolKeys(after))
   return models.DeltaSizeInfo(section_sizes, symbol_diff, before.metadata,
                               after.metadata)
@@ -2,23 +2,67 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
-"""Deals with loading & saving .size files."""
-
+"""Deals with loading & saving .size files.
+
+Two formats exist:
+  v1: Gzipped text. Every number is written out as a decimal string.
+  v2: Uncompressed binary. A text header (same as v1) is followed by
+      fixed-width columns (one per symbol field) and a string table. Each
+      column is decoded with a single array.fromstring(), so loading does not
+      need to parse any numbers. Loading still decodes every column and string
+      up front: symbols do not keep any reference to the file. Files are
+      several times larger than v1 ones, so v1 remains the default.
+
+Layout of the v2 binary section (all integers are signed & little-endian):
+  Counts:    num_sections, num_symbols, num_paths, num_strings (int32 each)
+  Sections:  num_sections x (name string index, symbol count) (int32 each)
+  Paths:     num_paths x (object_path string index, source_path string index)
+  Columns:   num_symbols x address (int64)
+             num_symbols x size_without_padding (int32)
+             num_symbols x flags (int16)
+             num_symbols x path index (int32)
+             num_symbols x full_name string index (int32)
+             num_symbols x num_aliases (int32, 0 for all but first alias)
+  Strings:   (num_strings + 1) x offsets into the string data (int32)
+             \0-separated string data.
+"""
+
+import array
 import cStringIO
 import calendar
 import collections
 import datetime
 import gzip
+import itertools
 import json
 import logging
+import mmap
 import os
 import shutil
+import struct
+import sys
 
 import models
 
 
-# File format version for .size files.
-_SERIALIZATION_VERSION = 'Size File Format v1'
+# File format versions for .size files.
+_SERIALIZATION_VERSION_V1 = 'Size File Format v1'
+_SERIALIZATION_VERSION_V2 = 'Size File Format v2'
+
+_GZIP_MAGIC = '\x1f\x8b'
+
+# struct format characters of the ints of each width used by v2 files.
+_STRUCT_FORMATS = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}
+
+# (field, width in bytes) for each v2 symbol column, in file order.
+_V2_COLUMNS = (
+    ('addresses', 8),
+    ('sizes', 4),
+    ('flags', 2),
+    ('path_indices', 4),
+    ('name_indices', 4),
+    ('num_aliases', 4),
+)
 
 
 def _LogSize(file_obj, desc):
@@ -29,9 +73,47 @@ def _LogSize(file_obj, desc):
   logging.debug('File size with %s: %d' % (desc, size))
 
 
-def _SaveSizeInfoToFile(size_info, file_obj):
+def _ArrayTypeCode(width):
+  """Returns the array.array type code for ints of |width| bytes, or None.
+
+  Uses signed types since unsigned ones are returned as longs. There is none
+  for 8 bytes where longs are 4 bytes (e.g. on Windows and 32-bit platforms).
+  """
+  for type_code in 'bhil':
+    if array.array(type_code).itemsize == width:
+      return type_code
+  return None
+
+
+def _EncodeInts(values, width):
+  """Returns |values| encoded as little-endian ints of |width| bytes."""
+  type_code = _ArrayTypeCode(width)
+  if type_code is None:
+    return struct.pack('<%d%s' % (len(values), _STRUCT_FORMATS[width]),
+                       *values)
+  ret = array.array(type_code, values)
+  if sys.byteorder != 'little':
+    ret.byteswap()
+  return ret.tostring()
+
+
+def _DecodeInts(data, width):
+  """Returns a sequence of the little-endian ints of |width| bytes in |data|.
+  """
+  type_code = _ArrayTypeCode(width)
+  if type_code is None:
+    return list(struct.unpack(
+        '<%d%s' % (len(data) // width, _STRUCT_FORMATS[width]), data))
+  ret = array.array(type_code)
+  ret.fromstring(data)
+  if sys.byteorder != 'little':
+    ret.byteswap()
+  return ret
+
+
+def _WriteHeader(size_info, file_obj, version):
   file_obj.write('# Created by //tools/binary_size\n')
-  file_obj.write('%s\n' % _SERIALIZATION_VERSION)
+  file_obj.write('%s\n' % version)
   headers = {
       'metadata': size_info.metadata,
       'section_sizes': size_info.section_sizes,
@@ -42,6 +124,15 @@ def _SaveSizeInfoToFile(size_info, file_obj):
   file_obj.write('\n')
   _LogSize(file_obj, 'header')  # For libchrome: 570 bytes.
 
+
+def _SymbolsBySection(size_info):
+  return size_info.raw_symbols.GroupedBySectionName().Sorted(
+      key=lambda s:(s[0].IsBss(), s[0].address, s.full_name))
+
+
+def _SaveSizeInfoToFileV1(size_info, file_obj):
+  _WriteHeader(size_info, file_obj, _SERIALIZATION_VERSION_V1)
+
   # Store a single copy of all paths and have them referenced by index.
   # Using an OrderedDict makes the indices more repetitive (better compression).
   path_tuples = collections.OrderedDict.fromkeys(
@@ -53,8 +144,7 @@ def _SaveSizeInfoToFile(size_info, file_obj):
   _LogSize(file_obj, 'paths')  # For libchrome, adds 200kb.
 
   # Symbol counts by section.
-  by_section = size_info.raw_symbols.GroupedBySectionName().Sorted(
-      key=lambda s:(s[0].IsBss(), s[0].address, s.full_name))
+  by_section = _SymbolsBySection(size_info)
   file_obj.write('%s\n' % '\t'.join(g.name for g in by_section))
   file_obj.write('%s\n' % '\t'.join(str(len(g)) for g in by_section))
 
@@ -93,18 +183,210 @@ def _SaveSizeInfoToFile(size_info, file_obj):
   _LogSize(file_obj, 'names (final)')  # For libchrome: adds 3.5mb.
 
 
-def _LoadSizeInfoFromFile(file_obj, size_path):
-  """Loads a size_info from the given file."""
-  lines = iter(file_obj)
-  next(lines)  # Comment line.
-  actual_version = next(lines)[:-1]
-  assert actual_version == _SERIALIZATION_VERSION, (
+def _SaveSizeInfoToFileV2(size_info, file_obj):
+  _WriteHeader(size_info, file_obj, _SERIALIZATION_VERSION_V2)
+
+  strings = collections.OrderedDict()
+  def string_index(value):
+    ret = strings.get(value)
+    if ret is None:
+      ret = len(strings)
+      strings[value] = ret
+    return ret
+
+  by_section = _SymbolsBySection(size_info)
+  path_tuples = collections.OrderedDict()
+  columns = dict((name, []) for name, _ in _V2_COLUMNS)
+  prev_aliases = None
+  for group in by_section:
+    for symbol in group:
+      path_key = (symbol.object_path, symbol.source_path)
+      path_index = path_tuples.get(path_key)
+      if path_index is None:
+        path_index = len(path_tuples)
+        path_tuples[path_key] = path_index
+      num_aliases = 0
+      if symbol.aliases and symbol.aliases is not prev_aliases:
+        num_aliases = symbol.num_aliases
+      prev_aliases = symbol.aliases
+
+      columns['addresses'].append(symbol.address)
+      columns['sizes'].append(symbol.size_without_padding)
+      columns['flags'].append(symbol.flags)
+      columns['path_indices'].append(path_index)
+      columns['name_indices'].append(string_index(symbol.full_name))
+      columns['num_aliases'].append(num_aliases)
+
+  sections = []
+  for group in by_section:
+    sections.append(string_index(group.name))
+    sections.append(len(group))
+  paths = []
+  for object_path, source_path in path_tuples:
+    paths.append(string_index(object_path))
+    paths.append(string_index(source_path))
+
+  string_data = '\0'.join(strings)
+  string_offsets = [0]
+  offset = 0
+  for value in strings:
+    offset += len(value) + 1
+    string_offsets.append(offset)
+
+  counts = [len(by_section), len(size_info.raw_symbols), len(path_tuples),
+            len(strings)]
+  for values in (counts, sections, paths):
+    file_obj.write(_EncodeInts(values, 4))
+  for name, width in _V2_COLUMNS:
+    file_obj.write(_EncodeInts(columns[name], width))
+  file_obj.write(_EncodeInts(string_offsets, 4))
+  _LogSize(file_obj, 'columns')
+  file_obj.write(string_data)
+  _LogSize(file_obj, 'strings (final)')
+
+
+class _SizeFileV2Reader(object):
+  """Decodes the binary portion of a v2 .size file.
+
+  Each column is decoded once, when first accessed. |buf| may be an mmap, and
+  is not needed once all the columns and strings have been decoded.
+  """
+
+  def __init__(self, buf, offset):
+    self._buf = buf
+    self._offset = offset
+    self._column_cache = {}
+    self._strings = None
+    self.num_sections, self.num_symbols, self.num_paths, self.num_strings = (
+        self._ReadArray(4, 4))
+    self._sections_offset = self._offset
+    self._offset += self.num_sections * 8
+    self._paths_offset = self._offset
+    self._offset += self.num_paths * 8
+    self._column_offsets = {}
+    for name, width in _V2_COLUMNS:
+      self._column_offsets[name] = self._offset
+      self._offset += self.num_symbols * width
+    self._string_offsets_offset = self._offset
+    self._string_data_offset = self._offset + (self.num_strings + 1) * 4
+
+  def _ReadArray(self, width, count, offset=None):
+    if offset is None:
+      offset = self._offset
+      self._offset += width * count
+    return _DecodeInts(self._buf[offset:offset + width * count], width)
+
+  def Column(self, name):
+    """Returns a sequence of the values for the given symbol column."""
+    ret = self._column_cache.get(name)
+    if ret is None:
+      width = dict(_V2_COLUMNS)[name]
+      ret = self._ReadArray(width, self.num_symbols,
+                            self._column_offsets[name])
+      self._column_cache[name] = ret
+    return ret
+
+  def Strings(self):
+    """Returns a list of all strings within the string table."""
+    if self._strings is None:
+      string_offsets = self._ReadArray(4, self.num_strings + 1,
+                                       self._string_offsets_offset)
+      start = self._string_data_offset
+      data = self._buf[start:start + string_offsets[-1] - 1]
+      self._strings = data.split('\0') if self.num_strings else []
+    return self._strings
+
+  def String(self, index):
+    """Returns a single string without decoding the entire string table."""
+    if self._strings is not None:
+      return self._strings[index]
+    start, end = self._ReadArray(4, 2, self._string_offsets_offset + index * 4)
+    data_offset = self._string_data_offset
+    return self._buf[data_offset + start:data_offset + end - 1]
+
+  def Sections(self):
+    """Returns a list of (section_name, symbol_count)."""
+    values = self._ReadArray(4, self.num_sections * 2, self._sections_offset)
+    return [(self.String(values[i]), values[i + 1])
+            for i in xrange(0, len(values), 2)]
+
+  def PathTuples(self):
+    """Returns a list of (object_path, source_path)."""
+    values = self._ReadArray(4, self.num_paths * 2, self._paths_offset)
+    strings = self.Strings()
+    return [(strings[values[i]], strings[values[i + 1]])
+            for i in xrange(0, len(values), 2)]
+
+
+def _InternStrings(full_names, path_tuples, string_cache):
+  """Replaces strings with equal ones from |string_cache| (adding new ones).
+
+  Allows several SizeInfos to share the memory of common names and paths.
+  """
+  setdefault = string_cache.setdefault
+  full_names[:] = [setdefault(n, n) for n in full_names]
+  path_tuples[:] = [
+      setdefault(t, (setdefault(t[0], t[0]), setdefault(t[1], t[1])))
+      for t in path_tuples]
+
+
+def _LoadSizeInfoFromBufferV2(buf, offset, section_sizes, metadata, size_path,
+                              string_cache):
+  reader = _SizeFileV2Reader(buf, offset)
+  strings = reader.Strings()
+  path_tuples = reader.PathTuples()
+  name_indices = reader.Column('name_indices')
+  full_names = [strings[i] for i in name_indices]
+  if string_cache is not None:
+    _InternStrings(full_names, path_tuples, string_cache)
+  table = models.SymbolTable(
+      reader.Sections(), reader.Column('addresses'), reader.Column('sizes'),
+      reader.Column('flags'), path_tuples, reader.Column('path_indices'),
+      full_names, reader.Column('num_aliases'))
+  return models.SizeInfo(section_sizes, models.SymbolGroup(table.Symbols()),
+                         metadata=metadata, size_path=size_path)
+
+
+def _ReadHeader(file_obj):
+  """Returns (version, section_sizes, metadata).
+
+  Leaves |file_obj| positioned at the newline that follows the json header.
+  """
+  # Use readline() rather than iterating so that read() can be mixed in.
+  file_obj.readline()  # Comment line.
+  actual_version = file_obj.readline()[:-1]
+  assert actual_version in (
+      _SERIALIZATION_VERSION_V1, _SERIALIZATION_VERSION_V2), (
       'Version mismatch. Need to write some upgrade code.')
-  json_len = int(next(lines))
+  json_len = int(file_obj.readline())
   json_str = file_obj.read(json_len)
   headers = json.loads(json_str)
-  section_sizes = headers['section_sizes']
-  metadata = headers.get('metadata')
+  return actual_version, headers['section_sizes'], headers.get('metadata')
+
+
+def _LoadSizeInfoFromFileV2(file_obj, size_path, string_cache):
+  """Loads a size_info from a v2 file, which must not be compressed."""
+  _, section_sizes, metadata = _ReadHeader(file_obj)
+  offset = file_obj.tell() + 1  # newline after closing } of json.
+  buf = mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+  try:
+    return _LoadSizeInfoFromBufferV2(buf, offset, section_sizes, metadata,
+                                     size_path, string_cache)
+  finally:
+    buf.close()
+
+
+def _LoadSizeInfoFromFile(file_obj, size_path, string_cache):
+  """Loads a size_info from the given file."""
+  actual_version, section_sizes, metadata = _ReadHeader(file_obj)
+  if actual_version == _SERIALIZATION_VERSION_V2:
+    # Compressed v2 file. Cannot mmap, so read it into memory instead.
+    offset = file_obj.tell() + 1  # newline after closing } of json.
+    file_obj.seek(0)
+    buf = file_obj.read()
+    return _LoadSizeInfoFromBufferV2(buf, offset, section_sizes, metadata,
+                                     size_path, string_cache)
+
   lines = iter(file_obj)
   next(lines)  # newline after closing } of json.
 
@@ -132,68 +414,62 @@ def _LoadSizeInfoFromFile(file_obj, size_path):
   sizes = read_numeric(delta=False)
   path_indices = read_numeric(delta=True)
 
-  raw_symbols = [None] * sum(section_counts)
-  symbol_idx = 0
-  for section_index, cur_section_name in enumerate(section_names):
-    alias_counter = 0
-    for i in xrange(section_counts[section_index]):
-      parts = next(lines)[:-1].split('\t')
-      flags_part = None
-      aliases_part = None
-
-      if len(parts) == 3:
+  num_symbols = sum(section_counts)
+  full_names = [None] * num_symbols
+  flags = [0] * num_symbols
+  num_aliases = [0] * num_symbols
+  for i in xrange(num_symbols):
+    parts = next(lines)[:-1].split('\t')
+    flags_part = None
+    aliases_part = None
+
+    if len(parts) == 3:
+      aliases_part = parts[1]
+      flags_part = parts[2]
+    elif len(parts) == 2:
+      if parts[1][0] == '0':
         aliases_part = parts[1]
-        flags_part = parts[2]
-      elif len(parts) == 2:
-        if parts[1][0] == '0':
-          aliases_part = parts[1]
-        else:
-          flags_part = parts[1]
-
-      full_name = parts[0]
-      flags = int(flags_part, 16) if flags_part else 0
-      num_aliases = int(aliases_part, 16) if aliases_part else 0
-
-      new_sym = models.Symbol.__new__(models.Symbol)
-      new_sym.section_name = cur_section_name
-      new_sym.address = addresses[section_index][i]
-      new_sym.size = sizes[section_index][i]
-      new_sym.full_name = full_name
-      paths = path_tuples[path_indices[section_index][i]]
-      new_sym.object_path = paths[0]
-      new_sym.source_path = paths[1]
-      new_sym.flags = flags
-      new_sym.padding = 0  # Derived
-      new_sym.template_name = ''  # Derived
-      new_sym.name = ''  # Derived
-
-      if num_aliases:
-        assert alias_counter == 0
-        new_sym.aliases = [new_sym]
-        alias_counter = num_aliases - 1
-      elif alias_counter > 0:
-        new_sym.aliases = raw_symbols[symbol_idx - 1].aliases
-        new_sym.aliases.append(new_sym)
-        alias_counter -= 1
       else:
-        new_sym.aliases = None
-
-      raw_symbols[symbol_idx] = new_sym
-      symbol_idx += 1
-
-  return models.SizeInfo(section_sizes, raw_symbols, metadata=metadata,
-                         size_path=size_path)
-
+        flags_part = parts[1]
+
+    full_names[i] = parts[0]
+    if flags_part:
+      flags[i] = int(flags_part, 16)
+    if aliases_part:
+      num_aliases[i] = int(aliases_part, 16)
+
+  path_tuples = [tuple(p) for p in path_tuples]
+  if string_cache is not None:
+    _InternStrings(full_names, path_tuples, string_cache)
+  table = models.SymbolTable(
+      zip(section_names, section_counts), itertools.chain(*addresses),
+      itertools.chain(*sizes), flags, path_tuples,
+      itertools.chain(*path_indices), full_names, num_aliases)
+  return models.SizeInfo(section_sizes, models.SymbolGroup(table.Symbols()),
+                         metadata=metadata, size_path=size_path)
+
+
+def SaveSizeInfo(size_info, path, format_version=1):
+  """Saves |size_info| to |path}.
+
+  Args:
+    format_version: 1 (default) writes the gzipped text format. 2 writes an
+        uncompressed binary file, which is several times larger than a v1 file
+        but loads much faster.
+  """
+  if format_version == 2:
+    with open(path, 'wb') as f:
+      _SaveSizeInfoToFileV2(size_info, f)
+    return
 
-def SaveSizeInfo(size_info, path):
-  """Saves |size_info| to |path}."""
+  assert format_version == 1, 'Unknown format version: %r' % format_version
   if os.environ.get('SUPERSIZE_MEASURE_GZIP') == '1':
     with gzip.open(path, 'wb') as f:
-      _SaveSizeInfoToFile(size_info, f)
+      _SaveSizeInfoToFileV1(size_info, f)
   else:
     # It is seconds faster to do gzip in a separate step. 6s -> 3.5s.
     stringio = cStringIO.StringIO()
-    _SaveSizeInfoToFile(size_info, stringio)
+    _SaveSizeInfoToFileV1(size_info, stringio)
 
     logging.debug('Serialization complete. Gzipping...')
     stringio.seek(0)
@@ -201,7 +477,17 @@ def SaveSizeInfo(size_info, path):
       shutil.copyfileobj(stringio, f)
 
 
-def LoadSizeInfo(path):
-  """Returns a SizeInfo loaded from |path|."""
+def LoadSizeInfo(path, string_cache=None):
+  """Returns a SizeInfo loaded from |path| (either format version).
+
+  Args:
+    string_cache: When loading several files, pass the same dict for each so
+        that they share equal names and paths.
+  """
+  with open(path, 'rb') as f:
+    is_gzipped = f.read(2) == _GZIP_MAGIC
+    if not is_gzipped:
+      f.seek(0)
+      return _LoadSizeInfoFromFileV2(f, path, string_cache)
   with gzip.open(path) as f:
-    return _LoadSizeInfoFromFile(f, path)
+    return _LoadSizeInfoFromFile(f, path, string_cache)
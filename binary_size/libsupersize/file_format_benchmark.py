@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# Copyright 2017 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Compares load times of .size file format versions.
+
+Creates a large synthetic SizeInfo, saves it in each format version, and then
+times file_format.LoadSizeInfo() for each of them.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import file_format
+import models
+
+
+_SECTION_NAMES = ('.text', '.rodata', '.data.rel.ro', '.data', '.bss')
+
+
+def _CreateSyntheticSizeInfo(num_symbols, num_paths):
+  rand = random.Random(0)
+  path_tuples = [('obj/dir%d/file%d.o' % (i % 97, i), 'dir%d/file%d.cc' % (
+      i % 97, i)) for i in xrange(num_paths)]
+  raw_symbols = []
+  per_section = num_symbols // len(_SECTION_NAMES)
+  for section_index, section_name in enumerate(_SECTION_NAMES):
+    address = 0x1000000 * (section_index + 1)
+    aliases = None
+    for i in xrange(per_section):
+      size = rand.randint(1, 400)
+      object_path, source_path = path_tuples[rand.randrange(num_paths)]
+      if aliases and len(aliases) < 3:
+        # Alias of previous symbol.
+        prev = raw_symbols[-1]
+        sym = models.Symbol(section_name, prev.size, address=prev.address,
+                            full_name='ns::Alias%d()' % i, aliases=aliases,
+                            object_path=object_path, source_path=source_path)
+        aliases.append(sym)
+      else:
+        aliases = [] if rand.random() < .1 else None
+        sym = models.Symbol(section_name, size, address=address,
+                            full_name='ns::Class%d::Method%d(int)' % (i, i),
+                            object_path=object_path, source_path=source_path,
+                            aliases=aliases)
+        address += size + rand.randint(0, 3)
+        if aliases is not None:
+          aliases.append(sym)
+      raw_symbols.append(sym)
+  section_sizes = {n: 0x1000000 for n in _SECTION_NAMES}
+  return models.SizeInfo(section_sizes, raw_symbols)
+
+
+def _TimeLoad(path, iterations):
+  best = None
+  for _ in xrange(iterations):
+    start = time.time()
+    size_info = file_format.LoadSizeInfo(path)
+    elapsed = time.time() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return best, len(size_info.raw_symbols)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--num-symbols', type=int, default=500000,
+                      help='Number of symbols in the synthetic archive.')
+  parser.add_argument('--num-paths', type=int, default=20000,
+                      help='Number of distinct object paths.')
+  parser.add_argument('--iterations', type=int, default=3,
+                      help='Number of loads per format (best is reported).')
+  args = parser.parse_args()
+
+  print 'Creating synthetic archive with %d symbols...' % args.num_symbols
+  size_info = _CreateSyntheticSizeInfo(args.num_symbols, args.num_paths)
+  temp_dir = tempfile.mkdtemp()
+  try:
+    for format_version in (1, 2):
+      path = os.path.join(temp_dir, 'v%d.size' % format_version)
+      start = time.time()
+      file_format.SaveSizeInfo(size_info, path, format_version=format_version)
+      save_time = time.time() - start
+      load_time, count = _TimeLoad(path, args.iterations)
+      print ('v%d: file size=%.1fmb save=%.2fs load=%.2fs (%d symbols)' % (
+          format_version, os.path.getsize(path) / 1024.0 / 1024, save_time,
+          load_time, count))
+  finally:
+    shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+  main()
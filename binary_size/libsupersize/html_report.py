@@ -5,6 +5,7 @@
 """Creates an html report that allows you to view binary size by component."""
 
 import argparse
+import collections
 import json
 import logging
 import os
@@ -30,6 +31,9 @@ _NODE_SYMBOL_TYPE_GENERATED = '*'
 _NODE_SYMBOL_SIZE_KEY = 'value'
 _NODE_MAX_DEPTH_KEY = 'maxDepth'
 _NODE_LAST_PATH_ELEMENT_KEY = 'lastPathElement'
+# Placeholders for subtrees that are stored in separate files.
+_NODE_SHARD_KEY = 'sh'
+_NODE_SHARD_STATS_KEY = 'ss'
 
 # The display name of the bucket where we put symbols without path.
 _NAME_NO_PATH_BUCKET = '(No Path)'
@@ -38,6 +42,10 @@ _NAME_NO_PATH_BUCKET = '(No Path)'
 # graphing lib.
 _BIG_BUCKET_LIMIT = 3000
 
+# When sharding, subtrees rooted at this depth are written to separate files.
+_SHARD_DEPTH = 2
+_SHARD_DIR_NAME = 'data'
+
 
 def _GetOrMakeChildNode(node, node_type, name):
   child = node[_NODE_CHILDREN_KEY].get(name)
@@ -112,6 +120,30 @@ def _AddSymbolIntoFileNode(node, symbol_type, symbol_name, symbol_size,
   node[_NODE_SYMBOL_TYPE_KEY] = symbol_type
 
 
+def _SymbolPathParts(symbol):
+  file_path = symbol.source_path or symbol.object_path or _NAME_NO_PATH_BUCKET
+  return [p for p in file_path.split(os.path.sep) if p]
+
+
+def _AddSymbolIntoTree(node, path_parts, symbol, include_symbols):
+  """Adds |symbol| beneath |node|.
+
+  Returns:
+    The depth of the added symbol node relative to |node|.
+  """
+  for path_part in path_parts:
+    node = _GetOrMakeChildNode(node, _NODE_TYPE_PATH, path_part)
+
+  symbol_type = symbol.section
+  if symbol.name.endswith('[vtable]'):
+    symbol_type = _NODE_SYMBOL_TYPE_VTABLE
+  elif symbol.name.endswith(']'):
+    symbol_type = _NODE_SYMBOL_TYPE_GENERATED
+  _AddSymbolIntoFileNode(node, symbol_type, symbol.template_name, symbol.pss,
+                         include_symbols)
+  return len(path_parts) + 2
+
+
 def _MakeCompactTree(symbols, include_symbols):
   result = {
       _NODE_NAME_KEY: '/',
@@ -120,23 +152,8 @@ def _MakeCompactTree(symbols, include_symbols):
       _NODE_MAX_DEPTH_KEY: 0,
   }
   for symbol in symbols:
-    file_path = symbol.source_path or symbol.object_path or _NAME_NO_PATH_BUCKET
-    node = result
-    depth = 0
-    for path_part in file_path.split(os.path.sep):
-      if not path_part:
-        continue
-      depth += 1
-      node = _GetOrMakeChildNode(node, _NODE_TYPE_PATH, path_part)
-
-    symbol_type = symbol.section
-    if symbol.name.endswith('[vtable]'):
-      symbol_type = _NODE_SYMBOL_TYPE_VTABLE
-    elif symbol.name.endswith(']'):
-      symbol_type = _NODE_SYMBOL_TYPE_GENERATED
-    _AddSymbolIntoFileNode(node, symbol_type, symbol.template_name, symbol.pss,
-                           include_symbols)
-    depth += 2
+    depth = _AddSymbolIntoTree(result, _SymbolPathParts(symbol), symbol,
+                               include_symbols)
     result[_NODE_MAX_DEPTH_KEY] = max(result[_NODE_MAX_DEPTH_KEY], depth)
 
   # The (no path) bucket can be extremely large if we failed to get
@@ -150,6 +167,94 @@ def _MakeCompactTree(symbols, include_symbols):
   return result
 
 
+def _AccumulateSymbolStats(node, stats):
+  """Adds the count and size of each symbol type beneath |node| to |stats|."""
+  children = node.get(_NODE_CHILDREN_KEY)
+  if children is None:
+    type_stats = stats.get(node[_NODE_SYMBOL_TYPE_KEY])
+    if type_stats is None:
+      type_stats = {'count': 0, 'size': 0}
+      stats[node[_NODE_SYMBOL_TYPE_KEY]] = type_stats
+    type_stats['count'] += 1
+    type_stats['size'] += node[_NODE_SYMBOL_SIZE_KEY]
+  else:
+    for child in children:
+      _AccumulateSymbolStats(child, stats)
+
+
+def _WriteShard(shard_dir, shard_id, children):
+  path = os.path.join(shard_dir, '%d.js' % shard_id)
+  with open(path, 'w') as out_file:
+    out_file.write('loadTreeShard(%d,' % shard_id)
+    json.dump(children, out_file, ensure_ascii=False, check_circular=False,
+              separators=(',', ':'))
+    out_file.write(');')
+
+
+def _MakeShardedTree(symbols, include_symbols, shard_dir):
+  """Like _MakeCompactTree(), but writes subtrees to separate files.
+
+  Subtrees rooted _SHARD_DEPTH levels deep are built one at a time and written
+  to |shard_dir|. In the returned tree, each one is replaced by a placeholder
+  leaf that the viewer loads on demand. Symbols of shorter paths are put in a
+  subtree of their own as well, unless their path node also has descendants
+  from deeper paths, in which case they are added to the returned tree.
+  """
+  result = {
+      _NODE_NAME_KEY: '/',
+      _NODE_CHILDREN_KEY: {},
+      _NODE_TYPE_KEY: 'p',
+      _NODE_MAX_DEPTH_KEY: 0,
+  }
+  symbols_by_shard_path = collections.defaultdict(list)
+  for symbol in symbols:
+    shard_path = (tuple(_SymbolPathParts(symbol)[:_SHARD_DEPTH]) or
+                  (_NAME_NO_PATH_BUCKET,))
+    symbols_by_shard_path[shard_path].append(symbol)
+
+  # E.g. symbols of "foo" when there are also symbols of "foo/bar/baz.cc".
+  # Placeholders cannot have children, so add these without sharding.
+  parent_paths = set(shard_path[:i] for shard_path in symbols_by_shard_path
+                     for i in xrange(1, len(shard_path)))
+  for shard_path in sorted(parent_paths.intersection(symbols_by_shard_path)):
+    for symbol in symbols_by_shard_path.pop(shard_path):
+      depth = _AddSymbolIntoTree(result, _SymbolPathParts(symbol), symbol,
+                                 include_symbols)
+      result[_NODE_MAX_DEPTH_KEY] = max(result[_NODE_MAX_DEPTH_KEY], depth)
+
+  for shard_id, shard_path in enumerate(sorted(symbols_by_shard_path)):
+    shard_root = {_NODE_CHILDREN_KEY: {}}
+    max_depth = 0
+    for symbol in symbols_by_shard_path.pop(shard_path):
+      path_parts = _SymbolPathParts(symbol)[len(shard_path):]
+      depth = _AddSymbolIntoTree(shard_root, path_parts, symbol,
+                                 include_symbols)
+      max_depth = max(max_depth, depth)
+    if shard_path == (_NAME_NO_PATH_BUCKET,) and include_symbols:
+      _SplitLargeBucket(shard_root)
+    _MakeChildrenDictsIntoLists(shard_root)
+    _WriteShard(shard_dir, shard_id, shard_root[_NODE_CHILDREN_KEY])
+
+    stats = {}
+    _AccumulateSymbolStats(shard_root, stats)
+    node = result
+    for path_part in shard_path:
+      node = _GetOrMakeChildNode(node, _NODE_TYPE_PATH, path_part)
+    del node[_NODE_CHILDREN_KEY]
+    if shard_root.get(_NODE_LAST_PATH_ELEMENT_KEY):
+      node[_NODE_LAST_PATH_ELEMENT_KEY] = True
+    node[_NODE_SHARD_KEY] = shard_id
+    node[_NODE_SHARD_STATS_KEY] = stats
+    node[_NODE_SYMBOL_SIZE_KEY] = sum(s['size'] for s in stats.itervalues())
+    # Placeholders are drawn using the color of their largest symbol type.
+    node[_NODE_SYMBOL_TYPE_KEY] = max(stats, key=lambda t: stats[t]['size'])
+    result[_NODE_MAX_DEPTH_KEY] = max(result[_NODE_MAX_DEPTH_KEY],
+                                      len(shard_path) + max_depth)
+
+  _MakeChildrenDictsIntoLists(result)
+  return result
+
+
 def _CopyTemplateFiles(dest_dir):
   d3_out = os.path.join(dest_dir, 'd3')
   if not os.path.exists(d3_out):
@@ -173,6 +278,10 @@ def AddArguments(parser):
                            'space)')
   parser.add_argument('--include-symbols', action='store_true',
                       help='Use per-symbol granularity rather than per-file.')
+  parser.add_argument('--sharded', action='store_true',
+                      help='Write the tree as per-directory files that are '
+                           'loaded on demand. Makes large reports (e.g. with '
+                           '--include-symbols) faster to create and to open.')
 
 
 def Run(args, parser):
@@ -191,8 +300,15 @@ def Run(args, parser):
   # the nm.out file later.
   _CopyTemplateFiles(args.report_dir)
 
-  logging.info('Creating JSON objects')
-  tree_root = _MakeCompactTree(symbols, args.include_symbols)
+  if args.sharded:
+    logging.info('Creating and writing JSON shards')
+    shard_dir = os.path.join(args.report_dir, _SHARD_DIR_NAME)
+    if not os.path.exists(shard_dir):
+      os.makedirs(shard_dir)
+    tree_root = _MakeShardedTree(symbols, args.include_symbols, shard_dir)
+  else:
+    logging.info('Creating JSON objects')
+    tree_root = _MakeCompactTree(symbols, args.include_symbols)
 
   logging.info('Serializing JSON')
   with open(os.path.join(args.report_dir, 'data.js'), 'w') as out_file:
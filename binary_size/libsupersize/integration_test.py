@@ -3,15 +3,18 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import collections
 import contextlib
 import copy
 import difflib
 import glob
 import itertools
+import json
 import logging
 import os
 import unittest
 import re
+import shutil
 import subprocess
 import sys
 import tempfile
@@ -20,6 +23,7 @@ import archive
 import describe
 import diff
 import file_format
+import html_report
 import models
 
 
@@ -94,6 +98,39 @@ def _DiffCounts(sym):
           counts[models.DIFF_STATUS_REMOVED])
 
 
+def _ExpandShards(node, shard_dir):
+  """Replaces the placeholders beneath |node| with the shards they refer to.
+
+  Returns:
+    The (count, size) of each symbol type beneath |node|.
+  """
+  stats = collections.defaultdict(lambda: {'count': 0, 'size': 0})
+  if 'sh' in node:
+    with open(os.path.join(shard_dir, '%d.js' % node['sh'])) as shard_file:
+      prefix = 'loadTreeShard(%d,' % node['sh']
+      data = shard_file.read()
+    assert data.startswith(prefix) and data.endswith(');')
+    node['children'] = json.loads(data[len(prefix):-2])
+    expected_stats = node.pop('ss')
+    expected_size = node.pop('value')
+    del node['sh']
+    del node['t']
+  else:
+    expected_stats = None
+  if 'children' in node:
+    for child in node['children']:
+      for t, type_stats in _ExpandShards(child, shard_dir).iteritems():
+        stats[t]['count'] += type_stats['count']
+        stats[t]['size'] += type_stats['size']
+    node['children'].sort(key=lambda child: (child['n'], child['k']))
+  else:
+    stats[node['t']] = {'count': 1, 'size': node['value']}
+  if expected_stats is not None:
+    assert expected_stats == stats, (expected_stats, stats)
+    assert expected_size == sum(s['size'] for s in stats.itervalues())
+  return stats
+
+
 class IntegrationTest(unittest.TestCase):
   maxDiff = None  # Don't trucate diffs in errors.
   cached_size_info = [None, None, None]
@@ -162,6 +199,132 @@ class IntegrationTest(unittest.TestCase):
   def test_Archive_Elf_DebugMeasures(self):
     return self._DoArchiveTest(debug_measures=True)
 
+  def test_FileFormatVersions(self):
+    size_info = self._CloneSizeInfo()
+    size_info.symbols = size_info.raw_symbols
+    expected = list(describe.GenerateLines(size_info, verbose=True))
+    for format_version in (1, 2):
+      with tempfile.NamedTemporaryFile(suffix='.size') as temp_file:
+        file_format.SaveSizeInfo(size_info, temp_file.name,
+                                 format_version=format_version)
+        loaded_size_info = archive.LoadAndPostProcessSizeInfo(temp_file.name)
+      loaded_size_info.symbols = loaded_size_info.raw_symbols
+      actual = list(describe.GenerateLines(loaded_size_info, verbose=True))
+      self.assertEquals(expected, actual)
+
+  def test_FileFormatVersions_NoInt64Arrays(self):
+    # Where array('l') is 32 bits wide, 64-bit columns are encoded without
+    # arrays. Addresses must still round-trip.
+    size_info = self._CloneSizeInfo()
+    for symbol in size_info.raw_symbols:
+      if symbol.address:
+        symbol.address += 1 << 40
+    size_info.symbols = size_info.raw_symbols
+    expected = list(describe.GenerateLines(size_info, verbose=True))
+    orig_array_type_code = file_format._ArrayTypeCode
+    orig_address_array_type = models._ADDRESS_ARRAY_TYPE
+    file_format._ArrayTypeCode = (
+        lambda width: None if width == 8 else orig_array_type_code(width))
+    models._ADDRESS_ARRAY_TYPE = None
+    try:
+      with tempfile.NamedTemporaryFile(suffix='.size') as temp_file:
+        file_format.SaveSizeInfo(size_info, temp_file.name, format_version=2)
+        loaded_size_info = archive.LoadAndPostProcessSizeInfo(temp_file.name)
+    finally:
+      file_format._ArrayTypeCode = orig_array_type_code
+      models._ADDRESS_ARRAY_TYPE = orig_address_array_type
+    loaded_size_info.symbols = loaded_size_info.raw_symbols
+    actual = list(describe.GenerateLines(loaded_size_info, verbose=True))
+    self.assertEquals(expected, actual)
+    self.assertIsInstance(loaded_size_info.raw_symbols[0]._table.addresses,
+                          list)
+
+  def test_NormalizeNames_Parallel(self):
+    # Forked jobs return names joined with '\x01'. Ensure that splitting them
+    # up again gives the same names as normalizing serially.
+    def names(size_info):
+      return [(s.full_name, s.template_name, s.name, s.flags)
+              for s in size_info.raw_symbols]
+
+    with tempfile.NamedTemporaryFile(suffix='.size') as temp_file:
+      file_format.SaveSizeInfo(self._CloneSizeInfo(), temp_file.name)
+      expected = names(archive.LoadAndPostProcessSizeInfo(temp_file.name))
+      orig_min_symbols = archive._MIN_SYMBOLS_PER_NORMALIZE_JOB
+      orig_cpu_count = archive.multiprocessing.cpu_count
+      archive._MIN_SYMBOLS_PER_NORMALIZE_JOB = 1
+      archive.multiprocessing.cpu_count = lambda: 4
+      try:
+        actual = names(archive.LoadAndPostProcessSizeInfo(
+            temp_file.name, string_cache={}))
+      finally:
+        archive._MIN_SYMBOLS_PER_NORMALIZE_JOB = orig_min_symbols
+        archive.multiprocessing.cpu_count = orig_cpu_count
+    self.assertEquals(expected, actual)
+
+  def test_SymbolTable(self):
+    # Loaded SizeInfos store symbols in a SymbolTable. Ensure that groups
+    # backed by one behave the same as those backed by lists.
+    list_size_info = self._CloneSizeInfo()
+    with tempfile.NamedTemporaryFile(suffix='.size') as temp_file:
+      file_format.SaveSizeInfo(list_size_info, temp_file.name)
+      list_size_info = archive.LoadAndPostProcessSizeInfo(temp_file.name)
+      table_size_info = archive.LoadAndPostProcessSizeInfo(temp_file.name)
+    list_syms = models.SymbolGroup(list(list_size_info.raw_symbols))
+    table_syms = table_size_info.raw_symbols
+
+    def check(func):
+      expected = func(list_syms)
+      actual = func(table_syms)
+      self.assertEquals([repr(s) for s in expected], [repr(s) for s in actual])
+      self.assertEquals(expected.size, actual.size)
+      self.assertEquals(expected.pss, actual.pss)
+      self.assertEquals(expected.padding, actual.padding)
+      self.assertEquals(len(expected.Inverted()), len(actual.Inverted()))
+
+    check(lambda syms: syms)
+    check(lambda syms: syms.WhereInSection('t'))
+    check(lambda syms: syms.WhereInSection('.bss'))
+    check(lambda syms: syms.WherePathMatches('third_party'))
+    check(lambda syms: syms.WhereMatches('foo'))
+    check(lambda syms: syms.WhereNameMatches('GLOBAL'))
+    check(lambda syms: syms.WhereIsTemplate())
+    check(lambda syms: syms.WhereSizeBiggerThan(100))
+    check(lambda syms: syms.WhereAddressInRange(0x2a0000, 0x2a1000))
+    check(lambda syms: syms.Filter(lambda s: s.num_aliases > 1))
+    check(lambda syms: syms.Sorted())
+    check(lambda syms: syms.WhereInSection('r') + syms.WhereInSection('t'))
+    check(lambda syms: syms - syms.WhereInSection('t'))
+    check(lambda syms: syms[3:10])
+
+    sym = table_syms[5]
+    self.assertIn(sym, table_syms)
+    self.assertEquals(5, table_syms.index(sym))
+    self.assertNotIn(sym, table_syms - [sym])
+
+    # Cached query results must not outlive changes to names.
+    self.assertEquals(0, len(table_syms.WhereFullNameMatches('RenamedFor')))
+    sym.full_name = 'RenamedForTest'
+    self.assertEquals([sym],
+                      list(table_syms.WhereFullNameMatches('RenamedFor')))
+    self.assertEquals([sym], list(table_syms.WhereMatches('(?i)renamedfor')))
+
+  def test_SymbolTable_PathChanges(self):
+    table = models.SymbolTable(
+        [('.text', 3)], [0, 10, 20], [10, 10, 10], [0, 0, 0],
+        [('a.o', 'x.cc'), ('b.o', 'x.cc')], [0, 0, 1], ['x', 'y', 'z'],
+        [0, 0, 0])
+    syms = models.SymbolGroup(table.Symbols())
+    self.assertEquals(['z'], [s.full_name
+                              for s in syms.WhereObjectPathMatches(r'b\.o')])
+    # Moves the symbol to an existing path tuple, so no new tuple is interned.
+    syms[0].object_path = 'b.o'
+    self.assertEquals(['x', 'z'],
+                      [s.full_name
+                       for s in syms.WhereObjectPathMatches(r'b\.o')])
+    syms[2].source_path = 'y.cc'
+    self.assertEquals(['z'], [s.full_name
+                              for s in syms.WhereSourcePathMatches(r'y\.cc')])
+
   @_CompareWithGolden()
   def test_Console(self):
     with tempfile.NamedTemporaryFile(suffix='.size') as size_file, \
@@ -296,6 +459,140 @@ class IntegrationTest(unittest.TestCase):
                       0)
     self.assertEquals(d.symbols.size, 0)
 
+  def test_Diff_TableBacked(self):
+    size_info1 = self._CloneSizeInfo()
+    size_info2 = self._CloneSizeInfo()
+    size_info2.raw_symbols -= size_info2.raw_symbols.WhereInSection('r')
+    with tempfile.NamedTemporaryFile(suffix='.size') as temp_file1:
+      with tempfile.NamedTemporaryFile(suffix='.size') as temp_file2:
+        file_format.SaveSizeInfo(size_info1, temp_file1.name)
+        file_format.SaveSizeInfo(size_info2, temp_file2.name)
+        table_size_info1 = archive.LoadAndPostProcessSizeInfo(temp_file1.name)
+        table_size_info2 = archive.LoadAndPostProcessSizeInfo(temp_file2.name)
+    list_size_info1 = models.SizeInfo(
+        table_size_info1.section_sizes, list(table_size_info1.raw_symbols),
+        metadata=table_size_info1.metadata)
+    list_size_info2 = models.SizeInfo(
+        table_size_info2.section_sizes, list(table_size_info2.raw_symbols),
+        metadata=table_size_info2.metadata)
+
+    def describe_diff(before, after):
+      d = diff.Diff(before, after)
+      d.symbols = d.symbols.Sorted()
+      return list(describe.GenerateLines(d, verbose=True))
+
+    expected = describe_diff(list_size_info1, list_size_info2)
+    self.assertEquals(expected,
+                      describe_diff(table_size_info1, table_size_info2))
+    self.assertEquals(expected,
+                      describe_diff(table_size_info1, table_size_info2))
+    # Cached keys must not outlive changes to names.
+    sym = table_size_info1.raw_symbols[0]
+    sym.full_name = 'RenamedForTest.isra.1'
+    keys = diff._GetSymbolKeys(table_size_info1)
+    self.assertEquals(diff._SymbolKeys(table_size_info1.raw_symbols), keys)
+    self.assertEquals((sym.section, 'RenamedForTestisra', sym.object_path),
+                      keys[0])
+
+  def test_Timeline(self):
+    size_info1 = self._CloneSizeInfo()
+    size_info2 = self._CloneSizeInfo()
+    size_info2.raw_symbols -= size_info2.raw_symbols.WhereInSection('r')
+    size_info2.section_sizes['.rodata'] -= 100
+    with tempfile.NamedTemporaryFile(suffix='.size') as temp_file1:
+      with tempfile.NamedTemporaryFile(suffix='.size') as temp_file2:
+        file_format.SaveSizeInfo(size_info1, temp_file1.name)
+        file_format.SaveSizeInfo(size_info2, temp_file2.name)
+        paths = [temp_file1.name, temp_file2.name, temp_file1.name]
+        entries = json.loads('\n'.join(
+            _RunApp('timeline', paths + ['--format', 'json'])))
+        csv_lines = _RunApp('timeline', paths)
+        string_cache = {}
+        loaded1 = archive.LoadAndPostProcessSizeInfo(
+            paths[0], string_cache=string_cache)
+        loaded2 = archive.LoadAndPostProcessSizeInfo(
+            paths[1], string_cache=string_cache)
+
+    # Names and paths are shared between SizeInfos that use the same cache.
+    sym1 = loaded1.raw_symbols.WhereInSection('t')[0]
+    sym2 = loaded2.raw_symbols.WhereInSection('t')[0]
+    self.assertIs(sym1.full_name, sym2.full_name)
+    self.assertIs(sym1.name, sym2.name)
+    self.assertIs(sym1.object_path, sym2.object_path)
+
+    self.assertEquals(2, len(entries))
+    self.assertEquals(paths[:2], [entries[0]['before'], entries[0]['after']])
+    self.assertEquals({'.rodata': -100}, entries[0]['sections'])
+    self.assertTrue(entries[0]['components'])
+    # The second pair undoes the first.
+    for kind in ('sections', 'components'):
+      self.assertEquals({k: -v for k, v in entries[0][kind].iteritems()},
+                        entries[1][kind])
+    self.assertEquals('before,after,kind,name,delta', csv_lines[0])
+    num_deltas = sum(len(e[kind]) for e in entries
+                     for kind in ('sections', 'components'))
+    self.assertEquals(num_deltas, len(csv_lines) - 1)
+
+  def test_StringCache(self):
+    raw_symbols = [
+        models.Symbol('.text', 10, address=0x1000,
+                      full_name='ns::Foo<int>::Bar(int)',
+                      object_path='obj/a/foo.o', source_path='../../a/foo.cc'),
+        models.Symbol('.text', 20, address=0x1010, full_name='Baz()',
+                      object_path='obj/a/baz.o', source_path='../../a/baz.cc'),
+    ]
+    size_info = models.SizeInfo({'.text': 30}, raw_symbols)
+    with tempfile.NamedTemporaryFile(suffix='.size') as temp_file:
+      file_format.SaveSizeInfo(size_info, temp_file.name)
+      string_cache = {}
+      loaded1 = archive.LoadAndPostProcessSizeInfo(
+          temp_file.name, string_cache=string_cache)
+      loaded2 = archive.LoadAndPostProcessSizeInfo(
+          temp_file.name, string_cache=string_cache)
+
+    # Names are shared even though normalizing them creates new strings.
+    for sym1, sym2 in zip(loaded1.raw_symbols, loaded2.raw_symbols):
+      self.assertIs(sym1.full_name, sym2.full_name)
+      self.assertIs(sym1.template_name, sym2.template_name)
+      self.assertIs(sym1.name, sym2.name)
+      self.assertIs(sym1.object_path, sym2.object_path)
+      self.assertIs(sym1.source_path, sym2.source_path)
+    self.assertEquals('ns::Foo<int>::Bar', loaded1.raw_symbols[0].template_name)
+    self.assertEquals('ns::Foo::Bar', loaded1.raw_symbols[0].name)
+
+  def _CheckShardedHtmlReport(self, symbols):
+    # Once the shards are loaded, the tree must be the same as an unsharded one.
+    for include_symbols in (False, True):
+      expected = html_report._MakeCompactTree(symbols, include_symbols)
+      _ExpandShards(expected, None)
+      shard_dir = tempfile.mkdtemp()
+      try:
+        actual = html_report._MakeShardedTree(symbols, include_symbols,
+                                              shard_dir)
+        self.assertTrue(os.listdir(shard_dir))
+        _ExpandShards(actual, shard_dir)
+      finally:
+        shutil.rmtree(shard_dir)
+      self.assertEquals(expected, actual)
+
+  def test_HtmlReport_Sharded(self):
+    self._CheckShardedHtmlReport(self._CloneSizeInfo().raw_symbols)
+
+  def test_HtmlReport_Sharded_NestedPaths(self):
+    def make_symbol(path, name, size):
+      return models.Symbol('.text', size, full_name=name, template_name=name,
+                           name=name, source_path=path)
+    # "foo" is both a file, and a directory with deeper files in it.
+    self._CheckShardedHtmlReport(models.SymbolGroup([
+        make_symbol('foo/bar/baz.cc', 'Baz()', 10),
+        make_symbol('foo', 'Foo()', 20),
+        make_symbol('foo/bar/qux/quux.cc', 'Quux()', 30),
+        make_symbol('foo/other.cc', 'Other()', 40),
+        make_symbol('foo/bar', 'Bar()', 50),
+        make_symbol('top.cc', 'Top()', 60),
+        make_symbol('', 'NoPath()', 70),
+    ]))
+
   @_CompareWithGolden()
   def test_FullDescription(self):
     size_info = self._CloneSizeInfo()
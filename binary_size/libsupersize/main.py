@@ -18,6 +18,7 @@ import sys
 import archive
 import console
 import html_report
+import timeline
 
 
 def _LogPeakRamUsage():
@@ -77,6 +78,10 @@ def main():
       _DiffAction(),
       'Shorthand for console --query "Print(Diff())" (plus highlights static '
       'initializers in diff)')
+  actions['timeline'] = (
+      timeline,
+      'Writes section and component size deltas for each consecutive pair of '
+      '.size files (as CSV or JSON).')
 
   for name, tup in actions.iteritems():
     sub_parser = sub_parsers.add_parser(name, help=tup[1])
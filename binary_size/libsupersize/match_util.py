@@ -5,6 +5,8 @@
 """Regular expression helpers."""
 
 import re
+import sre_constants
+import sre_parse
 
 
 def _CreateIdentifierRegex(parts):
@@ -56,3 +58,59 @@ def ExpandRegexIdentifierPlaceholder(pattern):
   return re.sub(r'\{\{(.*?)\}\}',
                 lambda m: _CreateIdentifierRegex(m.group(1).split('_')),
                 pattern)
+
+
+
+def _FlattenGroups(items):
+  """Yields parsed regex items, inlining the contents of non-branching groups.
+
+  Groups that are not repeated must match exactly once, so their contents can
+  be treated as part of the surrounding sequence.
+  """
+  for op, av in items:
+    if op == sre_constants.SUBPATTERN:
+      sub_items = list(av[-1])
+      if not any(o == sre_constants.BRANCH for o, _ in sub_items):
+        for item in _FlattenGroups(sub_items):
+          yield item
+        continue
+    yield op, av
+
+
+def _LongestLiteral(items):
+  """Returns the longest run of literal characters within parsed |items|."""
+  longest = ''
+  current = []
+  for op, av in _FlattenGroups(items):
+    if op == sre_constants.LITERAL and av < 256:
+      current.append(chr(av))
+    else:
+      if len(current) > len(longest):
+        longest = ''.join(current)
+      current = []
+  if len(current) > len(longest):
+    longest = ''.join(current)
+  return longest
+
+
+def FindRequiredLiterals(regex):
+  """Returns a list of strings, one of which is present in any match of |regex|.
+
+  Used to narrow down which strings a regex needs to be run on. Returns None if
+  no such strings could be found (e.g. for r'a*|b').
+
+  Literals are returned as they appear in the pattern, even when |regex| is
+  case-insensitive.
+  """
+  items = list(sre_parse.parse(regex.pattern, regex.flags))
+  if len(items) == 1 and items[0][0] == sre_constants.BRANCH:
+    alternatives = items[0][1][1]
+  else:
+    alternatives = [items]
+  ret = []
+  for alternative in alternatives:
+    literal = _LongestLiteral(alternative)
+    if not literal:
+      return None
+    ret.append(literal)
+  return ret
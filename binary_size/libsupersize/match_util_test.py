@@ -64,6 +64,21 @@ class MatchHelperTest(unittest.TestCase):
     self.assertFalse(matches(r'{{_hello_world_}}', 'foohello/world'))
     self.assertFalse(matches(r'{{_hello_world_}}', '1HELLO_WORLD'))
 
+  def testFindRequiredLiterals(self):
+    def literals(pattern):
+      return match_util.FindRequiredLiterals(re.compile(pattern))
+
+    self.assertEquals(['hello'], literals(r'hello'))
+    self.assertEquals(['world'], literals(r'^hi.*world$'))
+    self.assertEquals(['abcdef'], literals(r'ab(cd)ef'))
+    self.assertEquals(['ab'], literals(r'ab(?:cd)?ef'))
+    self.assertEquals(['WebRTC'], literals(r'(?i)WebRTC'))
+    self.assertEquals(['foo', 'bar'], literals(r'foo|ba+bar'))
+    self.assertEquals(['x.y'], literals(r'x\.y'))
+    self.assertIsNone(literals(r'foo|.*'))
+    self.assertIsNone(literals(r'a*'))
+    self.assertIsNone(literals(r'[ab]'))
+
 
 if __name__ == '__main__':
   unittest.main()
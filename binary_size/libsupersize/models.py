@@ -5,6 +5,10 @@
 
 The primary classes are Symbol, and SymbolGroup.
 
+Symbols loaded from .size files are stored within a SymbolTable (parallel
+arrays of fields) and are exposed as TableSymbol objects, which are created on
+demand. SymbolGroups of such symbols store only indices into the table.
+
 Description of common properties:
   * address: The start address of the symbol.
         May be 0 (e.g. for .bss or for SymbolGroups).
@@ -26,12 +30,16 @@ Description of common properties:
   * section: The second character of |section_name|. E.g. "t", "r", "d".
 """
 
+import array
 import collections
+import itertools
 import logging
+import operator
 import os
 import re
 
 import match_util
+import query_index
 
 
 METADATA_GIT_REVISION = 'git_revision'
@@ -58,6 +66,10 @@ SECTION_NAME_TO_SECTION = {
     SECTION_NAME_MULTIPLE: '*',
 }
 
+# Addresses do not fit in 32 bits, and array('l') is only 32 bits wide on some
+# platforms (e.g. Windows). Fall back to a list there.
+_ADDRESS_ARRAY_TYPE = 'l' if array.array('l').itemsize >= 8 else None
+
 SECTION_TO_SECTION_NAME = collections.OrderedDict((
     ('t', '.text'),
     ('r', '.rodata'),
@@ -101,6 +113,8 @@ class SizeInfo(object):
       '_symbols',
       'metadata',
       'size_path',
+      # Used by diff.py to cache the normalized names of raw_symbols.
+      '_diff_normalized_names',
   )
 
   """Root size information."""
@@ -113,6 +127,7 @@ class SizeInfo(object):
     self._symbols = symbols
     self.metadata = metadata or {}
     self.size_path = size_path
+    self._diff_normalized_names = None
 
   @property
   def symbols(self):
@@ -308,6 +323,293 @@ class Symbol(BaseSymbol):
     return float(self.padding) / self.num_aliases
 
 
+class SymbolTable(object):
+  """Stores the fields of many symbols as parallel arrays.
+
+  Uses a fraction of the memory of an equivalent list of Symbol objects, since
+  numeric fields are not stored as Python ints, and since paths are stored as
+  indices into a table of unique (object_path, source_path) tuples.
+
+  Aliases must be adjacent to one another within the table.
+  """
+  __slots__ = (
+      'addresses',
+      'sizes',
+      'paddings',
+      'flags',
+      'section_ids',
+      'section_names',
+      'path_ids',
+      'path_tuples',
+      '_path_ids_by_tuple',
+      'full_names',
+      'template_names',
+      'names',
+      'alias_starts',
+      'alias_counts',
+      '_alias_lists',
+      'query_index',
+  )
+
+  def __init__(self, section_names_and_counts, addresses, sizes, flags,
+               path_tuples, path_ids, full_names, num_aliases):
+    """Constructor.
+
+    Args:
+      section_names_and_counts: List of (section_name, num_symbols). Symbols
+          are ordered by section.
+      addresses, sizes, flags, path_ids, full_names: Per-symbol values.
+      path_tuples: List of unique (object_path, source_path).
+      num_aliases: Per-symbol values where the first symbol of each alias group
+          holds the size of the group, and all other symbols hold 0.
+    """
+    self.addresses = _AddressArray(addresses)
+    count = len(self.addresses)
+    self.sizes = array.array('l', sizes)
+    self.paddings = array.array('l', [0]) * count
+    self.flags = array.array('i', flags)
+    self.section_names = [name for name, _ in section_names_and_counts]
+    self.section_ids = array.array('B')
+    for section_id, (_, section_count) in enumerate(section_names_and_counts):
+      self.section_ids.extend(array.array('B', [section_id]) * section_count)
+    self.path_tuples = list(path_tuples)
+    self._path_ids_by_tuple = None
+    self.path_ids = array.array('i', path_ids)
+    self.full_names = full_names
+    self.template_names = [''] * count
+    self.names = [''] * count
+    self.alias_starts = array.array('i', [-1]) * count
+    self.alias_counts = array.array('i', [0]) * count
+    self._alias_lists = {}
+    # Created on demand by GetQueryIndex(), and cleared when names or paths
+    # change.
+    self.query_index = None
+    i = 0
+    while i < count:
+      group_size = num_aliases[i]
+      if group_size:
+        self.alias_counts[i] = group_size
+        self.alias_starts[i:i + group_size] = (
+            array.array('i', [i]) * group_size)
+        i += group_size
+      else:
+        i += 1
+    assert len(self.section_ids) == count
+
+  def __len__(self):
+    return len(self.addresses)
+
+  def Symbols(self):
+    """Returns a sequence of all symbols, usable as SymbolGroup._symbols."""
+    return _TableSymbolList(self, array.array('i', xrange(len(self))))
+
+  def InternPath(self, path_tuple):
+    """Returns the path id for the given (object_path, source_path)."""
+    if self._path_ids_by_tuple is None:
+      self._path_ids_by_tuple = {
+          t: i for i, t in enumerate(self.path_tuples)}
+    ret = self._path_ids_by_tuple.get(path_tuple)
+    if ret is None:
+      ret = len(self.path_tuples)
+      self.path_tuples.append(path_tuple)
+      self._path_ids_by_tuple[path_tuple] = ret
+      self.query_index = None
+    return ret
+
+  def GetQueryIndex(self):
+    """Returns a QueryIndex, which is cached until names or paths change."""
+    if self.query_index is None:
+      self.query_index = query_index.QueryIndex(self)
+    return self.query_index
+
+  def InternSectionName(self, section_name):
+    try:
+      return self.section_names.index(section_name)
+    except ValueError:
+      self.section_names.append(section_name)
+      return len(self.section_names) - 1
+
+  def Aliases(self, index):
+    """Returns the list of aliases for the given symbol (or None).
+
+    Lists are created on first use and are then shared by all members.
+    """
+    start = self.alias_starts[index]
+    if start < 0:
+      return None
+    ret = self._alias_lists.get(start)
+    if ret is None:
+      ret = [TableSymbol(self, i)
+             for i in xrange(start, start + self.alias_counts[start])]
+      self._alias_lists[start] = ret
+    return ret
+
+  def NumAliases(self, index):
+    start = self.alias_starts[index]
+    if start < 0:
+      return 1
+    alias_list = self._alias_lists.get(start)
+    if alias_list is not None:
+      return len(alias_list)
+    return self.alias_counts[start]
+
+  def FieldGetter(self, field):
+    """Returns a function that maps a symbol index to the value of |field|."""
+    if field == 'object_path':
+      return lambda i: self.path_tuples[self.path_ids[i]][0]
+    if field == 'source_path':
+      return lambda i: self.path_tuples[self.path_ids[i]][1]
+    if field == 'section_name':
+      return lambda i: self.section_names[self.section_ids[i]]
+    if field == 'section':
+      sections = [SECTION_NAME_TO_SECTION.get(n, n) for n in self.section_names]
+      return lambda i: sections[self.section_ids[i]]
+    if field == 'size_without_padding':
+      return lambda i: self.sizes[i] - self.paddings[i]
+    column = {
+        'address': self.addresses,
+        'size': self.sizes,
+        'padding': self.paddings,
+        'flags': self.flags,
+        'full_name': self.full_names,
+        'template_name': self.template_names,
+        'name': self.names,
+    }[field]
+    return column.__getitem__
+
+
+class TableSymbol(BaseSymbol):
+  """A Symbol whose fields are stored within a SymbolTable.
+
+  Instances are created on demand and are not unique per symbol, so compare
+  them with == rather than "is".
+
+  Refer to module docs for field descriptions.
+  """
+
+  __slots__ = (
+      '_table',
+      '_index',
+  )
+
+  def __init__(self, table, index):
+    self._table = table
+    self._index = index
+
+  def __eq__(self, other):
+    return (isinstance(other, TableSymbol) and self._table is other._table and
+            self._index == other._index)
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __hash__(self):
+    return hash((id(self._table), self._index))
+
+  __repr__ = Symbol.__repr__.im_func
+  pss = Symbol.pss
+  pss_without_padding = Symbol.pss_without_padding
+  padding_pss = Symbol.padding_pss
+
+  @property
+  def address(self):
+    return self._table.addresses[self._index]
+
+  @address.setter
+  def address(self, value):
+    self._table.addresses[self._index] = value
+
+  @property
+  def size(self):
+    return self._table.sizes[self._index]
+
+  @size.setter
+  def size(self, value):
+    self._table.sizes[self._index] = value
+
+  @property
+  def padding(self):
+    return self._table.paddings[self._index]
+
+  @padding.setter
+  def padding(self, value):
+    self._table.paddings[self._index] = value
+
+  @property
+  def flags(self):
+    return self._table.flags[self._index]
+
+  @flags.setter
+  def flags(self, value):
+    self._table.flags[self._index] = value
+
+  @property
+  def section_name(self):
+    return self._table.section_names[self._table.section_ids[self._index]]
+
+  @section_name.setter
+  def section_name(self, value):
+    self._table.section_ids[self._index] = (
+        self._table.InternSectionName(value))
+
+  @property
+  def full_name(self):
+    return self._table.full_names[self._index]
+
+  @full_name.setter
+  def full_name(self, value):
+    self._table.full_names[self._index] = value
+    self._table.query_index = None
+
+  @property
+  def template_name(self):
+    return self._table.template_names[self._index]
+
+  @template_name.setter
+  def template_name(self, value):
+    self._table.template_names[self._index] = value
+    self._table.query_index = None
+
+  @property
+  def name(self):
+    return self._table.names[self._index]
+
+  @name.setter
+  def name(self, value):
+    self._table.names[self._index] = value
+    self._table.query_index = None
+
+  @property
+  def object_path(self):
+    return self._table.path_tuples[self._table.path_ids[self._index]][0]
+
+  @object_path.setter
+  def object_path(self, value):
+    self._SetPathTuple((value, self.source_path))
+
+  @property
+  def source_path(self):
+    return self._table.path_tuples[self._table.path_ids[self._index]][1]
+
+  @source_path.setter
+  def source_path(self, value):
+    self._SetPathTuple((self.object_path, value))
+
+  def _SetPathTuple(self, path_tuple):
+    path_id = self._table.InternPath(path_tuple)
+    if path_id != self._table.path_ids[self._index]:
+      self._table.path_ids[self._index] = path_id
+      self._table.query_index = None
+
+  @property
+  def aliases(self):
+    return self._table.Aliases(self._index)
+
+  @property
+  def num_aliases(self):
+    return self._table.NumAliases(self._index)
+
+
 class DeltaSymbol(BaseSymbol):
   """Represents a changed symbol.
 
@@ -436,6 +738,180 @@ class DeltaSymbol(BaseSymbol):
     return self.pss - self.padding_pss
 
 
+class _TableSymbolList(object):
+  """A list-like sequence of TableSymbols, stored as indices into a table."""
+
+  __slots__ = (
+      '_table',
+      '_indices',
+  )
+
+  def __init__(self, table, indices):
+    self._table = table
+    self._indices = indices
+
+  def __len__(self):
+    return len(self._indices)
+
+  def __iter__(self):
+    table = self._table
+    for i in self._indices:
+      yield TableSymbol(table, i)
+
+  def __getitem__(self, key):
+    if isinstance(key, slice):
+      return _TableSymbolList(self._table, self._indices[key])
+    return TableSymbol(self._table, self._indices[key])
+
+  def __contains__(self, sym):
+    return self._IndexOf(sym) is not None
+
+  def __eq__(self, other):
+    if isinstance(other, _TableSymbolList) and self._table is other._table:
+      return self._indices == other._indices
+    return list(self) == list(other)
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __add__(self, other):
+    return list(self) + list(other)
+
+  def _IndexOf(self, sym):
+    if isinstance(sym, TableSymbol) and sym._table is self._table:
+      try:
+        return self._indices.index(sym._index)
+      except ValueError:
+        pass
+    return None
+
+  def _Derive(self, indices):
+    return _TableSymbolList(self._table, array.array('i', indices))
+
+  def index(self, sym):
+    ret = self._IndexOf(sym)
+    if ret is None:
+      raise ValueError('%r is not in list' % sym)
+    return ret
+
+  def Without(self, symbols):
+    """Returns a copy of this list with |symbols| removed."""
+    excluded = set(s._index for s in symbols
+                   if isinstance(s, TableSymbol) and s._table is self._table)
+    return self._Derive(i for i in self._indices if i not in excluded)
+
+  def Union(self, other):
+    """Returns a copy of this list with |other| appended (minus duplicates)."""
+    existing = set(self._indices)
+    return self._Derive(itertools.chain(
+        self._indices, (i for i in other._indices if i not in existing)))
+
+  def Sorted(self, cmp_func, key, reverse):
+    after_symbols = sorted(self, cmp_func, key, reverse)
+    return self._Derive(s._index for s in after_symbols)
+
+  def Partition(self, func):
+    """Returns (filtered, kept) lists, where kept symbols satisfy |func|."""
+    filtered_and_kept = (array.array('i'), array.array('i'))
+    table = self._table
+    for i in self._indices:
+      filtered_and_kept[int(bool(func(TableSymbol(table, i))))].append(i)
+    return (_TableSymbolList(table, filtered_and_kept[0]),
+            _TableSymbolList(table, filtered_and_kept[1]))
+
+  def PartitionByFields(self, fields, func):
+    """Like Partition(), but |func| is passed the values of |fields|.
+
+    Does not create any TableSymbols. When only path fields are used, |func| is
+    called only once per unique path.
+    """
+    table = self._table
+    filtered_and_kept = (array.array('i'), array.array('i'))
+    if all(f in ('object_path', 'source_path') for f in fields):
+      path_tuples = table.path_tuples
+      path_ids = table.path_ids
+      results_by_path_id = {}
+      for i in self._indices:
+        path_id = path_ids[i]
+        result = results_by_path_id.get(path_id)
+        if result is None:
+          object_path, source_path = path_tuples[path_id]
+          values = [object_path if f == 'object_path' else source_path
+                    for f in fields]
+          result = int(bool(func(*values)))
+          results_by_path_id[path_id] = result
+        filtered_and_kept[result].append(i)
+    else:
+      getters = [table.FieldGetter(f) for f in fields]
+      for i in self._indices:
+        filtered_and_kept[int(bool(func(*[g(i) for g in getters])))].append(i)
+    return (_TableSymbolList(table, filtered_and_kept[0]),
+            _TableSymbolList(table, filtered_and_kept[1]))
+
+  def FieldValues(self, fields):
+    """Returns a list of tuples of the values of |fields| for each symbol."""
+    getters = [self._table.FieldGetter(f) for f in fields]
+    return [tuple(g(i) for g in getters) for i in self._indices]
+
+  def PartitionByRegex(self, fields, regex):
+    """Partitions by whether |regex| matches any of |fields|.
+
+    Uses the table's QueryIndex, so repeated queries are fast.
+    """
+    bitmap = self._table.GetQueryIndex().SymbolBitmap(fields, regex)
+    indices = self._indices
+    if len(indices) < 2:
+      # itemgetter() returns a scalar rather than a tuple in this case.
+      selectors = [bitmap[i] for i in indices]
+    else:
+      selectors = operator.itemgetter(*indices)(bitmap)
+    kept = array.array('i', itertools.compress(indices, selectors))
+    filtered = array.array('i', itertools.compress(
+        indices, (not x for x in selectors)))
+    return (_TableSymbolList(self._table, filtered),
+            _TableSymbolList(self._table, kept))
+
+  def SumUnique(self, field, include_bss):
+    """Sums |field| for one symbol of each alias group."""
+    table = self._table
+    column = table.FieldGetter(field)
+    alias_starts = table.alias_starts
+    bss_id = -1
+    if not include_bss and '.bss' in table.section_names:
+      bss_id = table.section_names.index('.bss')
+    section_ids = table.section_ids
+    seen_alias_starts = set()
+    ret = 0
+    for i in self._indices:
+      if section_ids[i] == bss_id:
+        continue
+      start = alias_starts[i]
+      if start >= 0:
+        if start in seen_alias_starts:
+          continue
+        seen_alias_starts.add(start)
+      ret += column(i)
+    return ret
+
+  def SumPss(self, include_bss):
+    table = self._table
+    sizes = table.sizes
+    bss_id = -1
+    if not include_bss and '.bss' in table.section_names:
+      bss_id = table.section_names.index('.bss')
+    section_ids = table.section_ids
+    alias_starts = table.alias_starts
+    ret = 0
+    for i in self._indices:
+      if section_ids[i] == bss_id:
+        continue
+      if alias_starts[i] < 0:
+        ret += float(sizes[i])
+      else:
+        ret += float(sizes[i]) / table.NumAliases(i)
+    return ret
+
+
 class SymbolGroup(BaseSymbol):
   """Represents a group of symbols using the same interface as Symbol.
 
@@ -509,13 +985,22 @@ class SymbolGroup(BaseSymbol):
     return self._symbols[key]
 
   def __sub__(self, other):
-    other_ids = set(id(s) for s in other)
-    after_symbols = [s for s in self if id(s) not in other_ids]
+    if self._symbols.__class__ == _TableSymbolList:
+      return self._CreateTransformed(self._symbols.Without(other))
+    other_set = set(other)
+    after_symbols = [s for s in self if s not in other_set]
     return self._CreateTransformed(after_symbols)
 
   def __add__(self, other):
-    self_ids = set(id(s) for s in self)
-    after_symbols = self._symbols + [s for s in other if id(s) not in self_ids]
+    if (self._symbols.__class__ == _TableSymbolList and
+        isinstance(other, SymbolGroup) and
+        other._symbols.__class__ == _TableSymbolList and
+        self._symbols._table is other._symbols._table):
+      after_symbols = self._symbols.Union(other._symbols)
+    else:
+      self_set = set(self)
+      after_symbols = list(self._symbols) + [
+          s for s in other if s not in self_set]
     return self._CreateTransformed(after_symbols, is_sorted=False)
 
   def index(self, item):
@@ -544,7 +1029,9 @@ class SymbolGroup(BaseSymbol):
   @property
   def size(self):
     if self._size is None:
-      if self.IsBss():
+      if self._symbols.__class__ == _TableSymbolList:
+        self._size = self._symbols.SumUnique('size', self.IsBss())
+      elif self.IsBss():
         self._size = sum(s.size for s in self.IterUniqueSymbols())
       else:
         self._size = sum(
@@ -554,7 +1041,9 @@ class SymbolGroup(BaseSymbol):
   @property
   def pss(self):
     if self._pss is None:
-      if self.IsBss():
+      if self._symbols.__class__ == _TableSymbolList:
+        self._pss = self._symbols.SumPss(self.IsBss())
+      elif self.IsBss():
         self._pss = sum(s.pss for s in self)
       else:
         self._pss = sum(s.pss for s in self if not s.IsBss())
@@ -563,7 +1052,10 @@ class SymbolGroup(BaseSymbol):
   @property
   def padding(self):
     if self._padding is None:
-      self._padding = sum(s.padding for s in self.IterUniqueSymbols())
+      if self._symbols.__class__ == _TableSymbolList:
+        self._padding = self._symbols.SumUnique('padding', True)
+      else:
+        self._padding = sum(s.padding for s in self.IterUniqueSymbols())
     return self._padding
 
   @property
@@ -614,7 +1106,10 @@ class SymbolGroup(BaseSymbol):
       cmp_func = lambda a, b: cmp((a.IsBss(), abs(b.pss), a.name),
                                   (b.IsBss(), abs(a.pss), b.name))
 
-    after_symbols = sorted(self._symbols, cmp_func, key, reverse)
+    if self._symbols.__class__ == _TableSymbolList:
+      after_symbols = self._symbols.Sorted(cmp_func, key, reverse)
+    else:
+      after_symbols = sorted(self._symbols, cmp_func, key, reverse)
     return self._CreateTransformed(
         after_symbols, filtered_symbols=self._filtered_symbols,
         is_sorted=True)
@@ -631,6 +1126,10 @@ class SymbolGroup(BaseSymbol):
                        reverse=not reverse)
 
   def Filter(self, func):
+    if self._symbols.__class__ == _TableSymbolList:
+      filtered, kept = self._symbols.Partition(func)
+      return self._CreateTransformed(kept, filtered_symbols=filtered)
+
     filtered_and_kept = ([], [])
     symbol = None
     try:
@@ -643,11 +1142,53 @@ class SymbolGroup(BaseSymbol):
     return self._CreateTransformed(filtered_and_kept[1],
                                    filtered_symbols=filtered_and_kept[0])
 
+  def IterFieldValues(self, fields):
+    """Yields a tuple of the values of |fields| for each symbol.
+
+    Does not create TableSymbols for groups backed by a SymbolTable.
+    """
+    if self._symbols.__class__ == _TableSymbolList:
+      return iter(self._symbols.FieldValues(fields))
+    if len(fields) == 1:
+      return ((getattr(s, fields[0]),) for s in self)
+    return itertools.imap(operator.attrgetter(*fields), self)
+
+  def _FilterByFields(self, fields, func):
+    """Like Filter(), but |func| is passed the values of |fields|.
+
+    Allows groups backed by a SymbolTable to be filtered without creating
+    TableSymbols.
+    """
+    if self._symbols.__class__ == _TableSymbolList:
+      filtered, kept = self._symbols.PartitionByFields(fields, func)
+      return self._CreateTransformed(kept, filtered_symbols=filtered)
+    return self.Filter(lambda s: func(*[getattr(s, f) for f in fields]))
+
+  def _FilterByRegex(self, fields, pattern):
+    """Keeps symbols where |pattern| matches the value of any of |fields|."""
+    regex = re.compile(match_util.ExpandRegexIdentifierPlaceholder(pattern))
+    if self._symbols.__class__ == _TableSymbolList:
+      filtered, kept = self._symbols.PartitionByRegex(fields, regex)
+      return self._CreateTransformed(kept, filtered_symbols=filtered)
+
+    # E.g. for clustered symbols, which are a mix of groups and TableSymbols.
+    bitmaps_by_table_id = {}
+    def func(symbol):
+      if symbol.__class__ == TableSymbol:
+        table = symbol._table
+        bitmap = bitmaps_by_table_id.get(id(table))
+        if bitmap is None:
+          bitmap = table.GetQueryIndex().SymbolBitmap(fields, regex)
+          bitmaps_by_table_id[id(table)] = bitmap
+        return bitmap[symbol._index]
+      return any(regex.search(getattr(symbol, f)) for f in fields)
+    return self.Filter(func)
+
   def WhereIsGroup(self):
     return self.Filter(lambda s: s.IsGroup())
 
   def WhereSizeBiggerThan(self, min_size):
-    return self.Filter(lambda s: s.size >= min_size)
+    return self._FilterByFields(('size',), lambda size: size >= min_size)
 
   def WherePssBiggerThan(self, min_pss):
     return self.Filter(lambda s: s.pss >= min_pss)
@@ -655,57 +1196,53 @@ class SymbolGroup(BaseSymbol):
   def WhereInSection(self, section):
     """|section| can be section_name ('.bss'), or section chars ('bdr')."""
     if section.startswith('.'):
-      ret = self.Filter(lambda s: s.section_name == section)
+      ret = self._FilterByFields(('section_name',),
+                                 lambda section_name: section_name == section)
       ret.section_name = section
     else:
-      ret = self.Filter(lambda s: s.section in section)
+      ret = self._FilterByFields(
+          ('section_name',),
+          lambda section_name: SECTION_NAME_TO_SECTION.get(
+              section_name, section_name) in section)
       if section in SECTION_TO_SECTION_NAME:
         ret.section_name = SECTION_TO_SECTION_NAME[section]
     return ret
 
   def WhereIsTemplate(self):
-    return self.Filter(lambda s: s.template_name is not s.name)
+    return self._FilterByFields(('template_name', 'name'),
+                                lambda template_name, name: (
+                                    template_name is not name))
 
   def WhereSourceIsGenerated(self):
-    return self.Filter(lambda s: s.generated_source)
+    return self._FilterByFields(
+        ('flags',), lambda flags: flags & FLAG_GENERATED_SOURCE)
 
   def WhereGeneratedByToolchain(self):
     return self.Filter(lambda s: s.IsGeneratedByToolchain())
 
   def WhereFullNameMatches(self, pattern):
-    regex = re.compile(match_util.ExpandRegexIdentifierPlaceholder(pattern))
-    return self.Filter(lambda s: regex.search(s.full_name))
+    return self._FilterByRegex(('full_name',), pattern)
 
   def WhereTemplateNameMatches(self, pattern):
-    regex = re.compile(match_util.ExpandRegexIdentifierPlaceholder(pattern))
-    return self.Filter(lambda s: regex.search(s.template_name))
+    return self._FilterByRegex(('template_name',), pattern)
 
   def WhereNameMatches(self, pattern):
-    regex = re.compile(match_util.ExpandRegexIdentifierPlaceholder(pattern))
-    return self.Filter(lambda s: regex.search(s.name))
+    return self._FilterByRegex(('name',), pattern)
 
   def WhereObjectPathMatches(self, pattern):
-    regex = re.compile(match_util.ExpandRegexIdentifierPlaceholder(pattern))
-    return self.Filter(lambda s: regex.search(s.object_path))
+    return self._FilterByRegex(('object_path',), pattern)
 
   def WhereSourcePathMatches(self, pattern):
-    regex = re.compile(match_util.ExpandRegexIdentifierPlaceholder(pattern))
-    return self.Filter(lambda s: regex.search(s.source_path))
+    return self._FilterByRegex(('source_path',), pattern)
 
   def WherePathMatches(self, pattern):
-    regex = re.compile(match_util.ExpandRegexIdentifierPlaceholder(pattern))
-    return self.Filter(lambda s: (regex.search(s.source_path) or
-                                  regex.search(s.object_path)))
+    return self._FilterByRegex(('source_path', 'object_path'), pattern)
 
   def WhereMatches(self, pattern):
     """Looks for |pattern| within all paths & names."""
-    regex = re.compile(match_util.ExpandRegexIdentifierPlaceholder(pattern))
-    return self.Filter(lambda s: (
-        regex.search(s.source_path) or
-        regex.search(s.object_path) or
-        regex.search(s.full_name) or
-        s.full_name is not s.template_name and regex.search(s.template_name) or
-        s.full_name is not s.name and regex.search(s.name)))
+    return self._FilterByRegex(
+        ('source_path', 'object_path', 'full_name', 'template_name', 'name'),
+        pattern)
 
   def WhereAddressInRange(self, start, end=None):
     """Searches for addesses within [start, end).
@@ -716,13 +1253,19 @@ class SymbolGroup(BaseSymbol):
       start = int(start, 16)
     if end is None:
       end = start + 1
-    return self.Filter(lambda s: s.address >= start and s.address < end)
+    return self._FilterByFields(
+        ('address',), lambda address: address >= start and address < end)
 
   def WhereHasPath(self):
-    return self.Filter(lambda s: s.source_path or s.object_path)
+    return self._FilterByFields(
+        ('source_path', 'object_path'),
+        lambda source_path, object_path: source_path or object_path)
 
   def WhereHasAnyAttribution(self):
-    return self.Filter(lambda s: s.full_name or s.source_path or s.object_path)
+    return self._FilterByFields(
+        ('full_name', 'source_path', 'object_path'),
+        lambda full_name, source_path, object_path: (
+            full_name or source_path or object_path))
 
   def Inverted(self):
     """Returns the symbols that were filtered out by the previous filter.
@@ -981,3 +1524,9 @@ def _ExtractSuffixAfterSeparator(string, separator, count):
       break
     prev_idx = idx
   return string[:prev_idx]
+
+
+def _AddressArray(addresses):
+  if _ADDRESS_ARRAY_TYPE:
+    return array.array(_ADDRESS_ARRAY_TYPE, addresses)
+  return list(addresses)
@@ -7,6 +7,8 @@ import logging
 import os
 import re
 
+import concurrent
+
 
 # E.g.:
 # build obj/.../foo.o: cxx gen/.../foo.cc || obj/.../foo.inputdeps.stamp
@@ -14,6 +16,9 @@ import re
 # build ./libchrome.so ./lib.unstripped/libchrome.so: solink a.o b.o ...
 _REGEX = re.compile(r'build ([^:]+): \w+ (.*?)(?: \||\n|$)')
 
+# Number of .ninja files to parse within each forked process.
+_FILES_PER_JOB = 50
+
 
 class _SourceMapper(object):
   def __init__(self, dep_map, parsed_file_count):
@@ -87,9 +92,29 @@ def _ParseOneFile(lines, dep_map, elf_path):
   return sub_ninjas, elf_inputs
 
 
+def _ParseFiles(output_directory, paths, elf_path):
+  """Parses the given .ninja files.
+
+  Returns: A tuple of (dep_map, sub_ninjas, elf_inputs).
+  """
+  dep_map = {}
+  sub_ninjas = []
+  elf_inputs = None
+  for path in paths:
+    with open(os.path.join(output_directory, path)) as obj:
+      cur_sub_ninjas, found_elf_inputs = _ParseOneFile(obj, dep_map, elf_path)
+    if found_elf_inputs:
+      assert not elf_inputs, 'Found multiple inputs for elf_path ' + elf_path
+      elf_inputs = found_elf_inputs
+    sub_ninjas.extend(cur_sub_ninjas)
+  return dep_map, sub_ninjas, elf_inputs
+
+
 def Parse(output_directory, elf_path):
   """Parses build.ninja and subninjas.
 
+  Each level of subninjas is parsed in parallel (in batches of files).
+
   Args:
     output_directory: Where to find the root build.ninja.
     elf_path: Path to elf file to find inputs for.
@@ -103,15 +128,25 @@ def Parse(output_directory, elf_path):
   dep_map = {}
   elf_inputs = None
   while to_parse:
-    path = os.path.join(output_directory, to_parse.pop())
-    with open(path) as obj:
-      sub_ninjas, found_elf_inputs = _ParseOneFile(obj, dep_map, elf_path)
+    if len(to_parse) <= _FILES_PER_JOB:
+      results = [_ParseFiles(output_directory, to_parse, elf_path)]
+    else:
+      job_params = [(output_directory, to_parse[i:i + _FILES_PER_JOB], elf_path)
+                    for i in xrange(0, len(to_parse), _FILES_PER_JOB)]
+      results = concurrent.BulkForkAndCall(_ParseFiles, job_params)
+
+    to_parse = []
+    for cur_dep_map, sub_ninjas, found_elf_inputs in results:
+      prev_size = len(dep_map)
+      dep_map.update(cur_dep_map)
+      assert len(dep_map) == prev_size + len(cur_dep_map), (
+          'Duplicate outputs found in .ninja files.')
       if found_elf_inputs:
         assert not elf_inputs, 'Found multiple inputs for elf_path ' + elf_path
         elf_inputs = found_elf_inputs
-    for subpath in sub_ninjas:
-      assert subpath not in seen_paths, 'Double include of ' + subpath
-      seen_paths.add(subpath)
-    to_parse.extend(sub_ninjas)
+      for subpath in sub_ninjas:
+        assert subpath not in seen_paths, 'Double include of ' + subpath
+        seen_paths.add(subpath)
+      to_parse.extend(sub_ninjas)
 
   return _SourceMapper(dep_map, len(seen_paths)), elf_inputs
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# Copyright 2017 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import ninja_parser
+
+
+class NinjaParserTest(unittest.TestCase):
+  def setUp(self):
+    self.output_directory = tempfile.mkdtemp()
+    # Three levels of subninjas, each with several files so that they are
+    # split into multiple jobs.
+    sub_ninjas = []
+    for i in xrange(3):
+      sub_ninja = 'sub%d.ninja' % i
+      sub_ninjas.append(sub_ninja)
+      lines = ['subninja sub%d_%d.ninja' % (i, j) for j in xrange(2)]
+      lines.append('build obj/sub%d/a.o: cxx ../../sub%d/a.cc' % (i, i))
+      self._WriteFile(sub_ninja, lines)
+      for j in xrange(2):
+        name = 'sub%d_%d' % (i, j)
+        self._WriteFile(name + '.ninja', [
+            'build obj/%s/b.o: cxx ../../%s/b\\ c.cc' % (name, name),
+            'build obj/%s/lib.a: alink obj/%s/b.o' % (name, name),
+        ])
+    self._WriteFile('sub1_1.ninja', [
+        'build obj/sub1_1/b.o: cxx ../../sub1_1/b.cc',
+        'build libfoo.so: solink obj/sub0/a.o obj/sub1_1/b.o || stamp',
+    ])
+    self._WriteFile('build.ninja', ['subninja ' + s for s in sub_ninjas])
+
+  def tearDown(self):
+    shutil.rmtree(self.output_directory)
+
+  def _WriteFile(self, path, lines):
+    with open(os.path.join(self.output_directory, path), 'w') as f:
+      f.write(''.join(l + '\n' for l in lines))
+
+  def _Parse(self):
+    source_mapper, elf_inputs = ninja_parser.Parse(
+        self.output_directory,
+        os.path.join(self.output_directory, 'libfoo.so'))
+    return source_mapper._dep_map, source_mapper.parsed_file_count, elf_inputs
+
+  def testParse(self):
+    dep_map, parsed_file_count, elf_inputs = self._Parse()
+    self.assertEquals(10, parsed_file_count)
+    self.assertEquals(['obj/sub0/a.o', 'obj/sub1_1/b.o'], elf_inputs)
+    self.assertEquals('../../sub0_0/b c.cc', dep_map['obj/sub0_0/b.o'])
+    self.assertEquals({'b.o': 'obj/sub2_1/b.o'}, dep_map['obj/sub2_1/lib.a'])
+
+  def testParse_Parallel(self):
+    # Forked jobs return their own dep_maps, which must be merged into the
+    # same result as when parsing serially.
+    expected = self._Parse()
+    orig_files_per_job = ninja_parser._FILES_PER_JOB
+    ninja_parser._FILES_PER_JOB = 1
+    try:
+      actual = self._Parse()
+    finally:
+      ninja_parser._FILES_PER_JOB = orig_files_per_job
+    self.assertEquals(expected, actual)
+
+
+if __name__ == '__main__':
+  unittest.main()
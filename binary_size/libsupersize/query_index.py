@@ -0,0 +1,155 @@
+# Copyright 2017 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Speeds up regex filtering of symbols stored in a models.SymbolTable.
+
+For each queried field (e.g. full_name), all values are joined into a single
+string. Most regexes require some literal substring to be present in order to
+match, so rather than running a regex on every value, str.find() is used to
+locate values that contain such a substring, and the regex is run only on those.
+
+Results are cached by pattern, since interactive sessions tend to run similar
+queries many times.
+"""
+
+import array
+import bisect
+import collections
+import re
+
+import match_util
+
+
+# Shorter literals are too common to be worth searching for.
+_MIN_LITERAL_LENGTH = 3
+_MAX_CACHED_RESULTS = 100
+
+_PATH_FIELDS = ('object_path', 'source_path')
+
+
+class _FieldIndex(object):
+  """Finds values that match a regex for a single field."""
+
+  def __init__(self, values):
+    self._values = values
+    self._joined = '\0'.join(values)
+    self._joined_lower = None
+    self._offsets = array.array('l')
+    offset = 0
+    for value in values:
+      self._offsets.append(offset)
+      offset += len(value) + 1
+
+  def _CandidateIds(self, literal, ignore_case):
+    """Returns a sorted list of ids of values that contain |literal|."""
+    joined = self._joined
+    if ignore_case:
+      if self._joined_lower is None:
+        self._joined_lower = joined.lower()
+      joined = self._joined_lower
+      literal = literal.lower()
+    ret = []
+    offsets = self._offsets
+    num_values = len(offsets)
+    pos = joined.find(literal)
+    while pos != -1:
+      value_id = bisect.bisect_right(offsets, pos) - 1
+      ret.append(value_id)
+      if value_id + 1 == num_values:
+        break
+      pos = joined.find(literal, offsets[value_id + 1])
+    return ret
+
+  def MatchingIds(self, regex):
+    """Returns a list of ids of values that |regex| matches."""
+    candidate_ids = None
+    literals = match_util.FindRequiredLiterals(regex)
+    if literals and all(len(l) >= _MIN_LITERAL_LENGTH for l in literals):
+      ignore_case = bool(regex.flags & re.IGNORECASE)
+      candidate_ids = set()
+      for literal in literals:
+        candidate_ids.update(self._CandidateIds(literal, ignore_case))
+    if candidate_ids is None:
+      candidate_ids = xrange(len(self._values))
+
+    values = self._values
+    search = regex.search
+    return [i for i in candidate_ids if search(values[i])]
+
+
+class QueryIndex(object):
+  """Per-SymbolTable cache of field indices and of regex results.
+
+  Must be discarded whenever names or paths within the table change.
+  """
+
+  def __init__(self, table):
+    self._table = table
+    self._field_indices = {}
+    self._symbol_indices_by_path_id = None
+    self._matching_ids = {}
+    self._cached_bitmaps = collections.OrderedDict()
+
+  def _GetFieldIndex(self, field):
+    ret = self._field_indices.get(field)
+    if ret is None:
+      table = self._table
+      if field in _PATH_FIELDS:
+        tuple_index = _PATH_FIELDS.index(field)
+        values = [t[tuple_index] for t in table.path_tuples]
+      else:
+        values = {
+            'full_name': table.full_names,
+            'template_name': table.template_names,
+            'name': table.names,
+        }[field]
+      ret = _FieldIndex(values)
+      self._field_indices[field] = ret
+    return ret
+
+  def _SymbolIndicesByPathId(self):
+    if self._symbol_indices_by_path_id is None:
+      ret = [[] for _ in xrange(len(self._table.path_tuples))]
+      for i, path_id in enumerate(self._table.path_ids):
+        ret[path_id].append(i)
+      self._symbol_indices_by_path_id = ret
+    return self._symbol_indices_by_path_id
+
+  def _MatchingIds(self, field, regex):
+    key = (field, regex.pattern, regex.flags)
+    ret = self._matching_ids.get(key)
+    if ret is None:
+      if len(self._matching_ids) >= _MAX_CACHED_RESULTS:
+        self._matching_ids.clear()
+      ret = self._GetFieldIndex(field).MatchingIds(regex)
+      self._matching_ids[key] = ret
+    return ret
+
+  def SymbolBitmap(self, fields, regex):
+    """Returns a bytearray where symbols that match are 1 and others are 0.
+
+    Args:
+      fields: Names of fields to search (a symbol matches if any field does).
+          Supports object_path, source_path, full_name, template_name, name.
+      regex: A compiled regular expression.
+    """
+    key = (fields, regex.pattern, regex.flags)
+    ret = self._cached_bitmaps.pop(key, None)
+    if ret is None:
+      ret = bytearray(len(self._table))
+      for field in fields:
+        matching_ids = self._MatchingIds(field, regex)
+        if field in _PATH_FIELDS:
+          symbol_indices_by_path_id = self._SymbolIndicesByPathId()
+          for path_id in matching_ids:
+            for i in symbol_indices_by_path_id[path_id]:
+              ret[i] = 1
+        else:
+          for i in matching_ids:
+            ret[i] = 1
+    # Re-insert to mark as most recently used.
+    self._cached_bitmaps[key] = ret
+    if len(self._cached_bitmaps) > _MAX_CACHED_RESULTS:
+      self._cached_bitmaps.popitem(last=False)
+    return ret
@@ -28,6 +28,22 @@ function D3SymbolTreeMap(mapWidth, mapHeight, levelsToShow) {
   this._treeData = undefined;
   this._maxLevelsToShow = levelsToShow;
   this._currentMaxDepth = this._maxLevelsToShow;
+  this._nextId = 0;
+  this._filter = undefined;
+  // Children of shards that have been loaded, keyed by shard ID.
+  this._loadedShards = {};
+}
+
+// Callbacks for shards that are being loaded, keyed by shard ID.
+D3SymbolTreeMap._pendingShards = {};
+
+/**
+ * Called by each file in data/ (written by html_report.py --sharded).
+ */
+function loadTreeShard(shardId, children) {
+  var callback = D3SymbolTreeMap._pendingShards[shardId];
+  delete D3SymbolTreeMap._pendingShards[shardId];
+  if (callback) callback(children);
 }
 
 /**
@@ -159,8 +175,9 @@ D3SymbolTreeMap.prototype._setData = function(data) {
  */
 D3SymbolTreeMap.prototype._crunchStats = function(node) {
   var stack = [];
-  stack.idCounter = 0;
+  stack.idCounter = this._nextId;
   this._crunchStatsHelper(stack, node);
+  this._nextId = stack.idCounter;
 }
 
 /**
@@ -189,7 +206,25 @@ D3SymbolTreeMap.prototype._crunchStatsHelper = function(stack, node) {
   // This allows stats to be crunched multiple times on subsets of data
   // without breaking the data-to-ID bindings. New nodes get new IDs.
   if (node.id === undefined) node.id = stack.idCounter++;
-  if (node.children === undefined) {
+  if (node.children === undefined && node.sh !== undefined) {
+    // Shard that has not been loaded; use its precomputed stats.
+    node.symbol_stats = {};
+    for (var t in node.ss) {
+      node.symbol_stats[t] = {'count': node.ss[t].count,
+                              'size': node.ss[t].size};
+    }
+    for (var i = 0; i < stack.length; i++) {
+      var ancestor = stack[i];
+      if (!ancestor.symbol_stats) ancestor.symbol_stats = {};
+      for (var t in node.ss) {
+        if (ancestor.symbol_stats[t] === undefined) {
+          ancestor.symbol_stats[t] = {'count': 0, 'size': 0};
+        }
+        ancestor.symbol_stats[t].count += node.ss[t].count;
+        ancestor.symbol_stats[t].size += node.ss[t].size;
+      }
+    }
+  } else if (node.children === undefined) {
     // Leaf node (symbol); accumulate stats.
     for (var i = 0; i < stack.length; i++) {
       var ancestor = stack[i];
@@ -239,6 +274,63 @@ D3SymbolTreeMap.prototype._zoomDatum = function(datum) {
   this._doLayout();
 }
 
+/**
+ * Loads the children of a shard placeholder (from data/<shard ID>.js), and
+ * then calls |callback|.
+ */
+D3SymbolTreeMap.prototype._loadShard = function(datum, callback) {
+  var thisTreeMap = this;
+  var shardId = datum.sh;
+  var attach = function(children) {
+    thisTreeMap._loadedShards[shardId] = children;
+    thisTreeMap._attachShard(datum, children);
+    callback();
+  };
+  if (this._loadedShards[shardId] !== undefined) {
+    attach(this._loadedShards[shardId]);
+    return;
+  }
+  if (D3SymbolTreeMap._pendingShards[shardId] !== undefined) return;
+  console.time('_loadShard ' + shardId);
+  D3SymbolTreeMap._pendingShards[shardId] = function(children) {
+    console.timeEnd('_loadShard ' + shardId);
+    attach(children);
+  };
+  var script = document.createElement('script');
+  script.src = 'data/' + shardId + '.js';
+  script.charset = 'utf-8';
+  document.head.appendChild(script);
+}
+
+/**
+ * Replaces a shard placeholder's precomputed stats with its actual children.
+ */
+D3SymbolTreeMap.prototype._attachShard = function(datum, children) {
+  var wrapper = {'n': datum.n, 'k': datum.k, 'children': children,
+                 'parent': datum.parent};
+  this._setParents(wrapper);
+  if (this._filter !== undefined) {
+    // Filters might need parent nodes (e.g. to compute paths).
+    wrapper = this._clone(wrapper, this._filter) || {'children': []};
+  }
+  datum.children = wrapper.children;
+  delete datum.sh;
+  delete datum.ss;
+  delete datum.symbol_stats;
+  var stack = [];
+  stack.idCounter = this._nextId;
+  this._crunchStatsHelper(stack, datum);
+  this._nextId = stack.idCounter;
+  // Ancestors already include the shard's precomputed stats.
+}
+
+D3SymbolTreeMap.prototype._setParents = function(node) {
+  if (node.children) for (var i = 0; i < node.children.length; i++) {
+    node.children[i].parent = node;
+    this._setParents(node.children[i]);
+  }
+}
+
 D3SymbolTreeMap.prototype.setMaxLevels = function(levelsToShow) {
   this._maxLevelsToShow = levelsToShow;
   this._currentNodes = this._layout.nodes(this._currentRoot);
@@ -270,9 +362,17 @@ D3SymbolTreeMap.prototype._clone = function(datum, filter) {
   // filter must be preserved!
   var copy = {'n': datum.n, 'k': datum.k};
   var childAccepted = false;
-  if (datum.children !== undefined) {
-    for (var i = 0; i < datum.children.length; i++) {
-      var copiedChild = this._clone(datum.children[i], filter);
+  var children = datum.children;
+  if (children === undefined && datum.sh !== undefined &&
+      this._loadedShards[datum.sh] !== undefined) {
+    children = this._loadedShards[datum.sh];
+    datum.children = children;  // So that they can find their paths.
+    this._setParents(datum);
+    delete datum.children;
+  }
+  if (children !== undefined) {
+    for (var i = 0; i < children.length; i++) {
+      var copiedChild = this._clone(children[i], filter);
       if (copiedChild !== undefined) {
         childAccepted = true; // parent must also be accepted.
         if (copy.children === undefined) copy.children = [];
@@ -289,7 +389,7 @@ D3SymbolTreeMap.prototype._clone = function(datum, filter) {
     accept = true;
   } else if (filter !== undefined && filter.call(this, datum) !== true) {
     this.__cloneState.rejected++;
-  } else if (datum.children === undefined) {
+  } else if (children === undefined) {
     // Accept leaf nodes that passed the filter
     this.__cloneState.accepted++;
     accept = true;
@@ -304,9 +404,13 @@ D3SymbolTreeMap.prototype._clone = function(datum, filter) {
       copy.lastPathElement = datum.lastPathElement;
     }
     if (datum.t !== undefined) copy.t = datum.t;
-    if (datum.value !== undefined && datum.children === undefined) {
+    if (datum.value !== undefined && copy.children === undefined) {
       copy.value = datum.value;
     }
+    if (datum.sh !== undefined && children === undefined) {
+      copy.sh = datum.sh;
+      copy.ss = datum.ss;
+    }
   } else {
     // Discard the copy we were going to return
     copy = undefined;
@@ -333,6 +437,7 @@ D3SymbolTreeMap.prototype._clone = function(datum, filter) {
 D3SymbolTreeMap.prototype.filter = function(filter) {
   // Ensure we have a copy of the original root.
   if (this._backupTree === undefined) this._backupTree = this._treeData;
+  this._filter = filter;
   this._mapContainer.selectAll('div').remove();
   this._setData(this._clone(this._backupTree, filter));
 }
@@ -580,6 +685,13 @@ D3SymbolTreeMap.prototype._handleLeaves = function() {
       })
       .on('mousemove', function(){ thisTreeMap._moveInfoBox.call(
         thisTreeMap, event);
+      })
+      .on('dblclick', function(datum){
+        if (datum.sh === undefined) return;
+        // Load the shard and zoom into it.
+        thisTreeMap._loadShard(datum, function() {
+          thisTreeMap._zoomDatum(datum);
+        });
       });
   cellsEnter
       .append('div')
@@ -765,6 +877,9 @@ D3SymbolTreeMap.prototype._showInfoBox = function(datum) {
   if (datum.k === 'p' && !datum.lastPathElement) {
     this.infobox.append('div').text('Directory: ' + this.pathFor(datum))
     this.infobox.append('div').text('Size: ' + sizeish);
+    if (datum.sh !== undefined) {
+      this.infobox.append('div').text('(Double-click to load contents)');
+    }
   } else {
     if (datum.k === 'p') { // path
       this.infobox.append('div').text('File: ' + this.pathFor(datum))
@@ -35,9 +35,16 @@ _MAPPINGS = {
 
 
 def main():
-  for line in sys.stdin:
-    sys.stdout.write(_MAPPINGS[line.rstrip()])
+  # Like c++filt, output each line as soon as it is read, and echo names that
+  # are not recognized.
+  while True:
+    line = sys.stdin.readline()
+    if not line:
+      break
+    name = line.rstrip()
+    sys.stdout.write(_MAPPINGS.get(name, name))
     sys.stdout.write('\n')
+    sys.stdout.flush()
 
 
 if __name__ == '__main__':
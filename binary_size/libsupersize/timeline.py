@@ -0,0 +1,133 @@
+# Copyright 2017 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Computes size deltas between each consecutive pair of .size files."""
+
+import csv
+import json
+import logging
+import multiprocessing
+import sys
+
+import archive
+import canned_queries
+import concurrent
+import diff
+
+
+_CSV_COLUMNS = ('before', 'after', 'kind', 'name', 'delta')
+
+
+def _ComputePairDeltas(before, after, include_bss):
+  """Returns (section_deltas, component_deltas) for the given SizeInfos."""
+  delta_size_info = diff.Diff(before, after)
+  section_deltas = {k: v for k, v in delta_size_info.section_sizes.iteritems()
+                    if v}
+  symbols = delta_size_info.raw_symbols
+  if not include_bss:
+    symbols = symbols.WhereInSection('b').Inverted()
+  component_deltas = {}
+  queries = canned_queries.CannedQueries([])
+  for group in queries.CategorizeByChromeComponent(symbols):
+    pss = int(round(group.pss))
+    if pss:
+      component_deltas[group.name] = pss
+  return section_deltas, component_deltas
+
+
+def _ComputeDeltasJob(size_infos, start, end, include_bss):
+  """Diffs the pairs size_infos[i], size_infos[i + 1] for i in [start, end).
+
+  Runs in a forked process. Pairs are contiguous so that each SizeInfo's diff
+  keys are computed only once per process.
+  """
+  ret = []
+  for i in xrange(start, end):
+    ret.append(
+        (i, _ComputePairDeltas(size_infos[i], size_infos[i + 1], include_bss)))
+  return ret
+
+
+def ComputeTimeline(size_infos, include_bss=False):
+  """Returns a list of (section_deltas, component_deltas) for each pair.
+
+  The list has one entry fewer than |size_infos|. Pairs are diffed in forked
+  processes.
+  """
+  num_pairs = len(size_infos) - 1
+  if num_pairs < 1:
+    return []
+  num_jobs = min(num_pairs, multiprocessing.cpu_count())
+  pairs_per_job = (num_pairs + num_jobs - 1) // num_jobs
+  job_params = [
+      (size_infos, i, min(i + pairs_per_job, num_pairs), include_bss)
+      for i in xrange(0, num_pairs, pairs_per_job)]
+  ret = [None] * num_pairs
+  for results in concurrent.BulkForkAndCall(_ComputeDeltasJob, job_params):
+    for i, deltas in results:
+      ret[i] = deltas
+  return ret
+
+
+def _WriteCsv(paths, timeline, out_file):
+  writer = csv.writer(out_file)
+  writer.writerow(_CSV_COLUMNS)
+  for i, (section_deltas, component_deltas) in enumerate(timeline):
+    for kind, deltas in (('section', section_deltas),
+                         ('component', component_deltas)):
+      for name, delta in sorted(deltas.iteritems()):
+        writer.writerow((paths[i], paths[i + 1], kind, name, delta))
+
+
+def _WriteJson(paths, timeline, out_file):
+  entries = []
+  for i, (section_deltas, component_deltas) in enumerate(timeline):
+    entries.append({
+        'before': paths[i],
+        'after': paths[i + 1],
+        'sections': section_deltas,
+        'components': component_deltas,
+    })
+  json.dump(entries, out_file, indent=2, sort_keys=True)
+  out_file.write('\n')
+
+
+def AddArguments(parser):
+  parser.add_argument('inputs', nargs='+',
+                      help='Input .size files, in chronological order.')
+  parser.add_argument('--format', choices=('csv', 'json'), default='csv',
+                      help='Output format (default: csv).')
+  parser.add_argument('--output', metavar='PATH',
+                      help='Write to the given file rather than stdout.')
+  parser.add_argument('--include-bss', action='store_true',
+                      help='Include symbols from .bss (which consume no real '
+                           'space) in component deltas.')
+
+
+def Run(args, parser):
+  if len(args.inputs) < 2:
+    parser.error('Must pass at least two .size files.')
+  for path in args.inputs:
+    if not path.endswith('.size'):
+      parser.error('All inputs must end with ".size"')
+
+  # Each file is loaded only once, and equal names and paths are shared
+  # between them.
+  string_cache = {}
+  size_infos = []
+  for path in args.inputs:
+    logging.info('Loading %s', path)
+    size_infos.append(
+        archive.LoadAndPostProcessSizeInfo(path, string_cache=string_cache))
+  string_cache = None
+
+  logging.info('Diffing %d pairs', len(size_infos) - 1)
+  timeline = ComputeTimeline(size_infos, include_bss=args.include_bss)
+
+  write_func = _WriteJson if args.format == 'json' else _WriteCsv
+  if args.output:
+    with open(args.output, 'w') as out_file:
+      write_func(args.inputs, timeline, out_file)
+  else:
+    write_func(args.inputs, timeline, sys.stdout)
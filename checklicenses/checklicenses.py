@@ -6,11 +6,16 @@
 """Makes sure that all files contain proper licensing information."""
 
 
+import hashlib
 import json
+import multiprocessing
+import multiprocessing.pool
 import optparse
 import os.path
+import stat
 import subprocess
 import sys
+import tempfile
 
 
 def PrintUsage():
@@ -660,6 +665,229 @@ EXCLUDED_PATHS = [
 ]
 
 
+# Bump when the format of the --cache file changes.
+CACHE_VERSION = 1
+
+# Number of directories passed to each licensecheck.pl invocation.
+LICENSECHECK_BATCH_SIZE = 64
+
+
+class PathPrefixTrie(object):
+  """Finds the prefixes, from a fixed list, that a path starts with.
+
+  This matches like str.startswith(), not by path component, in time
+  proportional to the length of the path rather than to the number of prefixes.
+  """
+
+  def __init__(self, prefixes):
+    # Nested dicts keyed by character; the None key marks the end of a prefix.
+    self._root = {}
+    for prefix in prefixes:
+      node = self._root
+      for char in prefix:
+        node = node.setdefault(char, {})
+      node[None] = prefix
+
+  def MatchingPrefixes(self, path):
+    """Returns the prefixes |path| starts with, shortest first."""
+    node = self._root
+    matches = [node[None]] if None in node else []
+    for char in path:
+      node = node.get(char)
+      if node is None:
+        break
+      if None in node:
+        matches.append(node[None])
+    return matches
+
+
+def _ListDirectory(directory, ancestors, base_directory, excluded_paths):
+  """Lists a directory for _WalkTree().
+
+  Args:
+    directory: Directory to list.
+    ancestors: Set of the real paths of |directory| and its ancestors.
+    base_directory: Directory excluded paths are relative to.
+    excluded_paths: PathPrefixTrie of the excluded paths.
+
+  Returns:
+    A (signature, subdirs) pair.  The signature changes when any file directly
+    in the directory is added, removed or modified.  subdirs is a list of
+    (subdir, ancestors) pairs for the subdirectories which aren't excluded.
+  """
+  files = []
+  subdirs = []
+  try:
+    names = sorted(os.listdir(directory))
+  except OSError:
+    names = []
+  for name in names:
+    path = os.path.join(directory, name)
+    try:
+      st = os.stat(path)
+    except OSError:
+      continue  # Broken symlink.
+    if stat.S_ISDIR(st.st_mode):
+      # Like find -follow, follow symlinks unless they loop.
+      real_path = os.path.realpath(path)
+      relative_path = os.path.relpath(path, base_directory) + '/'
+      if (real_path not in ancestors and
+          not excluded_paths.MatchingPrefixes(relative_path)):
+        subdirs.append((path, ancestors | frozenset([real_path])))
+    elif stat.S_ISREG(st.st_mode):
+      files.append((name, st.st_size, st.st_mtime))
+  return hashlib.sha1(repr(files)).hexdigest(), subdirs
+
+
+def _WalkTree(root, ancestors, base_directory, excluded_paths):
+  """Returns (directory, signature) pairs for |root| and the directories
+  under it.  See _ListDirectory() for the arguments.
+  """
+  result = []
+  pending = [(root, ancestors)]
+  while pending:
+    directory, ancestors = pending.pop()
+    signature, subdirs = _ListDirectory(directory, ancestors, base_directory,
+                                        excluded_paths)
+    result.append((directory, signature))
+    pending.extend(reversed(subdirs))
+  return result
+
+
+def _ListTree(start_dir, base_directory, excluded_paths, pool):
+  """Walks the subdirectories of |start_dir| in parallel, see _WalkTree()."""
+  signature, subdirs = _ListDirectory(
+      start_dir, frozenset([os.path.realpath(start_dir)]), base_directory,
+      excluded_paths)
+  directories = [(start_dir, signature)]
+  for subdir_directories in pool.map(
+      lambda subdir: _WalkTree(subdir[0], subdir[1], base_directory,
+                               excluded_paths),
+      subdirs):
+    directories.extend(subdir_directories)
+  return directories
+
+
+def _RunLicensecheck(licensecheck_path, paths):
+  """Runs licensecheck.pl on |paths|, returns (returncode, stdout, stderr).
+
+  Directories are not checked recursively, only the files directly in them.
+  """
+  licensecheck = subprocess.Popen([licensecheck_path, '-l', '100'] + paths,
+                                  stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE)
+  stdout, stderr = licensecheck.communicate()
+  return licensecheck.returncode, stdout, stderr
+
+
+def _GetLicensecheckSignature(licensecheck_path):
+  """Returns a signature of licensecheck.pl, to invalidate stale caches."""
+  st = os.stat(licensecheck_path)
+  return '%d %d %r' % (CACHE_VERSION, st.st_size, st.st_mtime)
+
+
+def _ReadCache(cache_path, licensecheck_signature):
+  """Returns the cached directories, if |cache_path| is up to date."""
+  try:
+    with open(cache_path) as f:
+      cache = json.load(f)
+  except (IOError, ValueError):
+    return {}
+  if cache.get('licensecheck') != licensecheck_signature:
+    return {}
+  return cache['directories']
+
+
+def _WriteCache(cache_path, licensecheck_signature, directories):
+  """Writes the cached |directories| to |cache_path|, atomically."""
+  fd, temp_path = tempfile.mkstemp(
+      dir=os.path.dirname(os.path.abspath(cache_path)))
+  with os.fdopen(fd, 'w') as f:
+    json.dump({'licensecheck': licensecheck_signature,
+               'directories': directories}, f)
+  os.rename(temp_path, cache_path)
+
+
+def _GetLicenses(options, start_dir, licensecheck_path, excluded_paths):
+  """Gets the licenses of the files under |start_dir| from licensecheck.pl.
+
+  licensecheck.pl runs in parallel on batches of directories, except for the
+  directories whose files didn't change since they were cached in the --cache
+  file.
+
+  Returns:
+    A list of (filename, license) pairs, or None if licensecheck.pl failed.
+  """
+  # Directories are keyed by path, so make sure that each has only one (e.g.
+  # with --root src/, the dirname of src/foo.cc is src, not src/).
+  start_dir = os.path.abspath(start_dir)
+  base_directory = os.path.abspath(options.base_directory)
+  pool = multiprocessing.pool.ThreadPool(
+      options.jobs or multiprocessing.cpu_count())
+  try:
+    if os.path.isdir(start_dir):
+      directories = _ListTree(start_dir, base_directory, excluded_paths, pool)
+    else:
+      directories = []
+    cached = {}
+    if options.cache and directories:
+      licensecheck_signature = _GetLicensecheckSignature(licensecheck_path)
+      cached = _ReadCache(options.cache, licensecheck_signature)
+    to_check = [directory for directory, signature in directories
+                if cached.get(directory, {}).get('signature') != signature]
+    batches = [to_check[i:i + LICENSECHECK_BATCH_SIZE]
+               for i in xrange(0, len(to_check), LICENSECHECK_BATCH_SIZE)]
+    if not directories:
+      batches = [[start_dir]]
+    outputs = pool.map(lambda paths: _RunLicensecheck(licensecheck_path, paths),
+                       batches)
+  finally:
+    pool.close()
+    pool.join()
+
+  stdout = ''.join(output[1] for output in outputs)
+  stderr = ''.join(output[2] for output in outputs)
+  if options.verbose:
+    print '----------- licensecheck stdout -----------'
+    print stdout
+    print '--------- end licensecheck stdout ---------'
+    if directories:
+      print 'Checked %d directories, %d unchanged ones were cached.' % (
+          len(to_check), len(directories) - len(to_check))
+  if any(output[0] != 0 for output in outputs) or stderr:
+    print '----------- licensecheck stderr -----------'
+    print stderr
+    print '--------- end licensecheck stderr ---------'
+    return None
+
+  licenses = []
+  for line in stdout.splitlines():
+    filename, license = line.split(':', 1)
+    licenses.append((filename.strip(), license))
+  if not directories:
+    return licenses
+
+  # Order the licenses as the directories of the tree, taking the ones of the
+  # unchanged directories from the cache.
+  checked = dict((directory, []) for directory in to_check)
+  for filename, license in licenses:
+    checked[os.path.abspath(os.path.dirname(filename))].append(
+        (filename, license))
+  licenses = []
+  new_cache = {}
+  for directory, signature in directories:
+    if directory in checked:
+      directory_licenses = checked[directory]
+    else:
+      directory_licenses = [tuple(l) for l in cached[directory]['licenses']]
+    new_cache[directory] = {'signature': signature,
+                            'licenses': directory_licenses}
+    licenses.extend(directory_licenses)
+  if options.cache:
+    _WriteCache(options.cache, licensecheck_signature, new_cache)
+  return licenses
+
+
 def check_licenses(options, args):
   # Figure out which directory we have to check.
   if len(args) == 0:
@@ -683,32 +911,22 @@ def check_licenses(options, args):
                                                    'devscripts',
                                                    'licensecheck.pl'))
 
-  licensecheck = subprocess.Popen([licensecheck_path,
-                                   '-l', '100',
-                                   '-r', start_dir],
-                                  stdout=subprocess.PIPE,
-                                  stderr=subprocess.PIPE)
-  stdout, stderr = licensecheck.communicate()
-  if options.verbose:
-    print '----------- licensecheck stdout -----------'
-    print stdout
-    print '--------- end licensecheck stdout ---------'
-  if licensecheck.returncode != 0 or stderr:
-    print '----------- licensecheck stderr -----------'
-    print stderr
-    print '--------- end licensecheck stderr ---------'
+  excluded_paths = PathPrefixTrie(EXCLUDED_PATHS)
+  whitelisted_paths = PathPrefixTrie(PATH_SPECIFIC_WHITELISTED_LICENSES)
+
+  licenses = _GetLicenses(options, start_dir, licensecheck_path, excluded_paths)
+  if licenses is None:
     print "\nFAILED\n"
     return 1
 
   used_suppressions = set()
   errors = []
 
-  for line in stdout.splitlines():
-    filename, license = line.split(':', 1)
-    filename = os.path.relpath(filename.strip(), options.base_directory)
+  for filename, license in licenses:
+    filename = os.path.relpath(filename, options.base_directory)
 
     # Check if the file belongs to one of the excluded paths.
-    if any((filename.startswith(path) for path in EXCLUDED_PATHS)):
+    if excluded_paths.MatchingPrefixes(filename):
       continue
 
     # For now we're just interested in the license.
@@ -723,9 +941,8 @@ def check_licenses(options, args):
 
     if not options.ignore_suppressions:
       matched_prefixes = [
-          prefix for prefix in PATH_SPECIFIC_WHITELISTED_LICENSES
-          if filename.startswith(prefix) and
-          license in PATH_SPECIFIC_WHITELISTED_LICENSES[prefix]]
+          prefix for prefix in whitelisted_paths.MatchingPrefixes(filename)
+          if license in PATH_SPECIFIC_WHITELISTED_LICENSES[prefix]]
       if matched_prefixes:
         used_suppressions.update(set(matched_prefixes))
         continue
@@ -783,6 +1000,12 @@ def main():
                            default=False,
                            help='Ignore path-specific license whitelist.')
   option_parser.add_option('--json', help='Path to JSON output file')
+  option_parser.add_option('--cache',
+                           help='Path to a file caching the licenses of the '
+                           'unchanged directories between runs')
+  option_parser.add_option('-j', '--jobs', type='int',
+                           help='Number of licensecheck.pl processes to run '
+                           'in parallel, defaults to the number of CPUs')
   options, args = option_parser.parse_args()
   return check_licenses(options, args)
 
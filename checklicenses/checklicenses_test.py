@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# Copyright 2017 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unit tests for checklicenses."""
+
+import optparse
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+import checklicenses
+
+
+# Prints a license for each file directly in the directories it is passed, and
+# logs the directories to calls.log.
+_FAKE_LICENSECHECK = """#!%s
+import os
+import sys
+paths = sys.argv[3:]
+with open(os.path.join(os.path.dirname(__file__), 'calls.log'), 'a') as f:
+  f.write(' '.join(paths) + '\\n')
+for path in paths:
+  for name in sorted(os.listdir(path)):
+    if os.path.isfile(os.path.join(path, name)):
+      print '%%s: BSD (3 clause)' %% os.path.join(path, name)
+"""
+
+
+class GetLicensesTest(unittest.TestCase):
+
+  def setUp(self):
+    self.root = tempfile.mkdtemp()
+    self.licensecheck_dir = os.path.join(self.root, 'tools', 'devscripts')
+    os.makedirs(self.licensecheck_dir)
+    self.licensecheck_path = os.path.join(self.licensecheck_dir,
+                                          'licensecheck.pl')
+    with open(self.licensecheck_path, 'w') as f:
+      f.write(_FAKE_LICENSECHECK % sys.executable)
+    os.chmod(self.licensecheck_path, stat.S_IRWXU)
+    for path in ('w.cc', 'a/x.cc', 'a/b/y.cc', 'out/z.cc'):
+      self._WriteFile(path, 'int i;')
+    self.excluded_paths = checklicenses.PathPrefixTrie(['out/', 'tools/'])
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+  def _WriteFile(self, path, contents):
+    path = os.path.join(self.root, path)
+    if not os.path.exists(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+      f.write(contents)
+
+  def _GetLicenses(self, base_directory, cache=None):
+    """Returns the relative paths of the files with licenses, and the
+    directories licensecheck.pl was run on.
+    """
+    log_path = os.path.join(self.licensecheck_dir, 'calls.log')
+    if os.path.exists(log_path):
+      os.remove(log_path)
+    options = optparse.Values({'base_directory': base_directory, 'jobs': 2,
+                               'cache': cache, 'verbose': False})
+    licenses = checklicenses._GetLicenses(options, base_directory,
+                                          self.licensecheck_path,
+                                          self.excluded_paths)
+    checked = []
+    if os.path.exists(log_path):
+      with open(log_path) as f:
+        checked = sorted(os.path.relpath(path, self.root)
+                         for line in f for path in line.split())
+    return ([(os.path.relpath(filename, self.root), license)
+             for filename, license in licenses], checked)
+
+  def testExcludedPaths(self):
+    licenses, checked = self._GetLicenses(self.root)
+    self.assertEqual([('w.cc', ' BSD (3 clause)'),
+                      ('a/x.cc', ' BSD (3 clause)'),
+                      ('a/b/y.cc', ' BSD (3 clause)')], licenses)
+    # Excluded directories are not walked at all.
+    self.assertEqual(['.', 'a', 'a/b'], checked)
+
+  def testTrailingSlash(self):
+    licenses, _ = self._GetLicenses(self.root + '/')
+    self.assertEqual(['w.cc', 'a/x.cc', 'a/b/y.cc'], [l[0] for l in licenses])
+
+  def testCache(self):
+    cache = os.path.join(self.root, 'out', 'cache.json')
+    expected, _ = self._GetLicenses(self.root, cache=cache)
+    self.assertEqual((expected, []), self._GetLicenses(self.root, cache=cache))
+
+    # Only the directory of a modified file is checked again.
+    self._WriteFile('a/b/y.cc', '// Public domain\nint i;')
+    self.assertEqual((expected, ['a/b']),
+                     self._GetLicenses(self.root, cache=cache))
+    # A new version of licensecheck.pl invalidates the whole cache.
+    with open(self.licensecheck_path, 'a') as f:
+      f.write('\n')
+    self.assertEqual((expected, ['.', 'a', 'a/b']),
+                     self._GetLicenses(self.root, cache=cache))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -5,6 +5,7 @@
 
 """Crocodile - compute coverage numbers for Chrome coverage dashboard."""
 
+import multiprocessing
 import optparse
 import os
 import platform
@@ -24,6 +25,108 @@ class CrocStatError(CrocError):
 #------------------------------------------------------------------------------
 
 
+def _LinesToBitmap(line_numbers):
+  """Returns a bitmap of line numbers, as a long with their bits set.
+
+  Args:
+    line_numbers: List of line numbers.
+  """
+  if not line_numbers:
+    return 0
+  digits = bytearray('0' * (max(line_numbers) + 1))
+  for line_no in line_numbers:
+    digits[line_no] = '1'
+  digits.reverse()
+  return long(str(digits), 2)
+
+
+def _BitmapToLines(bitmap):
+  """Returns the line numbers in a bitmap from _LinesToBitmap(), in order."""
+  # bin() starts with '0b' and the highest bit, so reverse it.
+  return [i for i, bit in enumerate(bin(bitmap)[:1:-1]) if bit == '1']
+
+
+def _MergeLcovRecords(records, other_records):
+  """Merges LCOV records from _LinesToRecords() into another dict of them."""
+  for filename, (instrumented, covered, ended) in other_records.iteritems():
+    record = records.get(filename)
+    if record:
+      record[0] |= instrumented
+      record[1] |= covered
+      record[2] |= ended
+    else:
+      records[filename] = [instrumented, covered, ended]
+
+
+# Regexps for the start of records, their end, their data points - that is,
+# executable lines - and the covered ones.
+_LCOV_SF_RE = re.compile(r'^SF:', re.MULTILINE)
+_LCOV_END_RE = re.compile(r'\nend_of_record[ \t\r]*$', re.MULTILINE)
+_LCOV_DA_RE = re.compile(r'\nDA:(\d+),')
+_LCOV_COVERED_DA_RE = re.compile(r'\nDA:(\d+),-?0*[1-9]')
+
+
+def _ParseLcovText(lcov_text, lines_by_filename):
+  """Parses LCOV-formatted data.
+
+  Line numbers are kept as strings, so merging the data of many files is cheap.
+
+  Args:
+    lcov_text: A string of data in LCOV format, without leading whitespace on
+        its lines.
+    lines_by_filename: A dict mapping the filenames of the SF: lines, as is, to
+        [instrumented, covered, ended] lists, to add the data to.
+        instrumented and covered are sets of line numbers, and ended is True if
+        a record for the file was terminated by end_of_record.
+  """
+  # Skip anything before the first record.
+  for record in _LCOV_SF_RE.split(lcov_text)[1:]:
+    # Payload of the SF: line is the filename.  The data keeps the newline
+    # ending it, which starts the regexps.
+    eol = record.find('\n')
+    if eol == -1:
+      eol = len(record)
+    cur_lines = lines_by_filename.setdefault(record[:eol].strip(),
+                                             [set(), set(), False])
+    data = record[eol:]
+    # Data after the end of the record is ignored
+    end = _LCOV_END_RE.search(data)
+    if end:
+      data = data[:end.start()]
+      cur_lines[2] = True
+    cur_lines[0].update(_LCOV_DA_RE.findall(data))
+    cur_lines[1].update(_LCOV_COVERED_DA_RE.findall(data))
+    # (other line types are ignored)
+
+
+def _LinesToRecords(lines_by_filename):
+  """Converts the lines from _ParseLcovText() into compact records.
+
+  Returns:
+    A dict mapping the filenames to [instrumented, covered, ended] records,
+    where instrumented and covered are bitmaps from _LinesToBitmap().
+  """
+  records = {}
+  for filename, (instrumented, covered, ended) in lines_by_filename.iteritems():
+    records[filename] = [_LinesToBitmap(map(int, instrumented)),
+                         _LinesToBitmap(map(int, covered)), ended]
+  return records
+
+
+def _ParseLcovFiles(input_filenames):
+  """Parses .lcov files, returning their merged _LinesToRecords() records."""
+  lines_by_filename = {}
+  for input_filename in input_filenames:
+    lcov_file = open(input_filename, 'rt')
+    try:
+      _ParseLcovText(lcov_file.read(), lines_by_filename)
+    finally:
+      lcov_file.close()
+  return _LinesToRecords(lines_by_filename)
+
+#------------------------------------------------------------------------------
+
+
 class CoverageStats(dict):
   """Coverage statistics."""
 
@@ -177,6 +280,11 @@ class Coverage(object):
     self.add_files_walk = os.walk         # Walk function for AddFiles()
     self.scan_file = croc_scan.ScanFile   # Source scanner for AddFiles()
 
+    # Caches, reset when roots or rules are added
+    self._root_regexps = None   # (compiled root regexp, altname)
+    self._cleaned_filenames = {}  # Map filename --> cleaned up filename
+    self._file_attrs = {}       # Map filename --> ClassifyFile() attrs
+
   def CleanupFilename(self, filename):
     """Cleans up a filename.
 
@@ -190,6 +298,10 @@ class Coverage(object):
     Makes relative paths (those starting with '../' or './' absolute.
     Replaces all instances of root dirs with alternate names.
     """
+    if filename in self._cleaned_filenames:
+      return self._cleaned_filenames[filename]
+    raw_filename = filename
+
     # Change path separators
     filename = filename.replace('\\', '/')
 
@@ -200,16 +312,25 @@ class Coverage(object):
     # If path is relative, make it absolute
     # TODO: Perhaps we should default to relative instead, and only understand
     # absolute to be files starting with '\', '/', or '[A-Za-z]:'?
-    if filename.split('/')[0] in ('.', '..'):
+    relative = filename.split('/')[0] in ('.', '..')
+    if relative:
       filename = os.path.abspath(filename).replace('\\', '/')
 
     # Replace alternate roots
-    for root, alt_name in self.root_dirs:
-      # Windows doesn't care about case sensitivity.
-      if platform.system() in ['Windows', 'Microsoft']:
-        root = root.lower()
-      filename = re.sub('^' + re.escape(root) + '(?=(/|$))',
-                        alt_name, filename)
+    if self._root_regexps is None:
+      self._root_regexps = []
+      for root, alt_name in self.root_dirs:
+        # Windows doesn't care about case sensitivity.
+        if platform.system() in ['Windows', 'Microsoft']:
+          root = root.lower()
+        self._root_regexps.append(
+            (re.compile('^' + re.escape(root) + '(?=(/|$))'), alt_name))
+    for regexp, alt_name in self._root_regexps:
+      filename = regexp.sub(alt_name, filename)
+
+    # Relative paths depend on the current directory, so aren't cached.
+    if not relative:
+      self._cleaned_filenames[raw_filename] = filename
     return filename
 
   def ClassifyFile(self, filename):
@@ -222,14 +343,17 @@ class Coverage(object):
       A dict of attributes for the file, accumulated from the right hand sides
           of rules which fired.
     """
-    attrs = {}
+    if filename not in self._file_attrs:
+      attrs = {}
 
-    # Process all rules
-    for regexp, rhs_dict in self.rules:
-      if regexp.match(filename):
-        attrs.update(rhs_dict)
+      # Process all rules
+      for regexp, rhs_dict in self.rules:
+        if regexp.match(filename):
+          attrs.update(rhs_dict)
 
-    return attrs
+      self._file_attrs[filename] = attrs
+
+    return dict(self._file_attrs[filename])
     # TODO: Files can belong to multiple groups?
     #   (test/source)
     #   (mac/pc/win)
@@ -256,6 +380,8 @@ class Coverage(object):
 
     # Clean up root path based on existing rules
     self.root_dirs.append([self.CleanupFilename(root_path), alt_name])
+    self._root_regexps = None
+    self._cleaned_filenames = {}
 
   def AddRule(self, path_regexp, **kwargs):
     """Adds a rule.
@@ -274,6 +400,7 @@ class Coverage(object):
 
     # Compile regexp ahead of time
     self.rules.append([re.compile(path_regexp), dict(kwargs)])
+    self._file_attrs = {}
 
   def GetCoveredFile(self, filename, add=False):
     """Gets the CoveredFile object for the filename.
@@ -321,6 +448,28 @@ class Coverage(object):
     """
     self.files.pop(cov_file.filename)
 
+  def _AddLcovRecords(self, records):
+    """Adds coverage from parsed LCOV records.
+
+    Args:
+      records: A dict of records, as returned by _LinesToRecords().
+    """
+    for filename, (instrumented, covered, ended) in records.iteritems():
+      cov_file = self.GetCoveredFile(filename, add=True)
+      if not cov_file:
+        # Data for a file we don't care about - so skip it
+        continue
+      cov_file.in_lcov = True       # File was instrumented
+      cov_lines = cov_file.lines
+      for line_no in _BitmapToLines(covered):
+        cov_lines[line_no] = 1
+      for line_no in _BitmapToLines(instrumented & ~covered):
+        # Line is not covered, so track it as uncovered
+        if cov_lines.get(line_no) != 1:
+          cov_lines[line_no] = 0
+      if ended:
+        cov_file.UpdateCoverage()
+
   def ParseLcovData(self, lcov_data):
     """Adds coverage from LCOV-formatted data.
 
@@ -328,32 +477,10 @@ class Coverage(object):
       lcov_data: An iterable returning lines of data in LCOV format.  For
           example, a file or list of strings.
     """
-    cov_file = None
-    cov_lines = None
-    for line in lcov_data:
-      line = line.strip()
-      if line.startswith('SF:'):
-        # Start of data for a new file; payload is filename
-        cov_file = self.GetCoveredFile(line[3:], add=True)
-        if cov_file:
-          cov_lines = cov_file.lines
-          cov_file.in_lcov = True       # File was instrumented
-      elif not cov_file:
-        # Inside data for a file we don't care about - so skip it
-        pass
-      elif line.startswith('DA:'):
-        # Data point - that is, an executable line in current file
-        line_no, is_covered = map(int, line[3:].split(','))
-        if is_covered:
-          # Line is covered
-          cov_lines[line_no] = 1
-        elif cov_lines.get(line_no) != 1:
-          # Line is not covered, so track it as uncovered
-          cov_lines[line_no] = 0
-      elif line == 'end_of_record':
-        cov_file.UpdateCoverage()
-        cov_file = None
-      # (else ignore other line types)
+    lines_by_filename = {}
+    _ParseLcovText('\n'.join(line.strip() for line in lcov_data),
+                   lines_by_filename)
+    self._AddLcovRecords(_LinesToRecords(lines_by_filename))
 
   def ParseLcovFile(self, input_filename):
     """Adds coverage data from a .lcov file.
@@ -362,13 +489,34 @@ class Coverage(object):
       input_filename: Input filename.
     """
     # TODO: All manner of error checking
-    lcov_file = None
+    self._AddLcovRecords(_ParseLcovFiles([input_filename]))
+
+  def ParseLcovFiles(self, input_filenames, jobs=None):
+    """Adds coverage data from .lcov files, parsing them in parallel.
+
+    Args:
+      input_filenames: List of input filenames.
+      jobs: Number of processes to parse the files with.  If None, uses the
+          number of CPUs.
+    """
+    jobs = min(jobs or multiprocessing.cpu_count(), len(input_filenames))
+    if jobs <= 1:
+      self._AddLcovRecords(_ParseLcovFiles(input_filenames))
+      return
+
+    # Each process parses and merges several files, so there are fewer
+    # records to send back and merge here.
+    num_chunks = min(jobs * 4, len(input_filenames))
+    chunks = [input_filenames[i::num_chunks] for i in xrange(num_chunks)]
+    records = {}
+    pool = multiprocessing.Pool(jobs)
     try:
-      lcov_file = open(input_filename, 'rt')
-      self.ParseLcovData(lcov_file)
+      for chunk_records in pool.imap_unordered(_ParseLcovFiles, chunks):
+        _MergeLcovRecords(records, chunk_records)
     finally:
-      if lcov_file:
-        lcov_file.close()
+      pool.close()
+      pool.join()
+    self._AddLcovRecords(records)
 
   def GetStat(self, stat, group='all', default=None):
     """Gets a statistic from the coverage object.
@@ -649,6 +797,9 @@ def Main(argv):
   parser.add_option(
       '-b', '--base_url', dest='base_url', type='string', metavar='URL',
       help='include URL in base tag of HTML output')
+  parser.add_option(
+      '-j', '--jobs', dest='jobs', type='int', metavar='N',
+      help='parse LCOV input with N processes (default: number of CPUs)')
 
   parser.set_defaults(
       inputs=[],
@@ -676,8 +827,7 @@ def Main(argv):
                     addfiles_queue=options.addfiles)
 
   # Parse lcov files
-  for input_filename in options.inputs:
-    cov.ParseLcovFile(input_filename)
+  cov.ParseLcovFiles(options.inputs, jobs=options.jobs)
 
   # Add missing files
   for add_path in options.addfiles:
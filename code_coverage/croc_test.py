@@ -6,7 +6,9 @@
 """Unit tests for Crocodile."""
 
 import os
+import shutil
 import StringIO
+import tempfile
 import unittest
 import croc
 
@@ -428,6 +430,43 @@ class TestCoverage(unittest.TestCase):
     # for those files - probably should set that via some method rather than
     # directly...)
 
+  def testParseLcovFiles(self):
+    """Test ParseLcovFiles()."""
+    temp_dir = tempfile.mkdtemp()
+    try:
+      shards = [
+          ['SF:/src/a.c', 'DA:10,1', 'DA:11,0', 'end_of_record',
+           'SF:/not_src/a.c', 'DA:20,1', 'end_of_record'],
+          ['SF:c:\\source\\a.c', 'DA:10,0', 'DA:11,1', 'DA:300,0',
+           'end_of_record'],
+          ['SF:/src/b.c', 'DA:50,0', 'end_of_record'],
+          ['SF:/src/b.c', 'DA:51,0'],    # Unterminated record
+      ]
+      filenames = []
+      for i, shard in enumerate(shards):
+        filenames.append(os.path.join(temp_dir, '%d.lcov' % i))
+        with open(filenames[-1], 'w') as f:
+          f.write('\n'.join(shard) + '\n')
+
+      for jobs in (1, 2):
+        c = croc.Coverage()
+        c.AddRoot('/src')
+        c.AddRoot('c:\\source')
+        c.AddRule('^_/', include=1, group='my')
+        c.AddRule('.*\\.c$', language='C')
+        c.ParseLcovFiles(filenames, jobs=jobs)
+
+        self.assertEqual(sorted(c.files), ['_/a.c', '_/b.c'])
+        a_c = c.GetCoveredFile('_/a.c')
+        self.assertEqual(a_c.lines, {10: 1, 11: 1, 300: 0})
+        self.assertEqual(a_c.stats['lines_covered'], 2)
+        self.assertEqual(a_c.stats['lines_instrumented'], 3)
+        b_c = c.GetCoveredFile('_/b.c')
+        self.assertEqual(b_c.lines, {50: 0, 51: 0})
+        self.assertEqual(b_c.in_lcov, True)
+    finally:
+      shutil.rmtree(temp_dir)
+
   def testGetStat(self):
     """Test GetStat() and PrintStat()."""
     c = self.cov
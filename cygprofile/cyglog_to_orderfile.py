@@ -250,6 +250,11 @@ def main():
   parser.add_option('--target-arch', action='store', dest='arch',
                     choices=['arm', 'arm64', 'x86', 'x86_64', 'x64', 'mips'],
                     help='The target architecture for libchrome.so')
+  parser.add_option('--demangle-cache-dir', action='store',
+                    dest='demangle_cache_dir',
+                    help='Keep demangled symbol names in a persistent cache '
+                         'in this directory, which can be shared with '
+                         'supersize archive --demangle-cache-dir.')
   options, argv = parser.parse_args(sys.argv)
   if not options.arch:
     options.arch = cygprofile_utils.DetectArchitecture()
@@ -258,6 +263,7 @@ def main():
     return 1
   (log_filename, lib_filename, output_filename) = argv[1:]
   symbol_extractor.SetArchitecture(options.arch)
+  symbol_extractor.SetDemangleCacheDir(options.demangle_cache_dir)
 
   obj_dir = cygprofile_utils.GetObjDir(lib_filename)
 
@@ -5,6 +5,7 @@
 
 """Utilities to get and manipulate symbols from a binary."""
 
+import atexit
 import collections
 import logging
 import os
@@ -20,6 +21,11 @@ sys.path.insert(
                     'scripts'))
 import symbol
 
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), os.pardir, 'binary_size',
+                    'libsupersize'))
+import demangle
+
 _MAX_WARNINGS_TO_PRINT = 200
 
 SymbolInfo = collections.namedtuple('SymbolInfo', ('name', 'offset', 'size',
@@ -160,6 +166,45 @@ def CreateNameToSymbolInfo(symbol_infos):
   return symbol_infos_by_name
 
 
+_demangle_cache_dir = None
+_demangler = None
+
+
+def SetDemangleCacheDir(cache_dir):
+  """Set the directory of the persistent demangle cache, or None for none.
+
+  No persistent cache is used unless this is called. The cache can be shared
+  with supersize archive --demangle-cache-dir.
+  """
+  global _demangle_cache_dir
+  _CloseDemangler()
+  _demangle_cache_dir = cache_dir
+
+
+def _CloseDemangler():
+  global _demangler
+  if _demangler is not None:
+    _demangler.Close()
+    _demangler = None
+
+
+def _GetDemangler():
+  """Returns a Demangler that uses the cache set by SetDemangleCacheDir()."""
+  global _demangler
+  if _demangler is None:
+    _demangler = demangle.Demangler(symbol.ToolPath('c++filt'),
+                                    cache_dir=_demangle_cache_dir)
+  return _demangler
+
+
+atexit.register(_CloseDemangler)
+
+
+def DemangleSymbols(mangled_symbols):
+  """Return a list of the demangled forms of mangled_symbols."""
+  return _GetDemangler().Demangle(mangled_symbols)
+
+
 def DemangleSymbol(mangled_symbol):
   """Return the demangled form of mangled_symbol."""
-  return symbol.CallCppFilt(mangled_symbol)
+  return DemangleSymbols([mangled_symbol])[0]
@@ -51,6 +51,15 @@ class UberClique(object):
     if lang not in tl[id]:
       tl[id][lang] = 1
 
+  def MergeMissingTranslations(self, fallback_translations,
+                               missing_translations):
+    '''Adds the missing translations recorded by another UberClique for the
+    same cliques, e.g. one used to build outputs in a separate process.'''
+    for tl, other_tl in ((self.fallback_translations_, fallback_translations),
+                         (self.missing_translations_, missing_translations)):
+      for id, langs in other_tl.iteritems():
+        tl.setdefault(id, {}).update(langs)
+
   def HasMissingTranslations(self):
     return len(self.missing_translations_) > 0
 
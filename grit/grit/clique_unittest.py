@@ -172,6 +172,24 @@ class MessageCliqueUnittest(unittest.TestCase):
     self.failUnless(report.count('ERROR') == 1)
     self.failUnless(report.count('800120468867715734 "Hello" de') == 1)
 
+  def testMergeMissingTranslations(self):
+    messages = [ tclib.Message(text='Hello'), tclib.Message(text='Goodbye') ]
+    factory = clique.UberClique()
+    cliques = [factory.MakeClique(msg) for msg in messages]
+    cliques[0].MessageForLanguage('de', False, False)
+
+    other_factory = clique.UberClique()
+    other_cliques = [other_factory.MakeClique(msg) for msg in messages]
+    other_cliques[0].MessageForLanguage('fr', False, False)
+    other_cliques[1].MessageForLanguage('fr', False, True)
+
+    factory.MergeMissingTranslations(other_factory.fallback_translations_,
+                                     other_factory.missing_translations_)
+    report = factory.MissingTranslationsReport()
+    self.failUnless(report.count('8053599568341804890 "Goodbye" fr') == 1)
+    self.failUnless(factory.missing_translations_ ==
+                    {cliques[0].GetId(): {'de': 1, 'fr': 1}})
+
   def testCustomTypes(self):
     factory = clique.UberClique()
     message = tclib.Message(text='Bingo bongo')
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# Copyright 2016 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+'''An on-disk cache of values computed from the contents of files.
+
+A build runs many GRIT actions, which parse the same .grd, .grdp and (large)
+.xtb files again and again, and minify and compress the same resources. When a
+cache directory is set, the results are stored in it, keyed by a hash of the
+contents they are computed from, so later GRIT actions can skip the XML
+parsing, and the minifier and gzip processes, altogether.
+
+The cached values only depend on those contents: everything else (e.g. defines
+and the target platform) is applied when the cached values are used, exactly
+as when the file is parsed.
+'''
+
+import hashlib
+import marshal
+import os
+import tempfile
+import types
+import xml.sax
+import xml.sax.handler
+import xml.sax.xmlreader
+
+
+# Bump this when the format of the cached values changes.
+_CACHE_VERSION = '1'
+
+_cache_dir = None
+
+
+def SetCacheDir(cache_dir):
+  '''Sets the directory in which the cache is stored. None disables it.'''
+  global _cache_dir
+  _cache_dir = cache_dir or None
+  if cache_dir and not os.path.isdir(cache_dir):
+    os.makedirs(cache_dir)
+
+
+def IsEnabled():
+  return _cache_dir is not None
+
+
+def _GetPath(kind, content):
+  digest = hashlib.sha1(content).hexdigest()
+  return os.path.join(_cache_dir, '%s-%s-%s' % (kind, _CACHE_VERSION, digest))
+
+
+def Load(kind, content):
+  '''Returns the value stored for the |kind| of value computed from |content|
+  (a string), or None if there isn't one.
+  '''
+  try:
+    with open(_GetPath(kind, content), 'rb') as f:
+      return marshal.load(f)
+  except (IOError, EOFError, ValueError, TypeError):
+    # Missing or truncated cache entries are just cache misses.
+    return None
+
+
+def Store(kind, content, value):
+  '''Stores |value|, which must be marshallable, as the |kind| of value
+  computed from |content|.
+
+  Many GRIT processes may share the cache, so the entry is written to a
+  temporary file first, and then renamed.
+  '''
+  path = _GetPath(kind, content)
+  fd, temp_path = tempfile.mkstemp(dir=_cache_dir)
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      marshal.dump(value, f)
+    os.rename(temp_path, path)
+  except OSError:
+    # Another process stored the entry first (rename() fails if the
+    # destination exists on Windows).
+    os.remove(temp_path)
+
+
+class _RecordingContentHandler(xml.sax.handler.ContentHandler):
+  '''Records the SAX events of a document, to be replayed by _Replay().'''
+
+  def __init__(self):
+    self.events = []
+
+  def startElement(self, name, attrs):
+    self.events.append((name, dict(attrs.items())))
+
+  def endElement(self, name):
+    self.events.append(name)
+
+  def characters(self, content):
+    self.events.append((content,))
+
+
+def _Replay(events, handler):
+  for event in events:
+    if isinstance(event, types.TupleType):
+      if len(event) == 2:
+        handler.startElement(event[0], xml.sax.xmlreader.AttributesImpl(
+            event[1]))
+      else:
+        handler.characters(event[0])
+    else:
+      handler.endElement(event)
+
+
+def ParseXml(source, handler):
+  '''Parses the XML file |source| with the SAX content |handler|.
+
+  Only the startElement(), endElement() and characters() events are cached,
+  so those are the only ones |handler| can rely on. |source| is a filename or
+  a stream. Streams are never cached.
+  '''
+  if _cache_dir is None or not isinstance(source, types.StringTypes):
+    xml.sax.parse(source, handler)
+    return
+
+  with open(source, 'rb') as f:
+    content = f.read()
+  events = Load('xml', content)
+  if events is None:
+    recorder = _RecordingContentHandler()
+    xml.sax.parse(source, recorder)
+    events = recorder.events
+    Store('xml', content, events)
+  _Replay(events, handler)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# Copyright 2016 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+'''Unit tests for grit.content_cache'''
+
+
+import os
+import sys
+if __name__ == '__main__':
+  sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import StringIO
+import unittest
+
+from grit import grd_reader
+from grit import content_cache
+from grit import util
+from grit import xtb_reader
+
+
+class ContentCacheUnittest(unittest.TestCase):
+  def setUp(self):
+    self.cache_dir = util.TempDir({})
+    content_cache.SetCacheDir(self.cache_dir.GetPath())
+
+  def tearDown(self):
+    content_cache.SetCacheDir(None)
+    self.cache_dir.CleanUp()
+
+  def testGrdWithParts(self):
+    top_grd = u'''\
+        <grit latest_public_release="2" current_release="3">
+          <release seq="3">
+            <messages>
+              <message name="IDS_TEST" desc="test">
+                test <ph name="USER">%s<ex>Joi</ex></ph>
+              </message>
+              <part file="sub.grp" />
+            </messages>
+          </release>
+        </grit>'''
+    sub_grd = u'''\
+        <grit-part>
+          <message name="IDS_TEST2" desc="test2">test2</message>
+        </grit-part>'''
+    with util.TempDir({'top.grd': top_grd, 'sub.grp': sub_grd}) as temp_dir:
+      grd_path = temp_dir.GetPath('top.grd')
+      content_cache.SetCacheDir(None)
+      expected = grd_reader.Parse(grd_path).FormatXml()
+
+      content_cache.SetCacheDir(self.cache_dir.GetPath())
+      self.assertEqual(expected, grd_reader.Parse(grd_path).FormatXml())
+      self.assertEqual(2, len(os.listdir(self.cache_dir.GetPath())))
+      self.assertEqual(expected, grd_reader.Parse(grd_path).FormatXml())
+
+      # Entries are keyed by contents: editing a file is not a cache hit.
+      with open(temp_dir.GetPath('sub.grp'), 'w') as f:
+        f.write(sub_grd.replace('test2', 'test3'))
+      self.assertEqual(expected.replace('test2', 'test3'),
+                       grd_reader.Parse(grd_path).FormatXml())
+      self.assertEqual(3, len(os.listdir(self.cache_dir.GetPath())))
+
+  def testXtbDefines(self):
+    xtb = '''<?xml version="1.0" encoding="UTF-8"?>
+      <!DOCTYPE translationbundle>
+      <translationbundle lang="fr">
+        <translation id="1">Bingo <ph name="USER"/>.</translation>
+        <if expr="pp_ifdef('foo')">
+          <translation id="2">Bongo</translation>
+        </if>
+      </translationbundle>'''
+
+    def ParseXtb(defs):
+      messages = []
+      def Callback(id, structure):
+        messages.append((id, structure))
+      lang = xtb_reader.Parse(StringIO.StringIO(xtb), Callback, defs=defs)
+      self.assertEqual('fr', lang)
+      return messages
+
+    content_cache.SetCacheDir(None)
+    expected_without_foo = ParseXtb({})
+    expected_with_foo = ParseXtb({'foo': '1'})
+    self.assertEqual(2, len(expected_with_foo))
+
+    content_cache.SetCacheDir(self.cache_dir.GetPath())
+    for _ in range(2):
+      self.assertEqual(expected_without_foo, ParseXtb({}))
+      self.assertEqual(expected_with_foo, ParseXtb({'foo': '1'}))
+    self.assertEqual(1, len(os.listdir(self.cache_dir.GetPath())))
+
+  def testCorruptEntry(self):
+    content = 'some file contents'
+    content_cache.Store('test', content, [(u'a', {u'b': u'c'}), u'a'])
+    self.assertEqual([(u'a', {u'b': u'c'}), u'a'],
+                     content_cache.Load('test', content))
+    entry, = os.listdir(self.cache_dir.GetPath())
+    with open(os.path.join(self.cache_dir.GetPath(), entry), 'r+b') as f:
+      f.truncate(5)
+    self.assertEqual(None, content_cache.Load('test', content))
+    self.assertEqual(None, content_cache.Load('test', 'other contents'))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -7,8 +7,12 @@
 files.
 """
 
+import bisect
 import collections
+import cStringIO
 import exceptions
+import mmap
+import multiprocessing.pool
 import os
 import struct
 import sys
@@ -16,6 +20,7 @@ if __name__ == '__main__':
   sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
 
 from grit import util
+from grit.format import rc_header
 from grit.node import include
 from grit.node import message
 from grit.node import structure
@@ -33,89 +38,253 @@ class CorruptDataPack(Exception):
   pass
 
 
-DataPackContents = collections.namedtuple(
-    'DataPackContents', 'resources encoding')
+class DataPackContents(collections.namedtuple(
+    'DataPackContents', 'resources encoding')):
+  """The resources and encoding of a data pack.
+
+  The resources of a pack read by ReadDataPack() are read from an mmap of the
+  file, which stays open until close() is called (or the resources are garbage
+  collected). It can be used as a context manager that closes it.
+  """
+  __slots__ = ()
+
+  def close(self):
+    """Closes the file the resources are read from, if any. The resources
+    can no longer be read afterwards."""
+    close = getattr(self.resources, 'close', None)
+    if close:
+      close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+
+# The number of threads Format() uses to get the data of <include> nodes.
+_include_jobs = 1
+
+
+def SetIncludeJobs(jobs):
+  """Sets the number of <include> nodes which data Format() gets concurrently.
+
+  The data of an <include> node may be minified and compressed by other
+  processes, so getting it can take a while, but mostly waiting. Callers should
+  set it back to 1 once done formatting.
+  """
+  global _include_jobs
+  _include_jobs = jobs
 
 
 def Format(root, lang='en', output_dir='.'):
   """Writes out the data pack file format (platform agnostic resource file)."""
   data = {}
   root.info = []
-  for node in root.ActiveDescendants():
-    with node:
-      if isinstance(node, (include.IncludeNode, message.MessageNode,
-                           structure.StructureNode)):
-        id, value = node.GetDataPackPair(lang, UTF8)
-        if value is not None:
-          data[id] = value
-          root.info.append(
-              '{},{},{}'.format(node.attrs.get('name'), id, node.source))
+  nodes = [node for node in root.ActiveDescendants()
+           if isinstance(node, (include.IncludeNode, message.MessageNode,
+                                structure.StructureNode))]
+  for node, (id, value) in zip(nodes, _GetDataPackPairs(root, nodes, lang)):
+    if value is not None:
+      data[id] = value
+      root.info.append(
+          '{},{},{}'.format(node.attrs.get('name'), id, node.source))
   return WriteDataPackToString(data, UTF8)
 
 
+def _GetDataPackPair(node, lang):
+  with node:
+    return node.GetDataPackPair(lang, UTF8)
+
+
+class _IncludeJobExit(Exception):
+  """Raised in place of SystemExit by the threads of _GetDataPackPairs().
+
+  The threads of a ThreadPool only pass Exceptions on to the pool, and stop on
+  other exceptions (e.g. sys.exit() when the minifier fails), which makes the
+  pool wait forever for their results.
+  """
+
+  def __init__(self, code):
+    super(_IncludeJobExit, self).__init__(code)
+    self.code = code
+
+
+def _GetDataPackPairInThread(node, lang):
+  try:
+    return _GetDataPackPair(node, lang)
+  except SystemExit as e:
+    raise _IncludeJobExit(e.code)
+
+
+def _GetDataPackPairs(root, nodes, lang):
+  """Returns the list of the data pack pairs of |nodes|."""
+  include_nodes = [node for node in nodes
+                   if isinstance(node, include.IncludeNode)]
+  if _include_jobs <= 1 or len(include_nodes) <= 1:
+    return [_GetDataPackPair(node, lang) for node in nodes]
+
+  # Compute the ids, which are cached, before the threads look them up.
+  rc_header.GetIds(root)
+  pool = multiprocessing.pool.ThreadPool(
+      min(_include_jobs, len(include_nodes)))
+  try:
+    include_pairs = pool.map(lambda node: _GetDataPackPairInThread(node, lang),
+                             include_nodes, chunksize=1)
+  except _IncludeJobExit as e:
+    sys.exit(e.code)
+  finally:
+    pool.terminate()
+  pair_by_include = dict(zip(map(id, include_nodes), include_pairs))
+  return [pair_by_include[id(node)] if id(node) in pair_by_include
+          else _GetDataPackPair(node, lang) for node in nodes]
+
+
+class _PackResources(collections.Mapping):
+  """The resources of a data pack, a mapping of id=>data.
+
+  Only the index and alias tables are read up front. The data of a resource is
+  read on demand from the contents of the data pack, which is a string or an
+  mmap of the file, after bisecting the tables (which are sorted by id).
+  """
+
+  def __init__(self, data, index_offset, resource_count, alias_count):
+    self._data = data
+    # Each index entry is a uint16 and a uint32. There is an extra entry at the
+    # end for the size of the last resource, then the alias table.
+    index = struct.unpack_from('<' + 'HI' * (resource_count + 1), data,
+                               index_offset)
+    self._ids = index[0:2 * resource_count:2]
+    self._offsets = index[1::2]
+    # Each alias entry is two uint16.
+    aliases = struct.unpack_from('<' + 'HH' * alias_count, data,
+                                 index_offset + (resource_count + 1) * 6)
+    self._alias_ids = aliases[0::2]
+    self._alias_indexes = aliases[1::2]
+
+  def _GetIndex(self, resource_id):
+    """Returns the index table entry holding the data of |resource_id|, or
+    None if there is no such resource."""
+    ids = self._ids
+    index = bisect.bisect_left(ids, resource_id)
+    if index < len(ids) and ids[index] == resource_id:
+      return index
+    alias_ids = self._alias_ids
+    alias = bisect.bisect_left(alias_ids, resource_id)
+    if alias < len(alias_ids) and alias_ids[alias] == resource_id:
+      return self._alias_indexes[alias]
+    return None
+
+  def __getitem__(self, resource_id):
+    index = self._GetIndex(resource_id)
+    if index is None:
+      raise KeyError(resource_id)
+    return self._data[self._offsets[index]:self._offsets[index + 1]]
+
+  def GetSize(self, resource_id):
+    """Returns the size of the data of |resource_id|, without reading it."""
+    index = self._GetIndex(resource_id)
+    if index is None:
+      raise KeyError(resource_id)
+    return self._offsets[index + 1] - self._offsets[index]
+
+  def get(self, resource_id, default=None):
+    index = self._GetIndex(resource_id)
+    if index is None:
+      return default
+    return self._data[self._offsets[index]:self._offsets[index + 1]]
+
+  def __contains__(self, resource_id):
+    return self._GetIndex(resource_id) is not None
+
+  def __iter__(self):
+    return iter(sorted(self._ids + self._alias_ids))
+
+  def __len__(self):
+    return len(self._ids) + len(self._alias_ids)
+
+  def GetCanonicalId(self, resource_id):
+    """Returns the id of the resource which data |resource_id| shares, i.e.
+    |resource_id| itself unless it is an alias."""
+    index = self._GetIndex(resource_id)
+    if index is None:
+      raise KeyError(resource_id)
+    return self._ids[index]
+
+  def close(self):
+    """Closes the mmap the data is read from, if any."""
+    if isinstance(self._data, mmap.mmap):
+      self._data.close()
+
+
 def ReadDataPack(input_file):
-  return ReadDataPackFromString(util.ReadFile(input_file, util.BINARY))
+  """Reads a data pack file. Its resources are read on demand from an mmap of
+  the file, rather than loaded in memory. Call close() on the result (or use it
+  as a context manager) to close the mmap once done with them."""
+  with open(input_file, 'rb') as file:
+    data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+  return ReadDataPackFromString(data)
 
 
 def ReadDataPackFromString(data):
-  """Reads a data pack file and returns a dictionary."""
-  original_data = data
-
+  """Reads a data pack file from a string (or an mmap). Returns a
+  DataPackContents, which resources are read from |data| on demand."""
   # Read the header.
-  version = struct.unpack('<I', data[:4])[0]
+  version = struct.unpack_from('<I', data)[0]
   if version == 4:
-    resource_count, encoding = struct.unpack('<IB', data[4:9])
+    resource_count, encoding = struct.unpack_from('<IB', data, 4)
     alias_count = 0
-    data = data[9:]
+    index_offset = 9
   elif version == 5:
-    encoding, resource_count, alias_count = struct.unpack('<BxxxHH', data[4:12])
-    data = data[12:]
+    encoding, resource_count, alias_count = struct.unpack_from(
+        '<BxxxHH', data, 4)
+    index_offset = 12
   else:
     raise WrongFileVersion('Found version: ' + str(version))
 
-  resources = {}
-  kIndexEntrySize = 2 + 4  # Each entry is a uint16 and a uint32.
-  def entry_at_index(idx):
-    offset = idx * kIndexEntrySize
-    return struct.unpack('<HI', data[offset:offset + kIndexEntrySize])
-
-  prev_resource_id, prev_offset = entry_at_index(0)
-  for i in xrange(1, resource_count + 1):
-    resource_id, offset = entry_at_index(i)
-    resources[prev_resource_id] = original_data[prev_offset:offset]
-    prev_resource_id, prev_offset = resource_id, offset
-
-  # Read the alias table.
-  alias_data = data[(resource_count + 1) * kIndexEntrySize:]
-  kAliasEntrySize = 2 + 2  # uint16, uint16
-  def alias_at_index(idx):
-    offset = idx * kAliasEntrySize
-    return struct.unpack('<HH', alias_data[offset:offset + kAliasEntrySize])
-
-  for i in xrange(alias_count):
-    resource_id, index = alias_at_index(i)
-    aliased_id = entry_at_index(index)[0]
-    resources[resource_id] = resources[aliased_id]
-
+  resources = _PackResources(data, index_offset, resource_count, alias_count)
   return DataPackContents(resources, encoding)
 
 
-def WriteDataPackToString(resources, encoding):
-  """Returns a string with a map of id=>data in the data pack format."""
-  ret = []
+def _WriteDataPack(file, resources, encoding):
+  """Writes a map of id=>data into |file| in the data pack format.
 
-  # Compute alias map.
+  |resources| can be any mapping, e.g. the resources of other data packs. Its
+  data is read one resource at a time, and never held in memory. The sizes of
+  the resources are taken from its GetSize() method, if any, rather than by
+  reading their data.
+  """
+  # Compute alias map, i.e. resource_id -> resource_id, where value < key.
+  # Only resources of the same size can have the same data, so the data of
+  # just one group of same size resources is held in memory at a time. Go
+  # through the ids in ascending order, so that for duplicates lower IDs are
+  # the ones which are kept.
   resource_ids = sorted(resources)
-  # Use reversed() so that for duplicates lower IDs clobber higher ones.
-  id_by_data = {resources[k]: k for k in reversed(resource_ids)}
-  # Map of resource_id -> resource_id, where value < key.
-  alias_map = {k: id_by_data[v] for k, v in resources.iteritems()
-               if id_by_data[v] != k}
+  get_size = getattr(resources, 'GetSize', None)
+  if get_size is None:
+    get_size = lambda resource_id: len(resources[resource_id])
+  size_by_id = {}
+  ids_by_size = collections.defaultdict(list)
+  for resource_id in resource_ids:
+    size = get_size(resource_id)
+    size_by_id[resource_id] = size
+    ids_by_size[size].append(resource_id)
+  alias_map = {}
+  for same_size_ids in ids_by_size.itervalues():
+    if len(same_size_ids) == 1:
+      continue
+    id_by_data = {}
+    for resource_id in same_size_ids:
+      data = resources[resource_id]
+      if data in id_by_data:
+        alias_map[resource_id] = id_by_data[data]
+      else:
+        id_by_data[data] = resource_id
 
   # Write file header.
   resource_count = len(resources) - len(alias_map)
   # Padding bytes added for alignment.
-  ret.append(struct.pack('<IBxxxHH', PACK_FILE_VERSION, encoding,
+  file.write(struct.pack('<IBxxxHH', PACK_FILE_VERSION, encoding,
                          resource_count, len(alias_map)))
   HEADER_LENGTH = 4 + 4 + 2 + 2
 
@@ -125,37 +294,42 @@ def WriteDataPackToString(resources, encoding):
 
   # Write main table.
   index_by_id = {}
-  deduped_data = []
+  deduped_ids = []
   index = 0
   for resource_id in resource_ids:
     if resource_id in alias_map:
       continue
-    data = resources[resource_id]
     index_by_id[resource_id] = index
-    ret.append(struct.pack('<HI', resource_id, data_offset))
-    data_offset += len(data)
-    deduped_data.append(data)
+    file.write(struct.pack('<HI', resource_id, data_offset))
+    data_offset += size_by_id[resource_id]
+    deduped_ids.append(resource_id)
     index += 1
 
   assert index == resource_count
   # Add an extra entry at the end.
-  ret.append(struct.pack('<HI', 0, data_offset))
+  file.write(struct.pack('<HI', 0, data_offset))
 
   # Write alias table.
   for resource_id in sorted(alias_map):
     index = index_by_id[alias_map[resource_id]]
-    ret.append(struct.pack('<HH', resource_id, index))
+    file.write(struct.pack('<HH', resource_id, index))
 
   # Write data.
-  ret.extend(deduped_data)
-  return ''.join(ret)
+  for resource_id in deduped_ids:
+    file.write(resources[resource_id])
+
+
+def WriteDataPackToString(resources, encoding):
+  """Returns a string with a map of id=>data in the data pack format."""
+  ret = cStringIO.StringIO()
+  _WriteDataPack(ret, resources, encoding)
+  return ret.getvalue()
 
 
 def WriteDataPack(resources, output_file, encoding):
   """Writes a map of id=>data into output_file as a data pack."""
-  content = WriteDataPackToString(resources, encoding)
   with open(output_file, 'wb') as file:
-    file.write(content)
+    _WriteDataPack(file, resources, encoding)
 
 
 def RePack(output_file, input_files, whitelist_file=None,
@@ -175,15 +349,23 @@ def RePack(output_file, input_files, whitelist_file=None,
       KeyError: if there are duplicate keys or resource encoding is
       inconsistent.
   """
-  input_data_packs = [ReadDataPack(filename) for filename in input_files]
   input_info_files = [filename + '.info' for filename in input_files]
   whitelist = None
   if whitelist_file:
     whitelist = util.ReadFile(whitelist_file, util.RAW_TEXT).strip().split('\n')
     whitelist = set(map(int, whitelist))
-  resources, encoding = RePackFromDataPackStrings(
-      input_data_packs, whitelist, suppress_removed_key_output)
-  WriteDataPack(resources, output_file, encoding)
+  input_data_packs = []
+  try:
+    for filename in input_files:
+      input_data_packs.append(ReadDataPack(filename))
+    # The resources are streamed from the (mmapped) input files to the output
+    # file, rather than loaded in memory.
+    inputs_by_id, encoding = _RePackInputsById(
+        input_data_packs, whitelist, suppress_removed_key_output)
+    WriteDataPack(_RePackedResources(inputs_by_id), output_file, encoding)
+  finally:
+    for input_data_pack in input_data_packs:
+      input_data_pack.close()
   with open(output_file + '.info', 'w') as output_info_file:
     for filename in input_info_files:
       with open(filename, 'r') as info_file:
@@ -208,11 +390,25 @@ def RePackFromDataPackStrings(inputs, whitelist,
       KeyError: if there are duplicate keys or resource encoding is
       inconsistent.
   """
-  resources = {}
+  inputs_by_id, encoding = _RePackInputsById(inputs, whitelist,
+                                             suppress_removed_key_output)
+  resources = dict((resource_id, input_resources[resource_id])
+                   for resource_id, input_resources in inputs_by_id.iteritems())
+  return DataPackContents(resources, encoding)
+
+
+def _RePackInputsById(inputs, whitelist, suppress_removed_key_output):
+  """Combines the resources of |inputs| (see RePackFromDataPackStrings()).
+
+  Returns:
+      A tuple of the map of resource_id=>resources of the input containing it,
+      and the encoding of the combined data pack.
+  """
+  inputs_by_id = {}
   encoding = None
   for content in inputs:
     # Make sure we have no dups.
-    duplicate_keys = set(content.resources.keys()) & set(resources.keys())
+    duplicate_keys = set(content.resources.keys()) & set(inputs_by_id.keys())
     if duplicate_keys:
       raise exceptions.KeyError('Duplicate keys: ' + str(list(duplicate_keys)))
 
@@ -224,22 +420,44 @@ def RePackFromDataPackStrings(inputs, whitelist,
                                 ' vs ' + str(content.encoding))
 
     if whitelist:
-      whitelisted_resources = dict([(key, content.resources[key])
-                                    for key in content.resources.keys()
-                                    if key in whitelist])
-      resources.update(whitelisted_resources)
+      inputs_by_id.update((key, content.resources)
+                          for key in content.resources.keys()
+                          if key in whitelist)
       removed_keys = [key for key in content.resources.keys()
                       if key not in whitelist]
       if not suppress_removed_key_output:
         for key in removed_keys:
           print 'RePackFromDataPackStrings Removed Key:', key
     else:
-      resources.update(content.resources)
+      inputs_by_id.update((key, content.resources)
+                          for key in content.resources.keys())
 
   # Encoding is 0 for BINARY, 1 for UTF8 and 2 for UTF16
   if encoding is None:
     encoding = BINARY
-  return DataPackContents(resources, encoding)
+  return inputs_by_id, encoding
+
+
+class _RePackedResources(collections.Mapping):
+  """The combined resources of several data packs, a mapping of id=>data.
+
+  The data is read from the input data packs on demand.
+  """
+
+  def __init__(self, inputs_by_id):
+    self._inputs_by_id = inputs_by_id
+
+  def __getitem__(self, resource_id):
+    return self._inputs_by_id[resource_id][resource_id]
+
+  def GetSize(self, resource_id):
+    return self._inputs_by_id[resource_id].GetSize(resource_id)
+
+  def __iter__(self):
+    return iter(self._inputs_by_id)
+
+  def __len__(self):
+    return len(self._inputs_by_id)
 
 
 # Temporary hack for external programs that import data_pack.
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# Copyright 2017 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmarks reading and repacking large data pack files.
+
+Writes synthetic data packs to a temporary directory, then times looking up
+resources in them and repacking them, and reports the peak memory use.
+"""
+
+import argparse
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+if __name__ == '__main__':
+  sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
+
+from grit.format import data_pack
+
+
+def _WriteInputs(temp_dir, num_inputs, num_resources, resource_size):
+  rnd = random.Random(0)
+  input_files = []
+  resource_id = 1
+  for i in xrange(num_inputs):
+    resources = {}
+    for _ in xrange(num_resources):
+      # A few resources have the same data, to exercise aliases.
+      if rnd.random() < 0.05 and resources:
+        resources[resource_id] = resources[resource_id - 1]
+      else:
+        resources[resource_id] = os.urandom(rnd.randint(1, 2 * resource_size))
+      resource_id += 1
+    input_file = os.path.join(temp_dir, 'input%d.pak' % i)
+    data_pack.WriteDataPack(resources, input_file, data_pack.BINARY)
+    with open(input_file + '.info', 'w') as info_file:
+      info_file.write('input%d\n' % i)
+    input_files.append(input_file)
+  return input_files, resource_id - 1
+
+
+def _MaxRssMb():
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--inputs', type=int, default=4)
+  parser.add_argument('--resources', type=int, default=4000,
+                      help='Number of resources in each input.')
+  parser.add_argument('--resource-size', type=int, default=8192,
+                      help='Average size of a resource, in bytes.')
+  parser.add_argument('--lookups', type=int, default=100000)
+  args = parser.parse_args()
+
+  temp_dir = tempfile.mkdtemp()
+  try:
+    input_files, max_id = _WriteInputs(temp_dir, args.inputs, args.resources,
+                                       args.resource_size)
+    input_size = sum(os.path.getsize(f) for f in input_files)
+    print 'Inputs: %d files, %.1f MB' % (len(input_files), input_size / 1e6)
+    rss_before = _MaxRssMb()
+
+    start_time = time.time()
+    with data_pack.ReadDataPack(input_files[-1]) as pack:
+      print 'ReadDataPack: %.3fs' % (time.time() - start_time)
+      start_time = time.time()
+      rnd = random.Random(0)
+      for _ in xrange(args.lookups):
+        pack.resources.get(rnd.randint(1, max_id))
+    print '%d lookups: %.2fs' % (args.lookups, time.time() - start_time)
+
+    start_time = time.time()
+    data_pack.RePack(os.path.join(temp_dir, 'output.pak'), input_files,
+                     suppress_removed_key_output=True)
+    print 'RePack: %.2fs' % (time.time() - start_time)
+    # Note that this includes the pages of the mmapped input files.
+    print 'Peak RSS growth: %.1f MB' % (_MaxRssMb() - rss_before)
+  finally:
+    shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+  main()
@@ -11,9 +11,14 @@ import sys
 if __name__ == '__main__':
   sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
 
+import gzip
+import StringIO
 import unittest
 
+from grit import content_cache
+from grit import util
 from grit.format import data_pack
+from grit.format import minifier
 
 
 class FormatDataPackUnittest(unittest.TestCase):
@@ -94,6 +99,134 @@ class FormatDataPackUnittest(unittest.TestCase):
     self.assertDictEqual(expected_without_whitelist, output,
                          'Incorrect resource output')
 
+  def testReadDataPackFile(self):
+    resources = {1: '', 4: 'this is id 4', 6: 'this is id 6', 10: ''}
+    with util.TempDir({}) as temp_dir:
+      pak = temp_dir.GetPath('test.pak')
+      data_pack.WriteDataPack(resources, pak, data_pack.UTF8)
+      with data_pack.ReadDataPack(pak) as loaded:
+        self.assertEqual(data_pack.UTF8, loaded.encoding)
+        self.assertEqual(resources, dict(loaded.resources))
+        self.assertEqual([1, 4, 6, 10], list(loaded.resources))
+        self.assertEqual('this is id 6', loaded.resources[6])
+        self.assertFalse(5 in loaded.resources)
+        self.assertEqual(None, loaded.resources.get(5))
+        self.assertRaises(KeyError, lambda: loaded.resources[11])
+        self.assertEqual(1, loaded.resources.GetCanonicalId(10))
+        self.assertEqual(4, loaded.resources.GetCanonicalId(4))
+        self.assertEqual(12, loaded.resources.GetSize(6))
+        self.assertEqual(0, loaded.resources.GetSize(10))
+        self.assertRaises(KeyError, lambda: loaded.resources.GetSize(11))
+      # The mmap of the file is closed.
+      self.assertRaises(ValueError, lambda: loaded.resources[4])
+
+  def testRePack(self):
+    inputs = [{1: 'Never gonna', 4: 'click', 10: 'give you up'},
+              {20: 'Never gonna', 30: 'give you up', 32: 'oops'}]
+    with util.TempDir({}) as temp_dir:
+      input_files = []
+      for i, resources in enumerate(inputs):
+        input_file = temp_dir.GetPath('input%d.pak' % i)
+        data_pack.WriteDataPack(resources, input_file, data_pack.UTF8)
+        with open(input_file + '.info', 'w') as f:
+          f.write('info%d\n' % i)
+        input_files.append(input_file)
+      whitelist_file = temp_dir.GetPath('whitelist.txt')
+      with open(whitelist_file, 'w') as f:
+        f.write('1\n10\n20\n30\n32\n')
+      output_file = temp_dir.GetPath('output.pak')
+      data_pack.RePack(output_file, input_files, whitelist_file,
+                       suppress_removed_key_output=True)
+
+      expected_resources = {1: 'Never gonna', 10: 'give you up',
+                            20: 'Never gonna', 30: 'give you up', 32: 'oops'}
+      with open(output_file, 'rb') as f:
+        self.assertEqual(
+            data_pack.WriteDataPackToString(expected_resources, data_pack.UTF8),
+            f.read())
+      with open(output_file + '.info') as f:
+        self.assertEqual('info0\ninfo1\n', f.read())
+
+  def testWriteDataPackReadsSizes(self):
+    # The data of resources of a unique size is only read to be written.
+    class Resources(dict):
+      def __init__(self, *args):
+        super(Resources, self).__init__(*args)
+        self.reads = []
+
+      def __getitem__(self, resource_id):
+        self.reads.append(resource_id)
+        return super(Resources, self).__getitem__(resource_id)
+
+      def GetSize(self, resource_id):
+        return len(super(Resources, self).__getitem__(resource_id))
+
+    resources = Resources({1: 'a', 2: 'bb', 3: 'cc', 4: 'ddd', 5: 'bb'})
+    output = data_pack.WriteDataPackToString(resources, data_pack.UTF8)
+    self.assertEqual(1, resources.reads.count(1))
+    self.assertEqual(1, resources.reads.count(4))
+    self.assertEqual(dict(resources),
+                     dict(data_pack.ReadDataPackFromString(output).resources))
+
+  def testFormatIncludeJobs(self):
+    files = {'minify.py': 'import sys\nprint sys.stdin.read().upper()\n'}
+    includes = []
+    for i in range(4):
+      files['file%d.js' % i] = 'var i = %d;' % i
+      includes.append('<include name="IDR_FILE%d" file="file%d.js" '
+                      'type="BINDATA" compress="gzip" />' % (i, i))
+    with util.TempDir(files) as temp_dir:
+      root = util.ParseGrdForUnittest(
+          '<includes>%s</includes>' % ''.join(includes),
+          base_dir=temp_dir.GetPath())
+      root.SetOutputLanguage('en')
+      minifier.SetJsMinifier(
+          '%s %s' % (sys.executable, temp_dir.GetPath('minify.py')))
+      cache_dir = temp_dir.GetPath('cache')
+      try:
+        expected = data_pack.Format(root)
+        data_pack.SetIncludeJobs(3)
+        self.assertEqual(expected, data_pack.Format(root))
+        content_cache.SetCacheDir(cache_dir)
+        self.assertEqual(expected, data_pack.Format(root))
+        # The minified and the compressed data of each file.
+        self.assertEqual(8, len(os.listdir(cache_dir)))
+        self.assertEqual(expected, data_pack.Format(root))
+      finally:
+        content_cache.SetCacheDir(None)
+        data_pack.SetIncludeJobs(1)
+        minifier.SetJsMinifier('')
+    resources = data_pack.ReadDataPackFromString(expected).resources
+    self.assertEqual(4, len(resources))
+    for data in resources.values():
+      with gzip.GzipFile(fileobj=StringIO.StringIO(data)) as f:
+        self.assertTrue(f.read().startswith('VAR I = '))
+
+  def testFormatIncludeJobsMinifierFailure(self):
+    # A failing minifier exits, which must not leave the pool of threads
+    # waiting for the data it was getting.
+    files = {'fail.py': 'import sys\nsys.exit(3)\n'}
+    includes = []
+    for i in range(4):
+      files['file%d.js' % i] = 'var i = %d;' % i
+      includes.append('<include name="IDR_FILE%d" file="file%d.js" '
+                      'type="BINDATA" />' % (i, i))
+    with util.TempDir(files) as temp_dir:
+      root = util.ParseGrdForUnittest(
+          '<includes>%s</includes>' % ''.join(includes),
+          base_dir=temp_dir.GetPath())
+      root.SetOutputLanguage('en')
+      minifier.SetJsMinifier(
+          '%s %s' % (sys.executable, temp_dir.GetPath('fail.py')))
+      try:
+        data_pack.SetIncludeJobs(4)
+        with self.assertRaises(SystemExit) as context:
+          data_pack.Format(root)
+      finally:
+        data_pack.SetIncludeJobs(1)
+        minifier.SetJsMinifier('')
+    self.assertEqual(3, context.exception.code)
+
 
 if __name__ == '__main__':
   unittest.main()
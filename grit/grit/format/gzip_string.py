@@ -7,8 +7,30 @@ import cStringIO
 import gzip
 import subprocess
 
+from grit import content_cache
+
+
+def _Compress(kind, compress, data):
+  '''Returns compress(data), from content_cache if it is enabled. The output
+  of both compression functions below only depends on their input.'''
+  if not content_cache.IsEnabled():
+    return compress(data)
+  compressed = content_cache.Load(kind, data)
+  if compressed is None:
+    compressed = compress(data)
+    content_cache.Store(kind, data, compressed)
+  return compressed
+
 
 def GzipStringRsyncable(data):
+  return _Compress('gzip-rsyncable', _GzipStringRsyncable, data)
+
+
+def GzipString(data):
+  return _Compress('gzip', _GzipString, data)
+
+
+def _GzipStringRsyncable(data):
   # Make call to host system's gzip to get access to --rsyncable option. This
   # option makes updates much smaller - if one line is changed in the resource,
   # it won't have to push the entire compressed resource with the update.
@@ -27,7 +49,7 @@ def GzipStringRsyncable(data):
   return data
 
 
-def GzipString(data):
+def _GzipString(data):
   # Gzipping using Python's built in gzip: Windows doesn't ship with gzip, and
   # OSX's gzip does not have an --rsyncable option built in. Although this is
   # not preferable to --rsyncable, it is an option for the systems that do
@@ -13,6 +13,8 @@ if __name__ == '__main__':
 
 import unittest
 
+from grit import content_cache
+from grit import util
 from grit.format import gzip_string
 
 
@@ -57,6 +59,18 @@ class FormatGzipStringUnittest(unittest.TestCase):
       output = f.read()
     self.failUnless(output == input)
 
+  def testGzipStringCache(self):
+    input = 'TEST STRING ' * 100
+    compressed = gzip_string.GzipString(input)
+    with util.TempDir({}) as cache_dir:
+      content_cache.SetCacheDir(cache_dir.GetPath())
+      try:
+        self.assertEqual(compressed, gzip_string.GzipString(input))
+        self.assertEqual(compressed, gzip_string.GzipString(input))
+        self.assertEqual(1, len(os.listdir(cache_dir.GetPath())))
+      finally:
+        content_cache.SetCacheDir(None)
+
 
 if __name__ == '__main__':
   unittest.main()
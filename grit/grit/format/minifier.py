@@ -7,6 +7,8 @@ from os import path
 import subprocess
 import sys
 
+from grit import content_cache
+
 __js_minifier = None
 
 
@@ -24,6 +26,18 @@ def Minify(source, filename):
   if path.abspath(filename).endswith(
       '/chrome/renderer/resources/extensions/searchbox_api.js'):
     return source
+  if content_cache.IsEnabled():
+    # The output only depends on the minifier command and the source.
+    cache_key = '\0'.join(__js_minifier + ['', source])
+    minified = content_cache.Load('minify', cache_key)
+    if minified is None:
+      minified = _RunJsMinifier(source, filename)
+      content_cache.Store('minify', cache_key, minified)
+    return minified
+  return _RunJsMinifier(source, filename)
+
+
+def _RunJsMinifier(source, filename):
   p = subprocess.Popen(
       __js_minifier,
       stdin=subprocess.PIPE,
@@ -11,6 +11,7 @@ import types
 import xml.sax
 import xml.sax.handler
 
+from grit import content_cache
 from grit import exception
 from grit import util
 from grit.format import rc_header
@@ -94,7 +95,7 @@ class GrdContentHandler(xml.sax.handler.ContentHandler):
       oldsource = self.source
       try:
         self.source = partname
-        xml.sax.parse(partname, GrdPartContentHandler(self))
+        content_cache.ParseXml(partname, GrdPartContentHandler(self))
       finally:
         self.source = oldsource
 
@@ -197,7 +198,7 @@ def Parse(filename_or_stream, dir=None, stop_after=None, first_ids_file=None,
                               defines=defines, tags_to_ignore=tags_to_ignore,
                               target_platform=target_platform, source=source)
   try:
-    xml.sax.parse(filename_or_stream, handler)
+    content_cache.ParseXml(filename_or_stream, handler)
   except StopParsingException:
     assert stop_after
     pass
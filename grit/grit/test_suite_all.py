@@ -24,6 +24,7 @@ class TestSuiteAll(unittest.TestSuite):
     # Imports placed here to prevent circular imports.
     # pylint: disable-msg=C6204
     import grit.clique_unittest
+    import grit.content_cache_unittest
     import grit.grd_reader_unittest
     import grit.grit_runner_unittest
     import grit.lazy_re_unittest
@@ -69,6 +70,7 @@ class TestSuiteAll(unittest.TestSuite):
 
     test_classes = [
         grit.clique_unittest.MessageCliqueUnittest,
+        grit.content_cache_unittest.ContentCacheUnittest,
         grit.grd_reader_unittest.GrdReaderUnittest,
         grit.grit_runner_unittest.OptionArgsUnittest,
         grit.lazy_re_unittest.LazyReUnittest,
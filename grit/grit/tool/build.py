@@ -10,13 +10,17 @@ SCons build system.
 import codecs
 import filecmp
 import getopt
+import multiprocessing
 import os
 import shutil
 import sys
+import time
 
+from grit import content_cache
 from grit import grd_reader
 from grit import shortcuts
 from grit import util
+from grit.format import data_pack
 from grit.format import minifier
 from grit.node import include
 from grit.node import message
@@ -140,6 +144,23 @@ Options:
                     minified Javascript to standard output. A non-zero exit
                     status will be taken as indicating failure.
 
+  -j JOBS, --jobs JOBS
+                    Generate up to JOBS output files concurrently, using a
+                    pool of processes which share the parsed resource tree
+                    (on platforms which support fork()). The remaining jobs
+                    are used to minify and compress the included files of
+                    data packs concurrently. The output files are identical
+                    to the ones generated serially. Defaults to 1.
+
+  --output-timing   Print the time it took to generate each output file,
+                    slowest first.
+
+  --cache-dir DIR   Cache the results of parsing the .grd, .grdp and .xtb
+                    files, and of minifying and compressing resources, in DIR.
+                    Results are keyed by the contents they are computed from,
+                    and used instead of computing them again. DIR can be
+                    shared by all the GRIT invocations of a build.
+
 Conditional inclusion of resources only affects the output of files which
 control which resources get linked into a binary, e.g. it affects .rc files
 meant for compilation but it does not affect resource header files (that define
@@ -164,15 +185,19 @@ are exported to translation interchange files (e.g. XMB files), etc.
     write_only_new = False
     depend_on_stamp = False
     js_minifier = None
+    cache_dir = None
     replace_ellipsis = True
-    (own_opts, args) = getopt.getopt(args, 'a:p:o:D:E:f:w:t:h:',
+    (own_opts, args) = getopt.getopt(args, 'a:p:o:D:E:f:w:t:h:j:',
         ('depdir=','depfile=','assert-file-list=',
          'output-all-resource-defines',
          'no-output-all-resource-defines',
          'no-replace-ellipsis',
          'depend-on-stamp',
          'js-minifier=',
-         'write-only-new='))
+         'write-only-new=',
+         'jobs=',
+         'output-timing',
+         'cache-dir='))
     for (key, val) in own_opts:
       if key == '-a':
         assert_output_files.append(val)
@@ -216,6 +241,12 @@ are exported to translation interchange files (e.g. XMB files), etc.
         depend_on_stamp = True
       elif key == '--js-minifier':
         js_minifier = val
+      elif key in ('-j', '--jobs'):
+        self.jobs = int(val)
+      elif key == '--output-timing':
+        self.output_timing = True
+      elif key == '--cache-dir':
+        cache_dir = val
 
     if len(args):
       print 'This tool takes no tool-specific arguments.'
@@ -240,6 +271,9 @@ are exported to translation interchange files (e.g. XMB files), etc.
 
     self.write_only_new = write_only_new
 
+    if cache_dir:
+      content_cache.SetCacheDir(cache_dir)
+
     self.res = grd_reader.Parse(opts.input,
                                 debug=opts.extra_verbose,
                                 first_ids_file=first_ids_file,
@@ -302,6 +336,12 @@ are exported to translation interchange files (e.g. XMB files), etc.
     # Whether to compare outputs to their old contents before writing.
     self.write_only_new = False
 
+    # The maximum number of output files to generate concurrently.
+    self.jobs = 1
+
+    # Whether to print how long each output file took to generate.
+    self.output_timing = False
+
   @staticmethod
   def AddWhitelistTags(start_node, whitelist_names):
     # Walk the tree of nodes added attributes for the nodes that shouldn't
@@ -362,70 +402,28 @@ are exported to translation interchange files (e.g. XMB files), etc.
     if self.whitelist_names:
       self.AddWhitelistTags(self.res, self.whitelist_names)
 
-    for output in self.res.GetOutputFiles():
-      self.VerboseOut('Creating %s...' % output.GetOutputFilename())
-
-      # Microsoft's RC compiler can only deal with single-byte or double-byte
-      # files (no UTF-8), so we make all RC files UTF-16 to support all
-      # character sets.
-      if output.GetType() in ('rc_header', 'resource_map_header',
-          'resource_map_source', 'resource_file_map_source'):
-        encoding = 'cp1252'
-      elif output.GetType() in ('android', 'c_format', 'js_map_format', 'plist',
-                                'plist_strings', 'doc', 'json', 'android_policy'):
-        encoding = 'utf_8'
-      elif output.GetType() in ('chrome_messages_json'):
-        # Chrome Web Store currently expects BOM for UTF-8 files :-(
-        encoding = 'utf-8-sig'
-      else:
-        # TODO(gfeher) modify here to set utf-8 encoding for admx/adml
-        encoding = 'utf_16'
-
-      # Set the context, for conditional inclusion of resources
-      self.res.SetOutputLanguage(output.GetLanguage())
-      self.res.SetOutputContext(output.GetContext())
-      self.res.SetFallbackToDefaultLayout(output.GetFallbackToDefaultLayout())
-      self.res.SetDefines(self.defines)
-
-      # Make the output directory if it doesn't exist.
+    outputs = self.res.GetOutputFiles()
+    for output in outputs:
+      # Make the output directory if it doesn't exist. This is done up front,
+      # as outputs may be generated concurrently.
       self.MakeDirectoriesTo(output.GetOutputFilename())
 
-      # Write the results to a temporary file and only overwrite the original
-      # if the file changed.  This avoids unnecessary rebuilds.
-      outfile = self.fo_create(output.GetOutputFilename() + '.tmp', 'wb')
-
-      if output.GetType() != 'data_package':
-        outfile = util.WrapOutputStream(outfile, encoding)
-
-      # Iterate in-order through entire resource tree, calling formatters on
-      # the entry into a node and on exit out of it.
-      with outfile:
-        self.ProcessNode(self.res, output, outfile)
-
-      # Now copy from the temp file back to the real output, but on Windows,
-      # only if the real output doesn't exist or the contents of the file
-      # changed.  This prevents identical headers from being written and .cc
-      # files from recompiling (which is painful on Windows).
-      if not os.path.exists(output.GetOutputFilename()):
-        os.rename(output.GetOutputFilename() + '.tmp',
-                  output.GetOutputFilename())
-      else:
-        # CHROMIUM SPECIFIC CHANGE.
-        # This clashes with gyp + vstudio, which expect the output timestamp
-        # to change on a rebuild, even if nothing has changed, so only do
-        # it when opted in.
-        if not self.write_only_new:
-          write_file = True
-        else:
-          files_match = filecmp.cmp(output.GetOutputFilename(),
-              output.GetOutputFilename() + '.tmp')
-          write_file = not files_match
-        if write_file:
-          shutil.copy2(output.GetOutputFilename() + '.tmp',
-                       output.GetOutputFilename())
-        os.remove(output.GetOutputFilename() + '.tmp')
-
-      self.VerboseOut(' done.\n')
+    if self.jobs > 1 and len(outputs) > 1 and hasattr(os, 'fork'):
+      timings = self._ProcessOutputsInParallel(outputs)
+    else:
+      # Use the jobs to get the (minified, compressed) data of the <include>
+      # nodes of data packs concurrently instead.
+      data_pack.SetIncludeJobs(self.jobs)
+      try:
+        timings = [self._ProcessOutput(output) for output in outputs]
+      finally:
+        data_pack.SetIncludeJobs(1)
+
+    if self.output_timing:
+      print 'Output generation times:'
+      for elapsed, output in sorted(zip(timings, outputs), reverse=True,
+                                    key=lambda timing: timing[0]):
+        print '  %7.3fs  %s' % (elapsed, output.GetOutputFilename())
 
     # Print warnings if there are any duplicate shortcuts.
     warnings = shortcuts.GenerateDuplicateShortcutsWarnings(
@@ -445,6 +443,104 @@ are exported to translation interchange files (e.g. XMB files), etc.
       sys.exit(-1)
 
 
+  def _ProcessOutput(self, output):
+    '''Generates a single output file. Returns the time it took, in seconds.
+    '''
+    start_time = time.time()
+    self.VerboseOut('Creating %s...' % output.GetOutputFilename())
+
+    # Microsoft's RC compiler can only deal with single-byte or double-byte
+    # files (no UTF-8), so we make all RC files UTF-16 to support all
+    # character sets.
+    if output.GetType() in ('rc_header', 'resource_map_header',
+        'resource_map_source', 'resource_file_map_source'):
+      encoding = 'cp1252'
+    elif output.GetType() in ('android', 'c_format', 'js_map_format', 'plist',
+                              'plist_strings', 'doc', 'json', 'android_policy'):
+      encoding = 'utf_8'
+    elif output.GetType() in ('chrome_messages_json'):
+      # Chrome Web Store currently expects BOM for UTF-8 files :-(
+      encoding = 'utf-8-sig'
+    else:
+      # TODO(gfeher) modify here to set utf-8 encoding for admx/adml
+      encoding = 'utf_16'
+
+    # Set the context, for conditional inclusion of resources
+    self.res.SetOutputLanguage(output.GetLanguage())
+    self.res.SetOutputContext(output.GetContext())
+    self.res.SetFallbackToDefaultLayout(output.GetFallbackToDefaultLayout())
+    self.res.SetDefines(self.defines)
+
+    # Write the results to a temporary file and only overwrite the original
+    # if the file changed.  This avoids unnecessary rebuilds.
+    outfile = self.fo_create(output.GetOutputFilename() + '.tmp', 'wb')
+
+    if output.GetType() != 'data_package':
+      outfile = util.WrapOutputStream(outfile, encoding)
+
+    # Iterate in-order through entire resource tree, calling formatters on
+    # the entry into a node and on exit out of it.
+    with outfile:
+      self.ProcessNode(self.res, output, outfile)
+
+    # Now copy from the temp file back to the real output, but on Windows,
+    # only if the real output doesn't exist or the contents of the file
+    # changed.  This prevents identical headers from being written and .cc
+    # files from recompiling (which is painful on Windows).
+    if not os.path.exists(output.GetOutputFilename()):
+      os.rename(output.GetOutputFilename() + '.tmp',
+                output.GetOutputFilename())
+    else:
+      # CHROMIUM SPECIFIC CHANGE.
+      # This clashes with gyp + vstudio, which expect the output timestamp
+      # to change on a rebuild, even if nothing has changed, so only do
+      # it when opted in.
+      if not self.write_only_new:
+        write_file = True
+      else:
+        files_match = filecmp.cmp(output.GetOutputFilename(),
+            output.GetOutputFilename() + '.tmp')
+        write_file = not files_match
+      if write_file:
+        shutil.copy2(output.GetOutputFilename() + '.tmp',
+                     output.GetOutputFilename())
+      os.remove(output.GetOutputFilename() + '.tmp')
+
+    self.VerboseOut(' done.\n')
+    return time.time() - start_time
+
+  def _ProcessOutputsInParallel(self, outputs):
+    '''Generates |outputs| using a pool of forked processes.
+
+    Each process inherits the (copy-on-write) resource tree, in which it sets
+    the output context of the outputs it generates. Missing translations are
+    recorded by each process, and merged back into this process.
+
+    Returns the list of the times it took to generate each output.
+    '''
+    global _parallel_builder
+    _parallel_builder = self
+    processes = min(self.jobs, len(outputs))
+    # Share the remaining jobs between the processes, for them to get the data
+    # of <include> nodes concurrently.
+    data_pack.SetIncludeJobs(max(1, self.jobs // processes))
+    pool = multiprocessing.Pool(processes)
+    try:
+      results = pool.map(_ProcessOutputInWorker, range(len(outputs)),
+                         chunksize=1)
+    except _WorkerExit as e:
+      sys.exit(e.code)
+    finally:
+      pool.terminate()
+      _parallel_builder = None
+      data_pack.SetIncludeJobs(1)
+    timings = []
+    for elapsed, fallback_translations, missing_translations in results:
+      self.res.UberClique().MergeMissingTranslations(fallback_translations,
+                                                     missing_translations)
+      timings.append(elapsed)
+    return timings
+
   def CheckAssertedOutputFiles(self, assert_output_files):
     '''Checks that the asserted output files are specified in the given list.
 
@@ -541,3 +637,37 @@ Extra output files:
     dir = os.path.split(file)[0]
     if not os.path.exists(dir):
       os.makedirs(dir)
+
+
+# The builder used by the processes of RcBuilder._ProcessOutputsInParallel. It
+# is set before the processes are forked, so that they inherit it.
+_parallel_builder = None
+
+
+class _WorkerExit(Exception):
+  '''Raised in place of SystemExit by the processes of the pool.
+
+  The processes of a multiprocessing.Pool only pass Exceptions on to the pool,
+  and die on other exceptions (e.g. sys.exit() when the minifier fails), which
+  makes the pool wait forever for their results.
+  '''
+
+  def __init__(self, code):
+    super(_WorkerExit, self).__init__(code)
+    self.code = code
+
+
+def _ProcessOutputInWorker(index):
+  builder = _parallel_builder
+  uberclique = builder.res.UberClique()
+  # Only report the missing translations found while generating this output.
+  uberclique.fallback_translations_ = {}
+  uberclique.missing_translations_ = {}
+  try:
+    elapsed = builder._ProcessOutput(builder.res.GetOutputFiles()[index])
+  except SystemExit as e:
+    raise _WorkerExit(e.code)
+  except KeyboardInterrupt:
+    raise _WorkerExit(1)
+  return (elapsed, uberclique.fallback_translations_,
+          uberclique.missing_translations_)
@@ -16,6 +16,8 @@ if __name__ == '__main__':
 import unittest
 
 from grit import util
+from grit.format import data_pack
+from grit.format import minifier
 from grit.tool import build
 
 
@@ -331,6 +333,74 @@ class BuildUnittest(unittest.TestCase):
     self.assertTrue(abs(second_mtime - UNCHANGED) > 5)
     self.assertTrue(abs(third_mtime - UNCHANGED) < 5)
 
+  def testParallelJobs(self):
+    class DummyOpts(object):
+      def __init__(self):
+        self.input = util.PathFromRoot('grit/testdata/substitute.grd')
+        self.verbose = False
+        self.extra_verbose = False
+    serial_dir = tempfile.mkdtemp()
+    serial_builder = build.RcBuilder()
+    serial_builder.Run(DummyOpts(), ['-o', serial_dir])
+    parallel_dir = tempfile.mkdtemp()
+    parallel_builder = build.RcBuilder()
+    parallel_builder.Run(DummyOpts(), ['-o', parallel_dir, '-j', '6'])
+    # The jobs used for <include> nodes do not outlive the build.
+    self.assertEqual(1, data_pack._include_jobs)
+
+    filenames = sorted(os.listdir(serial_dir))
+    self.assertEqual(3, len(filenames))
+    self.assertEqual(filenames, sorted(os.listdir(parallel_dir)))
+    for filename in filenames:
+      with open(os.path.join(serial_dir, filename), 'rb') as f:
+        serial_output = f.read()
+      with open(os.path.join(parallel_dir, filename), 'rb') as f:
+        self.assertEqual(serial_output, f.read())
+
+    serial_uberclique = serial_builder.res.UberClique()
+    parallel_uberclique = parallel_builder.res.UberClique()
+    self.assertEqual(serial_uberclique.fallback_translations_,
+                     parallel_uberclique.fallback_translations_)
+    self.assertEqual(serial_uberclique.missing_translations_,
+                     parallel_uberclique.missing_translations_)
+
+  def testParallelJobsMinifierFailure(self):
+    # A failing minifier exits, which must not leave the pool of processes
+    # waiting for the output it was generating.
+    files = {
+      'fail.py': 'import sys\nsys.exit(3)\n',
+      'a.js': 'var a = 1;',
+      'b.js': 'var b = 2;',
+      'test.grd': '''<?xml version="1.0" encoding="UTF-8"?>
+        <grit latest_public_release="0" current_release="1">
+          <outputs>
+            <output filename="a.pak" type="data_package" />
+            <output filename="b.pak" type="data_package" />
+          </outputs>
+          <release seq="1">
+            <includes>
+              <include name="IDR_A" file="a.js" type="BINDATA" />
+              <include name="IDR_B" file="b.js" type="BINDATA" />
+            </includes>
+          </release>
+        </grit>''',
+    }
+    with util.TempDir(files) as temp_dir:
+      class DummyOpts(object):
+        def __init__(self):
+          self.input = temp_dir.GetPath('test.grd')
+          self.verbose = False
+          self.extra_verbose = False
+      builder = build.RcBuilder()
+      js_minifier = '%s %s' % (sys.executable, temp_dir.GetPath('fail.py'))
+      try:
+        with self.assertRaises(SystemExit) as context:
+          builder.Run(DummyOpts(), ['-o', temp_dir.GetPath('out'),
+                                    '--js-minifier', js_minifier, '-j', '2'])
+      finally:
+        minifier.SetJsMinifier('')
+    self.assertEqual(3, context.exception.code)
+
   def testGenerateDepFileWithDependOnStamp(self):
     output_dir = tempfile.mkdtemp()
     builder = build.RcBuilder()
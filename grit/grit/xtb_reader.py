@@ -13,6 +13,8 @@ import xml.sax.handler
 
 import grit.node.base
 
+from grit import content_cache
+
 
 class XtbContentHandler(xml.sax.handler.ContentHandler):
   '''A content handler that calls a given callback function for each
@@ -61,28 +63,24 @@ class XtbContentHandler(xml.sax.handler.ContentHandler):
   def endElement(self, name):
     if name == 'translation':
       assert self.current_id != 0
-
-      defs = self.defines
-      def pp_ifdef(define):
-        return define in defs
-      def pp_if(define):
-        return define in defs and defs[define]
-
-      # If we're in an if block, only call the callback (add the translation)
-      # if the expression is True.
-      should_run_callback = True
-      if self.if_expr:
-        should_run_callback = grit.node.base.Node.EvaluateExpression(
-            self.if_expr, self.defines, self.target_platform)
-      if should_run_callback:
-        self.callback(self.current_id, self.current_structure)
-
+      self.AddTranslation(self.current_id, self.current_structure,
+                          self.if_expr)
       self.current_id = 0
       self.current_structure = []
     elif name == 'if':
       assert self.if_expr is not None
       self.if_expr = None
 
+  def AddTranslation(self, id, structure, if_expr):
+    # If we're in an if block, only call the callback (add the translation)
+    # if the expression is True.
+    should_run_callback = True
+    if if_expr:
+      should_run_callback = grit.node.base.Node.EvaluateExpression(
+          if_expr, self.defines, self.target_platform)
+    if should_run_callback:
+      self.callback(id, structure)
+
   def characters(self, content):
     if self.current_id != 0:
       # We are inside a <translation> node so just add the characters to our
@@ -94,6 +92,19 @@ class XtbContentHandler(xml.sax.handler.ContentHandler):
       self.current_structure.append((False, content))
 
 
+class _XtbRecordingContentHandler(XtbContentHandler):
+  '''A content handler that records all the translations in the XTB file,
+  along with the if expressions they depend on, for content_cache.
+  '''
+
+  def __init__(self):
+    XtbContentHandler.__init__(self, callback=None)
+    self.translations = []
+
+  def AddTranslation(self, id, structure, if_expr):
+    self.translations.append((id, structure, if_expr))
+
+
 class XtbErrorHandler(xml.sax.handler.ErrorHandler):
   def error(self, exception):
     pass
@@ -126,16 +137,34 @@ def Parse(xtb_file, callback_function, defs=None, debug=False,
   Return:
     The language of the XTB, e.g. 'fr'
   '''
+  handler = XtbContentHandler(callback=callback_function, defs=defs,
+                              debug=debug, target_platform=target_platform)
+  if not content_cache.IsEnabled():
+    _ParseBundle(xtb_file, handler)
+    assert handler.language != ''
+    return handler.language
+
+  content = xtb_file.read()
+  cached = content_cache.Load('xtb', content)
+  if cached is None:
+    recorder = _XtbRecordingContentHandler()
+    xtb_file.seek(0)
+    _ParseBundle(xtb_file, recorder)
+    cached = (recorder.language, recorder.translations)
+    content_cache.Store('xtb', content, cached)
+  language, translations = cached
+  for id, structure, if_expr in translations:
+    handler.AddTranslation(id, structure, if_expr)
+  assert language != ''
+  return language
+
+
+def _ParseBundle(xtb_file, handler):
   # Start by advancing the file pointer past the DOCTYPE thing, as the TC
   # uses a path to the DTD that only works in Unix.
   # TODO(joi) Remove this ugly hack by getting the TC gang to change the
   # XTB files somehow?
   front_of_file = xtb_file.read(1024)
   xtb_file.seek(front_of_file.find('<translationbundle'))
-
-  handler = XtbContentHandler(callback=callback_function, defs=defs,
-                              debug=debug, target_platform=target_platform)
   xml.sax.parse(xtb_file, handler)
-  assert handler.language != ''
-  return handler.language
 
@@ -33,7 +33,6 @@ def _ExtractMain(args):
 
 def _PrintMain(args):
   pak = data_pack.ReadDataPack(args.pak_file)
-  id_map = {id(v): k for k, v in sorted(pak.resources.items(), reverse=True)}
   encoding = 'binary'
   if pak.encoding == 1:
     encoding = 'utf-8'
@@ -58,7 +57,7 @@ def _PrintMain(args):
       except UnicodeDecodeError:
         pass
     sha1 = hashlib.sha1(data).hexdigest()[:10]
-    canonical_id = id_map[id(data)]
+    canonical_id = pak.resources.GetCanonicalId(resource_id)
     if resource_id == canonical_id:
       line = u'Entry(id={}, len={}, sha1={}): {}'.format(
           resource_id, len(data), sha1, desc)
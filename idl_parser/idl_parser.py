@@ -29,8 +29,11 @@
 # pylint: disable=R0201
 # pylint: disable=C0301
 
+import cPickle
+import hashlib
 import os.path
 import sys
+import tempfile
 import time
 
 from idl_lexer import IDLLexer
@@ -1154,11 +1157,26 @@ class IDLParser(object):
   def LastToken(self):
     return self.lexer.last
 
-  def __init__(self, lexer, verbose=False, debug=False, mute_error=False):
+  def __init__(self, lexer, verbose=False, debug=False, mute_error=False,
+               outputdir=None):
     self.lexer = lexer
     self.tokens = lexer.KnownTokens()
-    self.yaccobj = yacc.yacc(module=self, tabmodule=None, debug=debug,
-                             optimize=0, write_tables=0)
+    self.yaccobj = None
+    if outputdir:
+      # Load the LALR tables pickled by a previous run instead of generating
+      # them again.  Yacc checks them against the signature of the grammar and
+      # regenerates (and rewrites) them if they are stale.
+      picklefile = os.path.join(outputdir,
+                                '%s_tables.pickle' % type(self).__name__)
+      try:
+        self.yaccobj = yacc.yacc(module=self, debug=debug, optimize=0,
+                                 picklefile=picklefile)
+      except Exception:
+        # The tables may have been truncated by a concurrent writer.
+        pass
+    if not self.yaccobj:
+      self.yaccobj = yacc.yacc(module=self, tabmodule=None, debug=debug,
+                               optimize=0, write_tables=0)
     self.parse_debug = debug
     self.verbose = verbose
     self.mute_error = mute_error
@@ -1167,6 +1185,7 @@ class IDLParser(object):
     self._last_error_msg = None
     self._last_error_lineno = 0
     self._last_error_pos = 0
+    self._signature = None
 
 
 #
@@ -1248,6 +1267,27 @@ class IDLParser(object):
     # pylint: disable=W0212
     return self._parse_errors + self.lexer._lex_errors
 
+#
+# GetSignature
+#
+# Returns a hash of the sources of the parser and lexer classes, which changes
+# whenever the grammar, the tokens or the generated nodes may change.
+#
+  def GetSignature(self):
+    if not self._signature:
+      sha = hashlib.sha1()
+      classes = type(self).__mro__ + type(self.lexer).__mro__ + (IDLNode,)
+      for cls in classes:
+        if cls is object:
+          continue
+        source = sys.modules[cls.__module__].__file__
+        if source.endswith('.pyc'):
+          source = source[:-1]
+        with open(source, 'rb') as fileobject:
+          sha.update(fileobject.read())
+      self._signature = sha.hexdigest()
+    return self._signature
+
 #
 # ParseData
 #
@@ -1272,13 +1312,54 @@ class IDLParser(object):
 
 
 
-def ParseFile(parser, filename):
-  """Parse a file and return a File type of node."""
+def _GetCachePath(parser, filename, data, cache_dir):
+  sha = hashlib.sha1(parser.GetSignature())
+  sha.update('\0%s\0' % filename)
+  sha.update(data)
+  return os.path.join(cache_dir, sha.hexdigest() + '.ast')
+
+
+def _LoadCachedFile(path):
+  try:
+    with open(path, 'rb') as fileobject:
+      return cPickle.load(fileobject)
+  except (IOError, EOFError, cPickle.UnpicklingError):
+    return None
+
+
+def _StoreCachedFile(path, node):
+  fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+  try:
+    with os.fdopen(fd, 'wb') as fileobject:
+      cPickle.dump(node, fileobject, cPickle.HIGHEST_PROTOCOL)
+    os.rename(temp_path, path)
+  except (IOError, OSError):
+    if os.path.exists(temp_path):
+      os.remove(temp_path)
+
+
+def ParseFile(parser, filename, cache_dir=None):
+  """Parse a file and return a File type of node.
+
+  If |cache_dir| is set, the trees of files which parse without errors are
+  cached there, keyed by the file contents and the parser signature.
+  """
   with open(filename) as fileobject:
     try:
-      out = parser.ParseText(filename, fileobject.read())
+      data = fileobject.read()
+      out = None
+      if cache_dir:
+        cache_path = _GetCachePath(parser, filename, data, cache_dir)
+        out = _LoadCachedFile(cache_path)
+      if out is None:
+        out = parser.ParseText(filename, data)
+        if cache_dir and out and not parser.GetErrors():
+          _StoreCachedFile(cache_path, out)
+        errors = parser.GetErrors()
+      else:
+        errors = 0
       out.SetProperty('DATETIME', time.ctime(os.path.getmtime(filename)))
-      out.SetProperty('ERRORS', parser.GetErrors())
+      out.SetProperty('ERRORS', errors)
       return out
 
     except Exception as e:
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# Copyright 2017 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmarks the per-invocation cost of parsing IDL files.
+
+Each invocation runs in a fresh process, as it would in a build: it constructs
+an IDLParser and parses the given files (or a synthetic one).  Invocations are
+timed without caches, with the parser tables cached, and with both the parser
+tables and the parsed trees cached.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from idl_lexer import IDLLexer
+from idl_parser import IDLParser, ParseFile
+
+
+def _WriteSyntheticIdl(filename, num_interfaces):
+  with open(filename, 'w') as f:
+    for i in xrange(num_interfaces):
+      f.write('interface Foo%d : Bar {\n'
+              '  attribute long x;\n'
+              '  [Clamp] void f(DOMString s, optional long n);\n'
+              '  readonly attribute sequence<Foo> items;\n'
+              '};\n'
+              'dictionary Dict%d { long a = 1; DOMString b; };\n' % (i, i))
+
+
+def _Invoke(filenames, tables_dir, cache_dir):
+  start = time.time()
+  parser = IDLParser(IDLLexer(), mute_error=True, outputdir=tables_dir)
+  startup = time.time() - start
+  for filename in filenames:
+    ParseFile(parser, filename, cache_dir=cache_dir)
+  print startup, time.time() - start
+
+
+def _TimeInvocations(args, filenames, tables_dir, cache_dir):
+  cmd = [sys.executable, __file__, '--invoke',
+         '--tables-dir', tables_dir or '', '--cache-dir', cache_dir or '']
+  startups = []
+  totals = []
+  for _ in xrange(args.runs):
+    output = subprocess.check_output(cmd + filenames)
+    startup, total = [float(x) for x in output.split()]
+    startups.append(startup)
+    totals.append(total)
+  # The first run fills the caches, so report the best run.
+  return min(startups), min(totals)
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('filenames', nargs='*')
+  parser.add_argument('--runs', type=int, default=5)
+  parser.add_argument('--interfaces', type=int, default=300,
+                      help='Size of the synthetic file parsed if no files '
+                           'are given.')
+  parser.add_argument('--invoke', action='store_true', help=argparse.SUPPRESS)
+  parser.add_argument('--tables-dir', help=argparse.SUPPRESS)
+  parser.add_argument('--cache-dir', help=argparse.SUPPRESS)
+  args = parser.parse_args(argv)
+
+  if args.invoke:
+    _Invoke(args.filenames, args.tables_dir, args.cache_dir)
+    return 0
+
+  temp_dir = tempfile.mkdtemp()
+  try:
+    filenames = [os.path.abspath(f) for f in args.filenames]
+    if not filenames:
+      filenames = [os.path.join(temp_dir, 'synthetic.idl')]
+      _WriteSyntheticIdl(filenames[0], args.interfaces)
+    tables_dir = os.path.join(temp_dir, 'tables')
+    cache_dir = os.path.join(temp_dir, 'cache')
+    os.mkdir(tables_dir)
+    os.mkdir(cache_dir)
+    for name, tables, cache in (('no caches', None, None),
+                                ('parser tables', tables_dir, None),
+                                ('tables and trees', tables_dir, cache_dir)):
+      startup, total = _TimeInvocations(args, filenames, tables, cache)
+      print '%-18s startup %.3fs, invocation %.3fs' % (name, startup, total)
+  finally:
+    shutil.rmtree(temp_dir)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
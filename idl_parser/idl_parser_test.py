@@ -5,6 +5,8 @@
 
 import glob
 import os
+import shutil
+import tempfile
 import unittest
 
 from idl_lexer import IDLLexer
@@ -52,6 +54,56 @@ class WebIDLParser(unittest.TestCase):
         self._TestNode(node)
 
 
+class TestCaches(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.temp_dir, 'test.idl')
+    self._WriteIdl('interface I { attribute long a; };')
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def _WriteIdl(self, idl_text):
+    with open(self.filename, 'w') as f:
+      f.write(idl_text)
+
+  def _CacheFiles(self):
+    return glob.glob(os.path.join(self.temp_dir, '*.ast'))
+
+  def testParserTables(self):
+    expected = IDLParser(IDLLexer()).ParseText('test.idl', 'enum E { "a" };')
+    for _ in range(2):
+      parser = IDLParser(IDLLexer(), outputdir=self.temp_dir)
+      filenode = parser.ParseText('test.idl', 'enum E { "a" };')
+      self.assertEqual(expected.Tree(), filenode.Tree())
+    self.assertTrue(os.path.exists(
+        os.path.join(self.temp_dir, 'IDLParser_tables.pickle')))
+
+  def testAstCache(self):
+    parser = IDLParser(IDLLexer())
+    expected = ParseFile(parser, self.filename)
+    filenode = ParseFile(parser, self.filename, cache_dir=self.temp_dir)
+    self.assertEqual(1, len(self._CacheFiles()))
+    cached = ParseFile(parser, self.filename, cache_dir=self.temp_dir)
+    self.assertEqual(expected.Tree(), filenode.Tree())
+    self.assertEqual(expected.Tree(), cached.Tree())
+    self.assertEqual(0, cached.GetProperty('ERRORS'))
+
+    self._WriteIdl('interface I { attribute long b; };')
+    filenode = ParseFile(parser, self.filename, cache_dir=self.temp_dir)
+    self.assertEqual('b', filenode.GetChildren()[0].GetChildren()[0].GetName())
+    self.assertEqual(2, len(self._CacheFiles()))
+
+  def testAstCacheSkipsErrors(self):
+    self._WriteIdl('interface I { attribute long; };')
+    parser = IDLParser(IDLLexer(), mute_error=True)
+    for _ in range(2):
+      filenode = ParseFile(parser, self.filename, cache_dir=self.temp_dir)
+      self.assertEqual(1, filenode.GetProperty('ERRORS'))
+    self.assertEqual([], self._CacheFiles())
+
+
 class TestImplements(unittest.TestCase):
 
   def setUp(self):
@@ -7,70 +7,43 @@
 json.loads.
 '''
 
+import re
 import sys
 
 
-def _Rcount(string, chars):
-  '''Returns the number of consecutive characters from |chars| that occur at the
-  end of |string|.
-  '''
-  return len(string) - len(string.rstrip(chars))
-
-
-def _FindNextToken(string, tokens, start):
-  '''Finds the next token in |tokens| that occurs in |string| from |start|.
-  Returns a tuple (index, token key).
-  '''
-  for index, item in enumerate(string, start):
-    for k in tokens:
-      if (string[index:index + len(k)] == k):
-        return (index, k)
-
-  return (-1, None)
+# Matches, in a single pass, the string literals (which are kept so that
+# comment markers inside them are ignored) and the comments to remove.  The
+# last alternative catches unterminated strings and multiline comments.
+_TOKENS = re.compile(r'''
+    "[^"\\]*(?:\\.[^"\\]*)*"  # A string, \ escapes the next character.
+  | //[^\n\r]*                # A comment, the end of line is kept.
+  | /\*.*?\*/                 # A multiline comment.
+  | "|/\*
+  ''', re.DOTALL | re.VERBOSE)
 
-def _ReadString(input, start, output):
-  output.append('"')
-  start_range, end_range = (start, input.find('"', start))
-  # \" escapes the ", \\" doesn't, \\\" does, etc.
-  while (end_range != -1 and
-         _Rcount(input[start_range:end_range], '\\') % 2 == 1):
-    start_range, end_range = (end_range, input.find('"', end_range + 1))
-  if end_range == -1:
-    return start_range + 1
-  output.append(input[start:end_range + 1])
-  return end_range + 1
-
-
-def _ReadComment(input, start, output):
-  eol_tokens = ('\n', '\r')
-  eol_token_index, eol_token = _FindNextToken(input, eol_tokens, start)
-  if eol_token is None:
-    return len(input)
-  output.append(eol_token)
-  return eol_token_index + len(eol_token)
-
-def _ReadMultilineComment(input, start, output):
-  end_tokens = ('*/',)
-  end_token_index, end_token = _FindNextToken(input, end_tokens, start)
-  if end_token is None:
-    raise Exception("Multiline comment end token (*/) not found")
-  return end_token_index + len(end_token)
 
 def Nom(input):
-  token_actions = {
-    '"': _ReadString,
-    '//': _ReadComment,
-    '/*': _ReadMultilineComment,
-  }
+  '''Returns |input| with its // and /* */ comments removed.
+  '''
   output = []
   pos = 0
-  while pos < len(input):
-    token_index, token = _FindNextToken(input, token_actions.keys(), pos)
-    if token is None:
-      output.append(input[pos:])
-      break
-    output.append(input[pos:token_index])
-    pos = token_actions[token](input, token_index + len(token), output)
+  for match in _TOKENS.finditer(input):
+    token = match.group()
+    if token[0] == '"':
+      if len(token) > 1:
+        continue
+      # An unterminated string only keeps its opening quote, and scanning
+      # resumes after the last (escaped) quote which follows it, if any.
+      start = match.end()
+      output.append(input[pos:start])
+      resume = max(input.rfind('"', start), start) + 1
+      output.append(Nom(input[resume:]))
+      return ''.join(output)
+    if token == '/*':
+      raise Exception("Multiline comment end token (*/) not found")
+    output.append(input[pos:match.start()])
+    pos = match.end()
+  output.append(input[pos:])
   return ''.join(output)
 
 
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# Copyright 2017 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+'''Benchmarks json_comment_eater.Nom over the JSON files of a tree.
+
+By default all the .json files under the parent directory of this script are
+used, which includes the schemas and features of the JSON schema compiler.
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from json_comment_eater import Nom
+
+
+def _FindJsonFiles(roots):
+  filenames = []
+  for root in roots:
+    for dirpath, _, files in os.walk(root):
+      filenames.extend(os.path.join(dirpath, f) for f in files
+                       if f.endswith('.json'))
+  return sorted(filenames)
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('roots', nargs='*',
+                      default=[os.path.join(os.path.dirname(__file__),
+                                            os.pardir)])
+  parser.add_argument('--runs', type=int, default=20)
+  args = parser.parse_args(argv)
+
+  contents = []
+  for filename in _FindJsonFiles(args.roots):
+    with open(filename) as f:
+      contents.append(f.read())
+
+  nom_time = sys.maxint
+  total_time = sys.maxint
+  for _ in xrange(args.runs):
+    start = time.time()
+    stripped = [Nom(content) for content in contents]
+    nom_time = min(nom_time, time.time() - start)
+    for content in stripped:
+      try:
+        json.loads(content)
+      except ValueError:
+        pass  # Some of the files are test inputs which are not valid JSON.
+    total_time = min(total_time, time.time() - start)
+
+  print '%d files, %d bytes' % (len(contents), sum(len(c) for c in contents))
+  print 'Nom: %.3fs, Nom and json.loads: %.3fs' % (nom_time, total_time)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
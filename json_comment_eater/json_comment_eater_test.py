@@ -24,5 +24,19 @@ class JsonCommentEaterTest(unittest.TestCase):
     json, expected_json = self._Load('everything')
     self.assertEqual(expected_json, Nom(json))
 
+  def testLineEndings(self):
+    self.assertEqual('{\r\n"a": 1\r}',
+                     Nom('{// comment\r\n"a": 1// comment\r}'))
+    self.assertEqual('{"a": 1}', Nom('{"a": 1}// comment'))
+
+  def testNoComments(self):
+    json = '{"a": "b//c", "d": "\\\\"}'
+    self.assertTrue(Nom(json) is json)
+
+  def testUnterminated(self):
+    self.assertRaises(Exception, Nom, '{"a": 1 /* comment */ /* comment }')
+    self.assertEqual('"bc', Nom('"abc'))
+    self.assertEqual('"d', Nom('"a\\"bc\\"d'))
+
 if __name__ == '__main__':
   unittest.main()
@@ -17,7 +17,9 @@ from __future__ import print_function
 
 import argparse
 import ast
+import cPickle
 import errno
+import hashlib
 import json
 import os
 import pipes
@@ -32,6 +34,10 @@ import urllib2
 
 from collections import OrderedDict
 
+# Bump this whenever the format of the config cache or the way configs are
+# flattened changes, to invalidate the existing caches.
+CONFIG_CACHE_VERSION = '1'
+
 CHROMIUM_SRC_DIR = os.path.dirname(os.path.dirname(os.path.dirname(
     os.path.abspath(__file__))))
 sys.path = [os.path.join(CHROMIUM_SRC_DIR, 'build')] + sys.path
@@ -56,6 +62,7 @@ class MetaBuildWrapper(object):
     self.sep = os.sep
     self.args = argparse.Namespace()
     self.configs = {}
+    self.flattened_configs = {}
     self.luci_tryservers = {}
     self.masters = {}
     self.mixins = {}
@@ -114,6 +121,12 @@ class MetaBuildWrapper(object):
                              'the commands that will run)')
       subp.add_argument('-v', '--verbose', action='store_true',
                         help='verbose logging')
+      AddCacheDirOption(subp)
+
+    def AddCacheDirOption(subp):
+      subp.add_argument('--cache-dir', metavar='PATH',
+                        help='directory in which to cache the parsed and '
+                             'flattened config file, keyed by its contents')
 
     parser = argparse.ArgumentParser(prog='mb')
     subps = parser.add_subparsers()
@@ -168,6 +181,24 @@ class MetaBuildWrapper(object):
     AddCommonOptions(subp)
     subp.set_defaults(func=self.CmdLookup)
 
+    subp = subps.add_parser('lookup-all',
+                            help='print out the GN args (or GYP defines) '
+                                 'used by every builder as a JSON object')
+    subp.add_argument('-f', '--config-file', metavar='PATH',
+                      default=self.default_config,
+                      help='path to config file (default is %(default)s)')
+    subp.add_argument('-g', '--goma-dir',
+                      help='path to goma directory')
+    subp.add_argument('--android-version-code',
+                      help='Sets GN arg android_default_version_code and '
+                           'GYP_DEFINE app_manifest_version_code')
+    subp.add_argument('--android-version-name',
+                      help='Sets GN arg android_default_version_name and '
+                           'GYP_DEFINE app_manifest_version_name')
+    AddCacheDirOption(subp)
+    subp.set_defaults(func=self.CmdLookupAll, master=None, builder=None,
+                      gyp_script=self.PathJoin('build', 'gyp_chromium'))
+
     subp = subps.add_parser(
         'run',
         help='build and run the isolated version of a '
@@ -342,6 +373,53 @@ class MetaBuildWrapper(object):
     self.PrintCmd(cmd, env)
     return 0
 
+  def CmdLookupAll(self):
+    self.ReadConfigFile()
+    obj = {}
+    for master, builders in self.masters.items():
+      obj[master] = {}
+      for builder, config in builders.items():
+        if isinstance(config, dict):
+          phases = {}
+          for phase, phase_config in config.items():
+            args = self.LookupAllArgs(master, builder, phase_config)
+            if args:
+              phases[phase] = args
+          if phases:
+            obj[master][builder] = phases
+        else:
+          args = self.LookupAllArgs(master, builder, config)
+          if args:
+            obj[master][builder] = args
+
+    # Dump object and trim trailing whitespace.
+    s = '\n'.join(l.rstrip() for l in
+                  json.dumps(obj, sort_keys=True, indent=2).splitlines())
+    self.Print(s)
+    return 0
+
+  def LookupAllArgs(self, master, builder, config):
+    # Resolves the args like CmdLookup does, but returns None for the builders
+    # which don't use MB, and returns the other errors in the result.
+    try:
+      # The builder is named in the errors raised while flattening configs.
+      self.args.master = master
+      self.args.builder = builder
+      vals = self.ReadIOSBotConfig(master, builder)
+      if not vals:
+        if not config.startswith('//') and not config in self.configs:
+          return None
+        vals = self.ValsFromConfig(config)
+        if 'error' in vals['gn_args'].split():
+          return None
+      if vals['type'] == 'gn':
+        return {'type': 'gn', 'gn_args': self.GNArgs(vals)}
+      _, env = self.GYPCmd('_path_', vals)
+      return {'type': 'gyp', 'gyp_defines': env['GYP_DEFINES'],
+              'gyp_crosscompile': vals['gyp_crosscompile']}
+    except MBErr as e:
+      return {'error': str(e)}
+
   def CmdRun(self):
     vals = self.GetConfig()
     if not vals:
@@ -645,20 +723,11 @@ class MetaBuildWrapper(object):
     return ' '.join(gn_args)
 
   def Lookup(self):
-    vals = self.ReadIOSBotConfig()
+    vals = self.ReadIOSBotConfig(self.args.master, self.args.builder)
     if not vals:
       self.ReadConfigFile()
       config = self.ConfigFromArgs()
-      if config.startswith('//'):
-        if not self.Exists(self.ToAbsPath(config)):
-          raise MBErr('args file "%s" not found' % config)
-        vals = self.DefaultVals()
-        vals['args_file'] = config
-      else:
-        if not config in self.configs:
-          raise MBErr('Config "%s" not found in %s' %
-                      (config, self.args.config_file))
-        vals = self.FlattenConfig(config)
+      vals = self.ValsFromConfig(config)
 
     # Do some basic sanity checking on the config so that we
     # don't have to do this in every caller.
@@ -669,11 +738,24 @@ class MetaBuildWrapper(object):
 
     return vals
 
-  def ReadIOSBotConfig(self):
-    if not self.args.master or not self.args.builder:
+  def ValsFromConfig(self, config):
+    if config.startswith('//'):
+      if not self.Exists(self.ToAbsPath(config)):
+        raise MBErr('args file "%s" not found' % config)
+      vals = self.DefaultVals()
+      vals['args_file'] = config
+    else:
+      if not config in self.configs:
+        raise MBErr('Config "%s" not found in %s' %
+                    (config, self.args.config_file))
+      vals = self.FlattenConfig(config)
+    return vals
+
+  def ReadIOSBotConfig(self, master, builder):
+    if not master or not builder:
       return {}
     path = self.PathJoin(self.chromium_src_dir, 'ios', 'build', 'bots',
-                         self.args.master, self.args.builder + '.json')
+                         master, builder + '.json')
     if not self.Exists(path):
       return {}
 
@@ -695,17 +777,55 @@ class MetaBuildWrapper(object):
     if not self.Exists(self.args.config_file):
       raise MBErr('config file not found at %s' % self.args.config_file)
 
+    config_file_contents = self.ReadFile(self.args.config_file)
+    cache_path = None
+    if getattr(self.args, 'cache_dir', None):
+      digest = hashlib.sha1(CONFIG_CACHE_VERSION + '\0' +
+                            config_file_contents).hexdigest()
+      cache_path = self.PathJoin(self.args.cache_dir,
+                                 'mb_config_%s.cache' % digest)
+      if self.Exists(cache_path):
+        try:
+          cache = cPickle.loads(self.ReadFile(cache_path))
+          self.configs = cache['configs']
+          self.flattened_configs = cache['flattened_configs']
+          self.luci_tryservers = cache['luci_tryservers']
+          self.masters = cache['masters']
+          self.mixins = cache['mixins']
+          return
+        except Exception:
+          pass  # A corrupted cache is just regenerated.
+
     try:
-      contents = ast.literal_eval(self.ReadFile(self.args.config_file))
+      contents = ast.literal_eval(config_file_contents)
     except SyntaxError as e:
       raise MBErr('Failed to parse config file "%s": %s' %
                  (self.args.config_file, e))
 
     self.configs = contents['configs']
+    self.flattened_configs = {}
     self.luci_tryservers = contents.get('luci_tryservers', {})
     self.masters = contents['masters']
     self.mixins = contents['mixins']
 
+    if cache_path:
+      # Flatten every config up front, so that the cache serves as an index
+      # of the resolved values of all of the builders.
+      for config in self.configs:
+        try:
+          self.FlattenConfig(config)
+        except MBErr:
+          pass  # Looking up the config will raise the error again.
+      cache = {
+        'configs': self.configs,
+        'flattened_configs': self.flattened_configs,
+        'luci_tryservers': self.luci_tryservers,
+        'masters': self.masters,
+        'mixins': self.mixins,
+      }
+      self.MaybeMakeDirectory(self.args.cache_dir)
+      self.WriteCacheFile(cache_path, cPickle.dumps(cache))
+
   def ReadIsolateMap(self):
     if not self.Exists(self.args.isolate_map_file):
       raise MBErr('isolate map file not found at %s' %
@@ -753,12 +873,14 @@ class MetaBuildWrapper(object):
     return config
 
   def FlattenConfig(self, config):
-    mixins = self.configs[config]
-    vals = self.DefaultVals()
+    if config not in self.flattened_configs:
+      mixins = self.configs[config]
+      vals = self.DefaultVals()
 
-    visited = []
-    self.FlattenMixins(mixins, vals, visited)
-    return vals
+      visited = []
+      self.FlattenMixins(mixins, vals, visited)
+      self.flattened_configs[config] = vals
+    return dict(self.flattened_configs[config])
 
   def DefaultVals(self):
     return {
@@ -1546,6 +1668,18 @@ class MetaBuildWrapper(object):
     with open(path, 'w') as fp:
       return fp.write(contents)
 
+  def WriteCacheFile(self, path, contents):
+    # This function largely exists so it can be overriden for testing.
+    # Concurrent invocations may write the same cache file, so write it to a
+    # temporary file first, and keep the existing file if there is one.
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'w') as fp:
+      fp.write(contents)
+    try:
+      os.rename(temp_path, path)
+    except OSError:
+      os.remove(temp_path)
+
 
 class MBErr(Exception):
   pass
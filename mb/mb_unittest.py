@@ -5,6 +5,7 @@
 
 """Tests for mb.py."""
 
+import cPickle
 import json
 import StringIO
 import os
@@ -63,6 +64,9 @@ class FakeMBW(mb.MetaBuildWrapper):
       self.Print('\nWriting """\\\n%s""" to %s.\n' % (contents, path))
     self.files[path] = contents
 
+  def WriteCacheFile(self, path, contents):
+    self.files[path] = contents
+
   def Call(self, cmd, env=None, buffer_output=True):
     if env:
       self.cross_compile = env.get('GYP_CROSSCOMPILE')
@@ -558,6 +562,55 @@ class UnitTest(unittest.TestCase):
                       '--phase', 'phase_2'], ret=0)
     self.assertIn('phase = 2', mbw.out)
 
+  def test_lookup_all(self):
+    mbw = self.check(['lookup-all', '-g', '/foo'], ret=0)
+    out = json.loads(mbw.out)
+    self.assertEqual(out['chromium'], {})
+    builders = out['fake_master']
+    self.assertEqual(builders['fake_gn_builder'],
+                     {'type': 'gn',
+                      'gn_args': ('goma_dir = "/foo"\n'
+                                  'is_debug = false\n'
+                                  'use_goma = true\n')})
+    self.assertEqual(builders['fake_multi_phase'],
+                     {'phase_1': {'type': 'gn', 'gn_args': 'goma_dir = "/foo"\n'
+                                                           'phase = 1\n'},
+                      'phase_2': {'type': 'gn', 'gn_args': 'goma_dir = "/foo"\n'
+                                                           'phase = 2\n'}})
+    self.assertEqual(builders['fake_builder'],
+                     {'type': 'gyp', 'gyp_defines': 'goma=1 gomadir=/foo',
+                      'gyp_crosscompile': False})
+    self.assertEqual(
+        builders['fake_gn_args_bot']['gn_args'],
+        'import("//build/args/bots/fake_master/fake_gn_args_bot.gn")\n'
+        'goma_dir = "/foo"\n')
+    self.assertIn('args_file specified multiple times',
+                  builders['fake_args_file_twice']['error'])
+
+  def test_config_cache(self):
+    mbw = self.check(['lookup', '-c', 'gn_rel_bot', '--cache-dir', '/cache'],
+                     ret=0)
+    self.assertIn('is_debug = false', mbw.out)
+    cache_paths = [f for f in mbw.files if f.startswith('/cache/')]
+    self.assertEqual(1, len(cache_paths))
+    cache = cPickle.loads(mbw.files[cache_paths[0]])
+    self.assertEqual('is_debug=false use_goma=true',
+                     cache['flattened_configs']['gn_rel_bot']['gn_args'])
+
+    # Lookups use the flattened configs from the cache.
+    cache['flattened_configs']['gn_rel_bot']['gn_args'] = 'is_debug=true'
+    files = {cache_paths[0]: cPickle.dumps(cache)}
+    mbw = self.check(['lookup', '-c', 'gn_rel_bot', '--cache-dir', '/cache'],
+                     files=files, ret=0)
+    self.assertIn('is_debug = true', mbw.out)
+
+    # Changing the config file invalidates the cache.
+    files[mbw.default_config] = TEST_CONFIG + '\n'
+    mbw = self.check(['lookup', '-c', 'gn_rel_bot', '--cache-dir', '/cache'],
+                     files=files, ret=0)
+    self.assertIn('is_debug = false', mbw.out)
+    self.assertEqual(2, len([f for f in mbw.files if f.startswith('/cache/')]))
+
   def test_validate(self):
     mbw = self.fake_mbw()
     self.check(['validate'], mbw=mbw, ret=0)
@@ -7,7 +7,6 @@
 import json
 
 from memory_inspector.core import native_heap
-from memory_inspector.core import stacktrace
 
 
 # These are defined in heap_profiler/heap_profiler.h
@@ -35,10 +34,7 @@ def Parse(content):
   strace_by_index = {}   # index (str) -> |stacktrace.Stacktrace|
 
   for index, entry in data['stacks'].iteritems():
-    strace = stacktrace.Stacktrace()
-    for absolute_addr in entry['f']:
-      strace.Add(nativeheap.GetStackFrame(absolute_addr))
-    strace_by_index[index] = strace
+    strace_by_index[index] = nativeheap.GetStacktrace(entry['f'])
 
   for start_addr, entry in data['allocs'].iteritems():
     flags = int(entry['f'])
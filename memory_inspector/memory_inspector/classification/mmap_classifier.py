@@ -48,7 +48,9 @@ def Classify(mmap, rule_tree):
     values = [0, map_entry.priv_dirty_bytes, map_entry.priv_clean_bytes,
               map_entry.shared_dirty_bytes, map_entry.shared_clean_bytes]
     values[0] = values[1] + values[2] + values[3] + values[4]
-    res.AddToMatchingNodes(map_entry, values)
+    # Rules look only at the mapped file and the protection flags.
+    res.AddToMatchingNodes(map_entry, values,
+                           (map_entry.mapped_file, map_entry.prot_flags))
   return res
 
 
@@ -56,17 +58,17 @@ class _MmapRule(rules.Rule):
   def __init__(self, name, filters):
     super(_MmapRule, self).__init__(name)
     try:
-      self._file_re = (
-          re.compile(filters['mmap_file']) if 'mmap_file' in filters else None)
-      self._prot_re = (
-          re.compile(filters['mmap_prot']) if 'mmap_prot' in filters else None)
+      self._file_re = (rules.MemoizedRegex(filters['mmap_file'])
+                       if 'mmap_file' in filters else None)
+      self._prot_re = (rules.MemoizedRegex(filters['mmap_prot'])
+                       if 'mmap_prot' in filters else None)
     except re.error, descr:
       raise exceptions.MemoryInspectorException(
         'Regex parse error "%s" : %s' % (filters, descr))
 
   def Match(self, map_entry):
-    if self._file_re and not self._file_re.search(map_entry.mapped_file):
+    if self._file_re and not self._file_re.Search(map_entry.mapped_file):
       return False
-    if self._prot_re and not self._prot_re.search(map_entry.prot_flags):
+    if self._prot_re and not self._prot_re.Search(map_entry.prot_flags):
       return False
     return True
\ No newline at end of file
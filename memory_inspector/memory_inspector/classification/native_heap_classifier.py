@@ -60,9 +60,12 @@ def Classify(nativeheap, rule_tree):
   assert(isinstance(rule_tree, rules.Rule))
 
   res = results.AggreatedResults(rule_tree, _RESULT_KEYS)
-  for allocation in nativeheap.allocations:
-    res.AddToMatchingNodes(allocation,
-                           [allocation.size, allocation.resident_size])
+  matcher = _FrameMatcher(rule_tree)
+  # Rules match only on stack traces, so each distinct stack trace needs to be
+  # matched just once.
+  for allocation, size, resident_size in nativeheap.AggregateByStacktrace():
+    res.AddToMatchingNodes(matcher.Match(allocation.stack_trace),
+                           [size, resident_size])
   return res
 
 
@@ -104,8 +107,8 @@ def InferHeuristicRulesFromHeap(nheap, max_depth=3, threshold=0.02):
       return
     node[path] = {}  # No common prefix, create new child in current node.
 
-  # Given an allocation of size N and its stack trace, heuristically determines
-  # the source directory to be blamed for the N bytes.
+  # Given a stack trace and the N bytes allocated from it, heuristically
+  # determines the source directory to be blamed for the N bytes.
   # The blamed_dir is the one which appears more times in the top 8 stack frames
   # (excluding the first 2, which usually are just the (m|c)alloc call sites).
   # At the end, this will generate a *leaderboard* (|blamed_dirs|) which
@@ -113,7 +116,7 @@ def InferHeuristicRulesFromHeap(nheap, max_depth=3, threshold=0.02):
 
   blamed_dirs = collections.Counter()  # '/s/path' : bytes_from_this_path (int)
   total_allocated = 0
-  for alloc in nheap.allocations:
+  for alloc, alloc_size, _ in nheap.AggregateByStacktrace():
     dir_histogram = collections.Counter()
     for frame in alloc.stack_trace.frames[2:10]:
       # Compute a histogram (for each allocation) of the top source dirs.
@@ -126,8 +129,8 @@ def InferHeuristicRulesFromHeap(nheap, max_depth=3, threshold=0.02):
       continue
     # Add the blamed dir to the leaderboard.
     blamed_dir = dir_histogram.most_common()[0][0]
-    blamed_dirs.update({blamed_dir : alloc.size})
-    total_allocated += alloc.size
+    blamed_dirs.update({blamed_dir : alloc_size})
+    total_allocated += alloc_size
 
   # Select only the top paths from the leaderboard which contribute for more
   # than |threshold| and make a radix tree out of them.
@@ -167,7 +170,7 @@ class _NHeapRule(rules.Rule):
     self._stacktrace_regexs = []
     for regex in stacktrace_regexs:
       try:
-        self._stacktrace_regexs.append(re.compile(regex))
+        self._stacktrace_regexs.append(rules.MemoizedRegex(regex))
       except re.error, descr:
         raise exceptions.MemoryInspectorException(
             'Stacktrace regex error "%s" : %s' % (regex, descr))
@@ -177,35 +180,95 @@ class _NHeapRule(rules.Rule):
     path_regex = filters.get('source_path')
     if path_regex:
       try:
-        self._path_regex = re.compile(path_regex)
+        self._path_regex = rules.MemoizedRegex(path_regex)
       except re.error, descr:
         raise exceptions.MemoryInspectorException(
             'Path regex error "%s" : %s' % (path_regex, descr))
 
-  def Match(self, allocation):
-    # Match the source file path, if the 'source_path' filter is specified.
+  def AssignBits(self, regexs):
+    """Appends the regexs of the rule to |regexs| and records their indexes.
+
+    See |_FrameMatcher|.
+    """
+    self._path_bit = 0
     if self._path_regex:
-      path_matches = False
-      for frame in allocation.stack_trace.frames:
-        if frame.symbol and frame.symbol.source_info:
-          if self._path_regex.search(
-              frame.symbol.source_info[0].source_file_path):
-            path_matches = True
-            break
-      if not path_matches:
-        return False
+      self._path_bit = 1 << len(regexs)
+      regexs.append((self._path_regex, True))
+    self._stacktrace_bits = []
+    for regex in self._stacktrace_regexs:
+      self._stacktrace_bits.append(1 << len(regexs))
+      regexs.append((regex, False))
+
+  def Match(self, stacktrace_matches):
+    # Match the source file path, if the 'source_path' filter is specified.
+    if self._path_bit and not (
+        stacktrace_matches.any_frame_mask & self._path_bit):
+      return False
 
     # Match the stack traces symbols, if the 'stacktrace' filter is specified.
-    if not self._stacktrace_regexs:
+    bits = self._stacktrace_bits
+    if not bits:
       return True
+    if len(bits) == 1:
+      return bool(stacktrace_matches.any_frame_mask & bits[0])
     cur_regex_idx = 0
-    cur_regex = self._stacktrace_regexs[0]
-    for frame in allocation.stack_trace.frames:
-      if frame.symbol and cur_regex.search(frame.symbol.name):
+    for frame_mask in stacktrace_matches.frame_masks:
+      if frame_mask & bits[cur_regex_idx]:
         # The current regex has been matched.
-        if cur_regex_idx == len(self._stacktrace_regexs) - 1:
-          return True  # All the provided regexs have been matched, we're happy.
         cur_regex_idx += 1
-        cur_regex = self._stacktrace_regexs[cur_regex_idx]
+        if cur_regex_idx == len(bits):
+          return True  # All the provided regexs have been matched, we're happy.
+
+    return False  # Not all the provided regexs have been matched.
+
+
+class _FrameMatcher(object):
+  """Evaluates the regexs of a rule tree at most once per stack frame.
+
+  Each regex of the |_NHeapRule|s is assigned a bit. A stack trace is turned
+  into a |_StacktraceMatches|, which holds the bitmask of the regexs matched by
+  each of its frames. Rules then need just bitwise tests.
+  """
 
-    return False  # Not all the provided regexs have been matched.
\ No newline at end of file
+  def __init__(self, rule_tree):
+    self._regexs = []  # [(|rules.MemoizedRegex|, is_source_path_regex)].
+    self._frame_masks = {}  # |stacktrace.Frame| -> bitmask.
+    rules_to_visit = [rule_tree]
+    while rules_to_visit:
+      rule = rules_to_visit.pop()
+      if isinstance(rule, _NHeapRule):
+        rule.AssignBits(self._regexs)
+      rules_to_visit.extend(rule.children)
+
+  def _GetFrameMask(self, frame):
+    mask = 0
+    if frame.symbol:
+      name = frame.symbol.name
+      source_info = frame.symbol.source_info
+      path = source_info[0].source_file_path if source_info else None
+      for bit, (regex, is_source_path_regex) in enumerate(self._regexs):
+        text = path if is_source_path_regex else name
+        if text is not None and regex.Search(text):
+          mask |= 1 << bit
+    self._frame_masks[frame] = mask
+    return mask
+
+  def Match(self, stack_trace):
+    """Returns the |_StacktraceMatches| for a |stacktrace.Stacktrace|."""
+    frame_masks = []
+    for frame in stack_trace.frames:
+      mask = self._frame_masks.get(frame)
+      if mask is None:
+        mask = self._GetFrameMask(frame)
+      frame_masks.append(mask)
+    return _StacktraceMatches(frame_masks)
+
+
+class _StacktraceMatches(object):
+  """The trace record which is matched by |_NHeapRule|s."""
+
+  def __init__(self, frame_masks):
+    self.frame_masks = frame_masks
+    self.any_frame_mask = 0
+    for frame_mask in frame_masks:
+      self.any_frame_mask |= frame_mask
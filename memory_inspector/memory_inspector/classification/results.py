@@ -58,8 +58,9 @@ class AggreatedResults(object):
     assert(isinstance(keys, list))
     self.keys = keys
     self.total = AggreatedResults._MakeBucketNodeFromRule(rule_tree, len(keys))
+    self._matching_nodes_cache = {}  # match_key -> [|Bucket|s].
 
-  def AddToMatchingNodes(self, trace_record, values):
+  def AddToMatchingNodes(self, trace_record, values, match_key=None):
     """Adds the provided |values| to the nodes that match the |trace_record|.
 
     Tree traversal logic: at any level, one and only one node will match the
@@ -75,22 +76,38 @@ class AggreatedResults(object):
       values: a list of int(s) which represent the value associated to the
           matched trace_record. The cardinality of the list must be equal to the
           cardinality of the initial keys.
+      match_key: (Optional) a hashable value which identifies the properties of
+          the |trace_record| which the rules look at. The rules are evaluated
+          only once for all the trace_records which have the same key.
     """
     assert(len(values) == len(self.keys))
-    AggreatedResults._AddToMatchingNodes(
-        trace_record, values, self.total, len(self.keys))
+    if match_key is None:
+      buckets = AggreatedResults._GetMatchingNodes(trace_record, self.total)
+    else:
+      buckets = self._matching_nodes_cache.get(match_key)
+      if buckets is None:
+        buckets = AggreatedResults._GetMatchingNodes(trace_record, self.total)
+        self._matching_nodes_cache[match_key] = buckets
+    num_keys = len(self.keys)
+    for bucket in buckets:
+      for i in xrange(num_keys):
+        bucket.values[i] += values[i]
 
   @staticmethod
-  def _AddToMatchingNodes(trace_record, values, bucket, num_keys):
+  def _GetMatchingNodes(trace_record, bucket):
+    """Returns the list of buckets (from the root down) matching the record."""
     if not bucket.rule.Match(trace_record):
-      return False
-    for i in xrange(num_keys):
-      bucket.values[i] += values[i]
-    for child_bucket in bucket.children:
-      if AggreatedResults._AddToMatchingNodes(
-          trace_record, values, child_bucket, num_keys):
+      return []
+    matching_nodes = [bucket]
+    while bucket.children:
+      for child_bucket in bucket.children:
+        if child_bucket.rule.Match(trace_record):
+          matching_nodes.append(child_bucket)
+          bucket = child_bucket
+          break
+      else:
         break
-    return True
+    return matching_nodes
 
   @staticmethod
   def _MakeBucketNodeFromRule(rule, num_keys):
@@ -53,6 +53,16 @@ class ResultsTest(unittest.TestCase):
     self.assertEqual(result.total.children[0].children[1].values, [4, 6])
     self.assertEqual(result.total.children[2].values, [20, 22])
 
+    # Records with the same match_key are matched only once, so 'b3' ends up
+    # in the same bucket as 'az'.
+    result = results.AggreatedResults(rule, keys=['X'])
+    result.AddToMatchingNodes('az', [1], match_key='k')
+    result.AddToMatchingNodes('b3', [2], match_key='k')
+    result.AddToMatchingNodes('b4', [4])
+    self.assertEqual(result.total.values, [7])
+    self.assertEqual(result.total.children[0].children[0].values, [3])
+    self.assertEqual(result.total.children[1].values, [4])
+
 
 class MockRegexMatchingRule(rules.Rule):
   def __init__(self, name, filters):
@@ -58,6 +58,7 @@ And a typical resulting rule tree looks like this:
 """
 
 import ast
+import re
 
 
 def Load(content, rule_builder):
@@ -100,6 +101,27 @@ class Rule(object):
     self.children.append(child_rule)
 
 
+class MemoizedRegex(object):
+  """A compiled regex which remembers the result of each search.
+
+  Classifiers match the same few strings (e.g., symbol names or mapped files)
+  over and over, so concrete rules should use this rather than |re| directly.
+  Raises |re.error| if the |pattern| is not valid.
+  """
+
+  def __init__(self, pattern):
+    self._regex = re.compile(pattern)
+    self._results = {}  # string -> bool.
+
+  def Search(self, string):
+    """Returns True if the regex matches anywhere in |string|."""
+    result = self._results.get(string)
+    if result is None:
+      result = self._regex.search(string) is not None
+      self._results[string] = result
+    return result
+
+
 def _MakeRuleNodeFromDictNode(rule_node, dict_nodes, rule_builder):
   """Recursive rule tree builder for traversing the rule dict."""
   for dict_node in dict_nodes:
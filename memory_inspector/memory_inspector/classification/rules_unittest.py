@@ -89,6 +89,11 @@ class RulesTest(unittest.TestCase):
     self.assertEqual(node2.children[3].name, '2-other')
     self.assertEqual(len(node2.children[3].children), 0)
 
+    regex = rules.MemoizedRegex(r'^/foo/\d')
+    self.assertTrue(regex.Search('/foo/1'))
+    self.assertTrue(regex.Search('/foo/1'))
+    self.assertFalse(regex.Search('/bar/foo/1'))
+
 
 
 class MockRule(rules.Rule):
@@ -7,6 +7,9 @@ import bisect
 
 PAGE_SIZE = 4096
 
+# Number of bits set in each possible byte value.
+_BITS_SET = [bin(i).count('1') for i in xrange(256)]
+
 
 class Map(object):
   """Models the memory map of a given |backends.Process|.
@@ -87,6 +90,33 @@ class MapEntry(object):
       return False
     return (self.resident_pages[arr_idx] & (1 << arr_bit)) != 0
 
+  def CountResidentPages(self, first_page, last_page):
+    """Returns how many pages in [first_page, last_page] are resident.
+
+    Args:
+      first_page, last_page: relative page indexes, as in |IsPageResident|.
+    """
+    assert(0 <= first_page and last_page < self.len / PAGE_SIZE)
+    # Trailing zeros are trimmed by memdump (to optimize dump time).
+    bitmap = self.resident_pages
+    num_bits = len(bitmap) * 8
+    last_page = min(last_page, num_bits - 1)
+    count = 0
+    page = first_page
+    # Leading bits, up to a byte boundary.
+    while page <= last_page and page % 8:
+      count += (bitmap[page / 8] >> (page % 8)) & 1
+      page += 1
+    # Whole bytes.
+    while page + 7 <= last_page:
+      count += _BITS_SET[bitmap[page / 8]]
+      page += 8
+    # Trailing bits.
+    while page <= last_page:
+      count += (bitmap[page / 8] >> (page % 8)) & 1
+      page += 1
+    return count
+
   def Contains(self, abs_addr):
     """Determines whether a given absolute address belongs to the current mm."""
     return abs_addr >= self.start and abs_addr <= self.end
@@ -31,6 +31,17 @@ class MemoryMapTest(unittest.TestCase):
     self.assertTrue(map_entry2.IsPageResident(0))
     self.assertFalse(map_entry2.IsPageResident(1))
     self.assertTrue(map_entry2.IsPageResident(2))
+    self.assertEqual(map_entry2.CountResidentPages(0, 3), 2)
+    self.assertEqual(map_entry2.CountResidentPages(1, 1), 0)
+    self.assertEqual(map_entry2.CountResidentPages(1, 2), 1)
+    map_entry3 = memory_map.MapEntry(0, 40 * 4096 - 1, 'rw--', '', 0,
+                                     resident_pages=[0xff, 0x0f, 0xf0])
+    for first_page in xrange(40):
+      for last_page in xrange(first_page, 40):
+        self.assertEqual(
+            map_entry3.CountResidentPages(first_page, last_page),
+            sum(map_entry3.IsPageResident(p)
+                for p in xrange(first_page, last_page + 1)))
 
     # Test the lookup logic.
     mmap.Add(map_entry1)
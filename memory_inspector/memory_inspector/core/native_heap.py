@@ -2,6 +2,9 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import array
+import itertools
+
 from memory_inspector.core import memory_map
 from memory_inspector.core import stacktrace
 from memory_inspector.core import symbol
@@ -13,15 +16,50 @@ class NativeHeap(object):
   """A snapshot of outstanding (i.e. not freed) native allocations.
 
   This is typically obtained by calling |backends.Process|.DumpNativeHeap()
+
+  Heap dumps contain millions of allocations but comparatively few distinct
+  stack traces and frames, so the storage is columnar: each allocation is a row
+  in a set of arrays (start, size, flags, resident size, stack trace id), stack
+  traces are interned as tuples of frame ids and frames are kept in a table.
+  |Allocation| and |stacktrace.Stacktrace| objects are created on demand, as
+  views over this storage.
   """
 
   def __init__(self):
-    self.allocations = []  # list of individual |Allocation|s.
     self.stack_frames = {}  # absolute_address (int) -> |stacktrace.Frame|.
+    self._frames = []  # frame id -> |stacktrace.Frame|.
+    self._frame_ids = {}  # absolute_address -> id of the frame in stack_frames.
+    self._other_frame_ids = {}  # id(frame) -> frame id, see |_InternFrame|.
+    self._stack_traces = []  # stack trace id -> tuple of frame ids.
+    self._stack_trace_ids = {}  # tuple of frame ids -> stack trace id.
+    # The allocation columns.
+    self._starts = array.array('L')
+    self._sizes = array.array('L')
+    self._flags = array.array('L')
+    self._resident_sizes = array.array('L')
+    self._allocation_stack_trace_ids = array.array('L')
+
+  @property
+  def allocations(self):
+    """A sequence of |Allocation| views, one per allocation, in order."""
+    return _AllocationsView(self)
+
+  @property
+  def frame_table(self):
+    """The distinct |stacktrace.Frame|s of the heap, in insertion order."""
+    return self._frames
 
   def Add(self, allocation):
+    """Copies |allocation| into the heap, and turns it into a view over it."""
     assert(isinstance(allocation, Allocation))
-    self.allocations += [allocation]
+    assert(allocation._heap is None), 'The allocation belongs to a heap.'
+    self._starts.append(allocation.start)
+    self._sizes.append(allocation.size)
+    self._flags.append(allocation.flags)
+    self._resident_sizes.append(allocation.resident_size)
+    self._allocation_stack_trace_ids.append(
+        self._InternStacktrace(allocation.stack_trace))
+    allocation._Bind(self, len(self._sizes) - 1)
 
   def GetStackFrame(self, absolute_addr):
     """Guarantees that multiple calls with the same addr return the same obj."""
@@ -29,9 +67,88 @@ class NativeHeap(object):
     stack_frame = self.stack_frames.get(absolute_addr)
     if not stack_frame:
       stack_frame = stacktrace.Frame(absolute_addr)
-      self.stack_frames[absolute_addr] = stack_frame
+      self._InternFrame(stack_frame)
     return stack_frame
 
+  def GetStacktrace(self, absolute_addrs):
+    """Returns a (read-only) |stacktrace.Stacktrace| made of |GetStackFrame|s.
+
+    Adding allocations which use the returned object is cheaper than building
+    a new |stacktrace.Stacktrace| for each of them.
+    """
+    for addr in absolute_addrs:
+      self.GetStackFrame(addr)
+    frame_ids = tuple(self._frame_ids[addr] for addr in absolute_addrs)
+    return _InternedStacktrace(self, self._InternFrameIds(frame_ids))
+
+  def _InternFrame(self, frame):
+    """Returns the id of |frame| in the frame table, adding it if needed.
+
+    Frames are normally unique per address (see |GetStackFrame|). Frames built
+    elsewhere, which might share the address of another one, are tracked by
+    identity in |_other_frame_ids|.
+    """
+    frame_id = self._frame_ids.get(frame.address)
+    if frame_id is not None and self._frames[frame_id] is frame:
+      return frame_id
+    if frame_id is None:
+      self.stack_frames[frame.address] = frame
+      self._frame_ids[frame.address] = len(self._frames)
+    else:
+      frame_id = self._other_frame_ids.get(id(frame))
+      if frame_id is not None:
+        return frame_id
+      self._other_frame_ids[id(frame)] = len(self._frames)
+    self._frames.append(frame)
+    return len(self._frames) - 1
+
+  def _InternFrameIds(self, frame_ids):
+    stack_trace_id = self._stack_trace_ids.get(frame_ids)
+    if stack_trace_id is None:
+      stack_trace_id = len(self._stack_traces)
+      self._stack_traces.append(frame_ids)
+      self._stack_trace_ids[frame_ids] = stack_trace_id
+    return stack_trace_id
+
+  def _InternStacktrace(self, stack_trace):
+    if (isinstance(stack_trace, _InternedStacktrace) and
+        stack_trace._heap is self):
+      return stack_trace._stack_trace_id
+    frame_table = self._frames
+    frame_ids_by_addr = self._frame_ids
+    frame_ids = []
+    for frame in stack_trace.frames:
+      # This is the fast path of |_InternFrame|, inlined.
+      frame_id = frame_ids_by_addr.get(frame.address)
+      if frame_id is None or frame_table[frame_id] is not frame:
+        frame_id = self._InternFrame(frame)
+      frame_ids.append(frame_id)
+    return self._InternFrameIds(tuple(frame_ids))
+
+  def AggregateByStacktrace(self):
+    """Sums up the allocations which share the same stack trace.
+
+    Returns:
+      A list of (allocation, total_size, total_resident_size) tuples, one per
+      distinct stack trace, where |allocation| is the first |Allocation| with
+      that stack trace.
+    """
+    num_stack_traces = len(self._stack_traces)
+    first_indexes = [None] * num_stack_traces
+    sizes = [0] * num_stack_traces
+    resident_sizes = [0] * num_stack_traces
+    for index, stack_trace_id, size, resident_size in itertools.izip(
+        itertools.count(), self._allocation_stack_trace_ids, self._sizes,
+        self._resident_sizes):
+      if first_indexes[stack_trace_id] is None:
+        first_indexes[stack_trace_id] = index
+      sizes[stack_trace_id] += size
+      resident_sizes[stack_trace_id] += resident_size
+    return [(_MakeAllocationView(self, index), size, resident_size)
+            for index, size, resident_size
+            in itertools.izip(first_indexes, sizes, resident_sizes)
+            if index is not None]
+
   def SymbolizeUsingSymbolDB(self, symbols):
     assert(isinstance(symbols, symbol.Symbols))
     for stack_frame in self.stack_frames.itervalues():
@@ -62,6 +179,64 @@ class NativeHeap(object):
     estimates the resident size of an allocation intersecting the mmaps dump.
     """
     assert(isinstance(mmap, memory_map.Map))
+    if not all(_IsPageAligned(mm) for mm in mmap.entries):
+      return self._CalculateResidentSizeSlow(mmap)
+
+    # Allocations are visited in address order, so that a single pass over the
+    # (sorted) mmap entries is required. Each allocation is attributed the
+    # size of its intersection with resident pages, which is computed by
+    # counting the resident pages covered by the allocation and then removing
+    # the uncovered parts of its first and last page. This gives the same
+    # results as |_CalculateResidentSizeSlow|, which is much easier to read.
+    entries = mmap.entries
+    num_entries = len(entries)
+    entries_first_page = [mm.start / PAGE_SIZE for mm in entries]
+    entries_last_page = [mm.end / PAGE_SIZE for mm in entries]
+    starts = self._starts
+    sizes = self._sizes
+    resident_sizes = self._resident_sizes
+    entry_idx = 0
+    for index in sorted(xrange(len(starts)), key=starts.__getitem__):
+      start = starts[index]
+      end = start + sizes[index] - 1
+      # Like the slow version, ignore the byte at |end|.
+      if start >= end:
+        continue
+      first_page = start / PAGE_SIZE
+      last_page = (end - 1) / PAGE_SIZE
+      while (entry_idx < num_entries and
+             entries_last_page[entry_idx] < first_page):
+        entry_idx += 1
+      resident_size = 0
+      i = entry_idx
+      while i < num_entries and entries_first_page[i] <= last_page:
+        mm = entries[i]
+        lo = max(first_page, entries_first_page[i])
+        hi = min(last_page, entries_last_page[i])
+        if lo == hi:
+          # Fast path for the common case of allocations within a single page.
+          # This is |mm.IsPageResident|, inlined.
+          page = lo - entries_first_page[i]
+          bitmap = mm.resident_pages
+          if page / 8 < len(bitmap) and bitmap[page / 8] & (1 << (page % 8)):
+            resident_size += (min(lo * PAGE_SIZE + PAGE_SIZE - 1, end) -
+                              max(lo * PAGE_SIZE, start) + 1)
+        else:
+          lo_rel = lo - entries_first_page[i]
+          hi_rel = hi - entries_first_page[i]
+          resident_size += mm.CountResidentPages(lo_rel, hi_rel) * PAGE_SIZE
+          if lo == first_page and mm.IsPageResident(lo_rel):
+            resident_size -= start % PAGE_SIZE
+          if hi == last_page and mm.IsPageResident(hi_rel):
+            resident_size -= max(0, hi * PAGE_SIZE + PAGE_SIZE - 1 - end)
+        i += 1
+      resident_sizes[index] += resident_size
+
+  def _CalculateResidentSizeSlow(self, mmap):
+    """Page by page version of |CalculateResidentSize|.
+
+    This handles mmap entries which are not page aligned.
+    """
     for alloc in self.allocations:
       # This function loops over all the memory pages that intersect, partially
       # or fully, with each allocation. For each of them, the allocation  is
@@ -96,9 +271,19 @@ class NativeHeap(object):
         cur_start = (cur_start + PAGE_SIZE) & ~(PAGE_SIZE - 1)
 
 
+def _IsPageAligned(map_entry):
+  return (map_entry.start % PAGE_SIZE == 0 and
+          (map_entry.end + 1) % PAGE_SIZE == 0)
+
+
 class Allocation(object):
   """Records profiling information about a native heap allocation.
 
+  Once added to a |NativeHeap|, an Allocation is just a view over the heap
+  storage. The views returned by |NativeHeap|.allocations compare equal to the
+  original Allocation object, and changes made through any of them (e.g., to
+  the resident_size) are visible from the others.
+
   Args:
       size: size of the allocation, in bytes.
       stack_trace: the allocation call-site. See |stacktrace.Stacktrace|.
@@ -112,15 +297,120 @@ class Allocation(object):
   def __init__(self, size, stack_trace, start=0, flags=0, resident_size=0):
     assert(size > 0)
     assert(isinstance(stack_trace, stacktrace.Stacktrace))
-    self.size = size  # in bytes.
-    self.stack_trace = stack_trace
-    self.start = start  # Optional, for using the resident size logic.
-    self.flags = flags
-    self.resident_size = resident_size  #  see |CalculateResidentSize|.
+    self._heap = None
+    self._index = None
+    # The values of the allocation, until it is added to a heap.
+    self._values = {'_sizes': size,  # in bytes.
+                    '_starts': start,  # Optional, for the resident size logic.
+                    '_flags': flags,
+                    '_resident_sizes': resident_size,  # See |NativeHeap|.
+                    'stack_trace': stack_trace}
+
+  def _Bind(self, heap, index):
+    self._heap = heap
+    self._index = index
+    self._values = None
+
+  def _Column(column):  # pylint: disable=E0213
+    def Get(self):
+      if self._heap is None:
+        return self._values[column]
+      return getattr(self._heap, column)[self._index]
+    def Set(self, value):
+      if self._heap is None:
+        self._values[column] = value
+      else:
+        getattr(self._heap, column)[self._index] = value
+    return property(Get, Set)
+
+  size = _Column('_sizes')
+  start = _Column('_starts')
+  flags = _Column('_flags')
+  resident_size = _Column('_resident_sizes')
+  del _Column
+
+  @property
+  def stack_trace(self):
+    if self._heap is None:
+      return self._values['stack_trace']
+    return _InternedStacktrace(
+        self._heap, self._heap._allocation_stack_trace_ids[self._index])
+
+  @property
+  def stack_trace_id(self):
+    """Identifies the stack trace within the heap. None until added to one."""
+    if self._heap is None:
+      return None
+    return self._heap._allocation_stack_trace_ids[self._index]
 
   @property
   def end(self):
     return self.start + self.size - 1
 
+  def __eq__(self, other):
+    if self._heap is None or not isinstance(other, Allocation):
+      return self is other
+    return self._heap is other._heap and self._index == other._index
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __hash__(self):
+    if self._heap is None:
+      return id(self)
+    return hash((id(self._heap), self._index))
+
   def __str__(self):
     return '%d : %s' % (self.size, self.stack_trace)
+
+
+def _MakeAllocationView(heap, index):
+  allocation = Allocation.__new__(Allocation)
+  allocation._Bind(heap, index)
+  return allocation
+
+
+class _AllocationsView(object):
+  """The (read-only) sequence of the |Allocation|s of a |NativeHeap|."""
+
+  def __init__(self, heap):
+    self._heap = heap
+
+  def __len__(self):
+    return len(self._heap._sizes)
+
+  def __getitem__(self, index):
+    if index < 0:
+      index += len(self)
+    if not 0 <= index < len(self):
+      raise IndexError('allocation index out of range')
+    return _MakeAllocationView(self._heap, index)
+
+  def __iter__(self):
+    for index in xrange(len(self)):
+      yield _MakeAllocationView(self._heap, index)
+
+
+class _InternedStacktrace(stacktrace.Stacktrace):
+  """A read-only view over a stack trace interned in a |NativeHeap|."""
+
+  def __init__(self, heap, stack_trace_id):  # pylint: disable=W0231
+    self._heap = heap
+    self._stack_trace_id = stack_trace_id
+
+  @property
+  def frames(self):
+    frame_table = self._heap._frames
+    return [frame_table[frame_id]
+            for frame_id in self._heap._stack_traces[self._stack_trace_id]]
+
+  def Add(self, frame):
+    raise TypeError('Interned stack traces cannot be modified.')
+
+  @property
+  def depth(self):
+    return len(self._heap._stack_traces[self._stack_trace_id])
+
+  def __getitem__(self, index):
+    return self._heap._frames[
+        self._heap._stack_traces[self._stack_trace_id][index]]
@@ -16,6 +16,7 @@ S.Traces:    |   |              +-----------> st1[exe1 + 0, exe1 + 4]
 Furthermore, the exe2 is a file mapping with non-zero (8k) offset.
 """
 
+import random
 import unittest
 
 from memory_inspector.core import memory_map
@@ -145,3 +146,75 @@ class NativeHeapTest(unittest.TestCase):
     #  [12288, 16384]: the 4th page is fully covered as well, but not resident.
     # *[16384, 18190]: the 5th page is partially covered and resident.
     self.assertEqual(alloc3.resident_size, (12288 - 8192) + (18190 - 16384))
+
+
+class NativeHeapResidentSizeTest(unittest.TestCase):
+  """Checks that the fast and slow resident size logic agree."""
+  def runTest(self):
+    rnd = random.Random(0)
+    mmap = memory_map.Map()
+    addr = 0
+    for _ in xrange(50):
+      addr += rnd.choice((0, 0, PAGE_SIZE, 3 * PAGE_SIZE))  # Leave some gaps.
+      num_pages = rnd.randint(1, 40)
+      resident_pages = [rnd.randint(0, 255)
+                        for _ in xrange(rnd.randint(0, num_pages / 8 + 1))]
+      mmap.Add(memory_map.MapEntry(addr, addr + num_pages * PAGE_SIZE - 1,
+                                   'rw--', '', 0, resident_pages=resident_pages))
+      addr += num_pages * PAGE_SIZE
+
+    st = stacktrace.Stacktrace()
+    nheap = native_heap.NativeHeap()
+    nheap_slow = native_heap.NativeHeap()
+    for _ in xrange(2000):
+      start = rnd.randint(0, addr + PAGE_SIZE)
+      size = rnd.choice((1, 2, rnd.randint(1, PAGE_SIZE),
+                         rnd.randint(1, 20 * PAGE_SIZE),
+                         PAGE_SIZE - start % PAGE_SIZE,
+                         PAGE_SIZE - start % PAGE_SIZE + 1))
+      nheap.Add(native_heap.Allocation(size, st, start=start))
+      nheap_slow.Add(native_heap.Allocation(size, st, start=start))
+
+    nheap.CalculateResidentSize(mmap)
+    nheap_slow._CalculateResidentSizeSlow(mmap)
+    self.assertEqual([a.resident_size for a in nheap_slow.allocations],
+                     [a.resident_size for a in nheap.allocations])
+    self.assertTrue(any(a.resident_size for a in nheap.allocations))
+
+
+class NativeHeapStorageTest(unittest.TestCase):
+  """Checks the interning of stack traces and the allocation views."""
+  def runTest(self):
+    nheap = native_heap.NativeHeap()
+    st1 = nheap.GetStacktrace([4, 8])
+    st2 = stacktrace.Stacktrace()
+    st2.Add(nheap.GetStackFrame(4))
+    st2.Add(nheap.GetStackFrame(8))
+    st3 = nheap.GetStacktrace([8])
+    self.assertIs(st1[0], nheap.GetStackFrame(4))
+    self.assertEqual(st1.depth, 2)
+    self.assertRaises(TypeError, st1.Add, st1[0])
+
+    alloc1 = native_heap.Allocation(size=10, stack_trace=st1, start=100)
+    nheap.Add(alloc1)
+    nheap.Add(native_heap.Allocation(size=20, stack_trace=st2, flags=2))
+    nheap.Add(native_heap.Allocation(size=40, stack_trace=st3,
+                                     resident_size=30))
+    self.assertEqual(len(nheap.frame_table), 2)
+
+    self.assertEqual(len(nheap.allocations), 3)
+    self.assertEqual(nheap.allocations[0], alloc1)
+    self.assertNotEqual(nheap.allocations[1], alloc1)
+    self.assertEqual([(a.start, a.size, a.flags, a.resident_size)
+                      for a in nheap.allocations],
+                     [(100, 10, 0, 0), (0, 20, 2, 0), (0, 40, 0, 30)])
+    self.assertIs(nheap.allocations[1].stack_trace[1], st1[1])
+
+    # Changes are visible from all the views of an allocation.
+    nheap.allocations[0].resident_size += 5
+    self.assertEqual(alloc1.resident_size, 5)
+
+    # st1 and st2 have the same frames, hence they are the same stack trace.
+    aggregated = nheap.AggregateByStacktrace()
+    self.assertEqual([(a, size, resident) for a, size, resident in aggregated],
+                     [(alloc1, 30, 5), (nheap.allocations[2], 40, 30)])
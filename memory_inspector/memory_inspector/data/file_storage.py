@@ -11,6 +11,10 @@ Storage -> N Archives -> 1 Symbol index
 
 Where an "archive" is essentially a collection of snapshots taken for a given
 app at a given point in time.
+
+Native heaps are stored in a compact binary format, as deltas between
+consecutive snapshots (see |native_heap_store|). Archives created before that
+hold one JSON file per native heap, which can still be loaded.
 """
 
 import datetime
@@ -20,6 +24,7 @@ import os
 from memory_inspector.core import memory_map
 from memory_inspector.core import native_heap
 from memory_inspector.core import symbol
+from memory_inspector.data import native_heap_store
 from memory_inspector.data import serialization
 
 
@@ -89,6 +94,7 @@ class Archive(object):
     self._name = name
     self._path = path
     self._cur_snapshot = None
+    self._nheap_store = native_heap_store.NativeHeapStore(path)
 
   def StoreSymbols(self, symbols):
     """Stores the symbol db (one per the overall archive)."""
@@ -144,21 +150,38 @@ class Archive(object):
   def StoreNativeHeap(self, nheap):
     assert(isinstance(nheap, native_heap.NativeHeap))
     assert(self._cur_snapshot), 'Must call StartNewSnapshot first'
-    file_path = os.path.join(self._path,
-                             self._cur_snapshot + Archive._NHEAP_EXT)
-    with open(file_path, 'w') as f:
-      json.dump(nheap, f, cls=serialization.Encoder)
+    # The heap is stored as a delta w.r.t. the previous snapshot.
+    prev_snapshots = [Archive.TimestampToStr(t) for t in self.ListSnapshots()]
+    prev_snapshots = [x for x in prev_snapshots if x < self._cur_snapshot]
+    base_snapshot = prev_snapshots[-1] if prev_snapshots else None
+    self._nheap_store.Store(self._cur_snapshot, nheap, base_snapshot)
 
   def HasNativeHeap(self, timestamp):
-    return self._HasSnapshotFile(timestamp, Archive._NHEAP_EXT)
+    return (self._nheap_store.Has(Archive.TimestampToStr(timestamp)) or
+            self._HasSnapshotFile(timestamp, Archive._NHEAP_EXT))
 
   def LoadNativeHeap(self, timestamp):
     assert(self.HasNativeHeap(timestamp))
     snapshot_name = Archive.TimestampToStr(timestamp)
+    if self._nheap_store.Has(snapshot_name):
+      return self._nheap_store.Load(snapshot_name)
     file_path = os.path.join(self._path, snapshot_name + Archive._NHEAP_EXT)
     with open(file_path) as f:
       return json.load(f, cls=serialization.NativeHeapDecoder)
 
+  def LoadNativeHeapSummary(self, timestamp):
+    """Loads a native heap with one allocation per distinct stack trace.
+
+    The allocations hold the total size and resident size of the stack trace.
+    This is all that classification needs, and it is much faster to load than
+    the full heap, which is returned for snapshots stored as JSON.
+    """
+    assert(self.HasNativeHeap(timestamp))
+    snapshot_name = Archive.TimestampToStr(timestamp)
+    if self._nheap_store.Has(snapshot_name):
+      return self._nheap_store.LoadSummary(snapshot_name)
+    return self.LoadNativeHeap(timestamp)
+
   def _HasSnapshotFile(self, timestamp, ext):
     name = Archive.TimestampToStr(timestamp)
     return os.path.exists(os.path.join(self._path, name + ext))
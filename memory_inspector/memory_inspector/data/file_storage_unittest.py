@@ -4,6 +4,8 @@
 
 """This unittest covers both file_storage and serialization modules."""
 
+import array
+import json
 import os
 import tempfile
 import time
@@ -14,6 +16,8 @@ from memory_inspector.core import native_heap
 from memory_inspector.core import stacktrace
 from memory_inspector.core import symbol
 from memory_inspector.data import file_storage
+from memory_inspector.data import native_heap_store
+from memory_inspector.data import serialization
 
 
 class FileStorageTest(unittest.TestCase):
@@ -96,6 +100,96 @@ class FileStorageTest(unittest.TestCase):
     self._DeepCompare(nh, nh_deser)
     self._storage.DeleteArchive('nheap')
 
+  def testNativeHeapDeltas(self):
+    archive = self._storage.OpenArchive('nheap_deltas', create=True)
+    live_allocs = {}  # start -> (size, stack trace addrs, resident_size).
+    expected = []
+    for i in xrange(13):  # Enough to cross a keyframe.
+      # Free some allocations, change some resident sizes and add new ones.
+      for start in sorted(live_allocs)[::3]:
+        del live_allocs[start]
+      for start in sorted(live_allocs)[::4]:
+        size, addrs, _ = live_allocs[start]
+        live_allocs[start] = (size, addrs, i)
+      for j in xrange(5):
+        live_allocs[1000 * i + j] = (j + 1, (i % 3, j + 100), 0)
+      nh = native_heap.NativeHeap()
+      for start, (size, addrs, resident_size) in live_allocs.iteritems():
+        for addr in addrs:
+          nh.GetStackFrame(addr).SetExecFileInfo('lib%d.so' % addr, addr)
+        nh.Add(native_heap.Allocation(size, nh.GetStacktrace(addrs),
+                                      start=start, flags=i,
+                                      resident_size=resident_size))
+      expected.append((archive.StartNewSnapshot(), self._Rows(nh)))
+      archive.StoreNativeHeap(nh)
+      time.sleep(0.01)
+
+    # Load the snapshots in reverse order, from a new archive object.
+    archive = self._storage.OpenArchive('nheap_deltas')
+    for timestamp, rows in reversed(expected):
+      self.assertEqual(rows, self._Rows(archive.LoadNativeHeap(timestamp)))
+      summary = archive.LoadNativeHeapSummary(timestamp)
+      self.assertEqual(
+          sorted((a.stack_trace[0].address, a.stack_trace[1].address, a.size,
+                  a.resident_size) for a in summary.allocations),
+          sorted((addrs[0], addrs[1], sum(r[1] for r in rows if r[3] == addrs),
+                  sum(r[4] for r in rows if r[3] == addrs))
+                 for addrs in set(r[3] for r in rows)))
+    self._storage.DeleteArchive('nheap_deltas')
+
+  def testNativeHeapIncompleteTables(self):
+    # An interrupted Store can leave an incomplete record at the end of the
+    # tables file, which must not corrupt the records stored after it.
+    def MakeHeap(addrs):
+      nh = native_heap.NativeHeap()
+      for addr in addrs:
+        nh.GetStackFrame(addr).SetExecFileInfo('lib%d.so' % addr, addr)
+      nh.Add(native_heap.Allocation(size=10,
+                                    stack_trace=nh.GetStacktrace(addrs),
+                                    start=addrs[0]))
+      return nh
+    self._storage.OpenArchive('nheap_tables', create=True)
+    path = os.path.join(self._storage_path, 'nheap_tables')
+    tables_path = os.path.join(path, native_heap_store._TABLES_FILE)
+    store = native_heap_store.NativeHeapStore(path)
+    store.Store('a', MakeHeap([1, 2]))
+    complete_size = os.path.getsize(tables_path)
+    store.Store('b', MakeHeap([3, 4]))
+    with open(tables_path, 'r+b') as f:
+      f.truncate((complete_size + os.path.getsize(tables_path)) // 2)
+
+    nh = MakeHeap([5, 6])
+    native_heap_store.NativeHeapStore(path).Store('c', nh)
+    store = native_heap_store.NativeHeapStore(path)
+    self.assertEqual(self._Rows(nh), self._Rows(store.Load('c')))
+    self._storage.DeleteArchive('nheap_tables')
+
+  def testNativeHeapJson(self):
+    # Archives created before the binary format store heaps as JSON.
+    archive = self._storage.OpenArchive('nheap_json', create=True)
+    timestamp = archive.StartNewSnapshot()
+    nh = native_heap.NativeHeap()
+    nh.GetStackFrame(1).SetExecFileInfo('foo.so', 1)
+    nh.Add(native_heap.Allocation(size=10, stack_trace=nh.GetStacktrace([1]),
+                                  start=20, flags=30))
+    file_path = os.path.join(self._storage_path, 'nheap_json',
+                             file_storage.Archive.TimestampToStr(timestamp) +
+                             '-nheap.json')
+    with open(file_path, 'w') as f:
+      json.dump(nh, f, cls=serialization.Encoder)
+    self.assertTrue(archive.HasNativeHeap(timestamp))
+    self._DeepCompare(nh, archive.LoadNativeHeap(timestamp))
+    self._storage.DeleteArchive('nheap_json')
+
+  @staticmethod
+  def _Rows(nh):
+    return sorted((a.start, a.size, a.flags,
+                   tuple(f.address for f in a.stack_trace.frames),
+                   a.resident_size,
+                   tuple((f.exec_file_rel_path, f.offset)
+                         for f in a.stack_trace.frames))
+                  for a in nh.allocations)
+
   def testSymbols(self):
     archive = self._storage.OpenArchive('symbols', create=True)
     symbols = symbol.Symbols()
@@ -124,7 +218,7 @@ class FileStorageTest(unittest.TestCase):
     self.assertEqual(type(a), type(b), prefix + ' type (%s vs %s' % (
         type(a), type(b)))
 
-    if isinstance(a, list):
+    if isinstance(a, (list, tuple, array.array)):
       self.assertEqual(len(a), len(b), prefix + ' len (%d vs %d)' % (
           len(a), len(b)))
       for i in range(len(a)):
@@ -0,0 +1,402 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Compact binary storage of the native heap snapshots of an archive.
+
+Consecutive snapshots of a process share most of their allocations, and
+virtually all of their stack traces. Hence the store is organized as follows:
+  - A table file, shared by all the snapshots of the archive, which holds the
+    stack frames and the stack traces (tuples of frame ids). It is append-only:
+    each stored snapshot appends a record with the frames and stack traces that
+    were not known yet.
+  - One file per snapshot, made of two sections:
+    1. The totals (count, size, resident size) of the allocations of each
+       stack trace. This is all that classification (hence time series) needs,
+       see |LoadSummary|, and it does not require decoding the allocations.
+    2. The allocations, stored as a delta w.r.t. a base snapshot: the indexes
+       of the base allocations which have gone, plus the new ones. Every
+       |_KEYFRAME_INTERVAL| snapshots, all the allocations are stored instead,
+       so that loading a snapshot never needs to decode long delta chains.
+Sections and records are zlib-compressed arrays of little-endian integers.
+
+Allocations in a snapshot decoded from a delta are ordered as follows: first the
+ones which were in the base snapshot (in the base order), then the new ones.
+"""
+
+import collections
+import os
+import struct
+import tempfile
+import zlib
+
+from memory_inspector.core import native_heap
+
+
+_TABLES_FILE = 'nheap-tables.bin'
+_MAGIC = 'MINHEAP1'
+_KEYFRAME_INTERVAL = 10
+
+
+class NativeHeapStore(object):
+  """Stores and loads the |native_heap.NativeHeap| snapshots of an archive."""
+
+  def __init__(self, path):
+    self._path = path
+    # The archive-wide tables, loaded lazily. See |_LoadTables|.
+    self._tables_size = None  # Size of the tables file when last read.
+    self._frames = []  # frame id -> (address, exec_file_rel_path, offset).
+    self._frame_ids = {}  # (address, exec_file_rel_path, offset) -> frame id.
+    self._stack_traces = []  # stack trace id -> tuple of frame ids.
+    self._stack_trace_ids = {}  # tuple of frame ids -> stack trace id.
+    # The allocations of the last snapshot stored or loaded, as a
+    # (snapshot_name, chain_length, |_Allocations|) tuple.
+    self._last_snapshot = None
+
+  @staticmethod
+  def GetFileName(snapshot_name):
+    return snapshot_name + '-nheap.bin'
+
+  def Has(self, snapshot_name):
+    return os.path.exists(self._GetSnapshotPath(snapshot_name))
+
+  def Store(self, snapshot_name, nheap, base_snapshot_name=None):
+    """Stores |nheap| as a delta w.r.t. the |base_snapshot_name| snapshot.
+
+    The base is used only if stored in this format and if the delta chain is
+    not too long. Otherwise all the allocations are stored.
+    """
+    assert(isinstance(nheap, native_heap.NativeHeap))
+    self._LoadTables()
+    new_frames_start = len(self._frames)
+    new_stack_traces_start = len(self._stack_traces)
+
+    # Map the stack traces of the heap onto the archive-wide ones.
+    stack_trace_ids = {}  # heap stack trace id -> archive stack trace id.
+    allocs = _Allocations()
+    for alloc in nheap.allocations:
+      stack_trace_id = stack_trace_ids.get(alloc.stack_trace_id)
+      if stack_trace_id is None:
+        stack_trace_id = self._InternStacktrace(alloc.stack_trace)
+        stack_trace_ids[alloc.stack_trace_id] = stack_trace_id
+      allocs.Append(alloc.start, alloc.size, alloc.flags, stack_trace_id,
+                    alloc.resident_size)
+
+    base = None
+    chain_length = 0
+    if base_snapshot_name and self.Has(base_snapshot_name):
+      base_chain_length, base_allocs = self._LoadAllocations(base_snapshot_name)
+      if base_chain_length + 1 < _KEYFRAME_INTERVAL:
+        base = base_allocs
+        chain_length = base_chain_length + 1
+    if base is not None:
+      allocs, removed_indexes, added_indexes = base.Diff(allocs)
+    else:
+      base_snapshot_name = None
+      removed_indexes = []
+      added_indexes = range(len(allocs))
+
+    # Update the tables first, so that the snapshot never refers to stack
+    # traces which are not stored.
+    if (len(self._frames) > new_frames_start or
+        len(self._stack_traces) > new_stack_traces_start):
+      record = _Writer()
+      new_frames = self._frames[new_frames_start:]
+      record.WriteInts(frame[0] for frame in new_frames)
+      record.WriteStrings(frame[1] or '' for frame in new_frames)
+      # Frames which have not been relativized have no file nor offset.
+      record.WriteInts(0 if frame[2] is None else frame[2] + 1
+                       for frame in new_frames)
+      new_stack_traces = self._stack_traces[new_stack_traces_start:]
+      record.WriteInts(len(frame_ids) for frame_ids in new_stack_traces)
+      record.WriteInts(frame_id for frame_ids in new_stack_traces
+                       for frame_id in frame_ids)
+      with open(os.path.join(self._path, _TABLES_FILE), 'ab') as f:
+        # Drop the incomplete last record left by an interrupted Store, if any
+        # (see |_LoadTables|), rather than appending after it.
+        f.truncate(self._tables_size or 0)
+        f.write(record.GetCompressedRecord())
+        self._tables_size = f.tell()
+
+    summary = _Writer()
+    totals = allocs.GetTotalsByStacktrace()
+    stack_trace_ids = sorted(totals.iterkeys())
+    summary.WriteInts(stack_trace_ids)
+    for i in xrange(3):  # Count, size and resident size.
+      summary.WriteInts(totals[k][i] for k in stack_trace_ids)
+    delta = _Writer()
+    delta.WriteInts(removed_indexes)
+    for column in allocs.GetColumns():
+      delta.WriteInts(column[i] for i in added_indexes)
+    delta.WriteInts(allocs.resident_sizes)
+    header = struct.pack('<8sI', _MAGIC, chain_length)
+    header += _Writer.EncodeString(base_snapshot_name or '')
+    _AtomicWrite(self._GetSnapshotPath(snapshot_name), header +
+                 summary.GetCompressedRecord() + delta.GetCompressedRecord())
+    self._last_snapshot = (snapshot_name, chain_length, allocs)
+
+  def Load(self, snapshot_name):
+    """Returns the |native_heap.NativeHeap| of a snapshot."""
+    _, allocs = self._LoadAllocations(snapshot_name)
+    self._LoadTables()
+    nheap = native_heap.NativeHeap()
+    stack_traces = {}
+    for start, size, flags, stack_trace_id, resident_size in allocs.IterRows():
+      stack_trace = stack_traces.get(stack_trace_id)
+      if stack_trace is None:
+        stack_trace = self._MakeStacktrace(nheap, stack_trace_id)
+        stack_traces[stack_trace_id] = stack_trace
+      nheap.Add(native_heap.Allocation(size, stack_trace, start=start,
+                                       flags=flags,
+                                       resident_size=resident_size))
+    return nheap
+
+  def LoadSummary(self, snapshot_name):
+    """Returns a |native_heap.NativeHeap| with one allocation per stack trace.
+
+    The size and resident size of each allocation are the totals of all the
+    allocations of the snapshot with that stack trace. Classification results
+    are the same as with the full heap, which is much more expensive to load.
+    """
+    with open(self._GetSnapshotPath(snapshot_name), 'rb') as f:
+      _ReadHeader(f)
+      summary = _Reader(f)
+    self._LoadTables()
+    stack_trace_ids = summary.ReadInts()
+    summary.ReadInts()  # The counts.
+    sizes = summary.ReadInts()
+    resident_sizes = summary.ReadInts()
+    nheap = native_heap.NativeHeap()
+    for stack_trace_id, size, resident_size in zip(stack_trace_ids, sizes,
+                                                   resident_sizes):
+      nheap.Add(native_heap.Allocation(
+          size, self._MakeStacktrace(nheap, stack_trace_id),
+          resident_size=resident_size))
+    return nheap
+
+  def _GetSnapshotPath(self, snapshot_name):
+    return os.path.join(self._path, NativeHeapStore.GetFileName(snapshot_name))
+
+  def _LoadAllocations(self, snapshot_name):
+    """Returns the (chain_length, |_Allocations|) of a snapshot."""
+    if self._last_snapshot and self._last_snapshot[0] == snapshot_name:
+      return self._last_snapshot[1:]
+    with open(self._GetSnapshotPath(snapshot_name), 'rb') as f:
+      chain_length, base_snapshot_name = _ReadHeader(f)
+      _Reader(f)  # Skip the summary.
+      delta = _Reader(f)
+    if base_snapshot_name:
+      _, allocs = self._LoadAllocations(base_snapshot_name)
+      allocs = allocs.Remove(delta.ReadInts())
+    else:
+      delta.ReadInts()
+      allocs = _Allocations()
+    allocs.rows.extend(zip(*[delta.ReadInts() for _ in xrange(4)]))
+    allocs.resident_sizes = delta.ReadInts()
+    assert(len(allocs.rows) == len(allocs.resident_sizes))
+    self._last_snapshot = (snapshot_name, chain_length, allocs)
+    return chain_length, allocs
+
+  def _LoadTables(self):
+    """Loads the table records which have not been read yet."""
+    path = os.path.join(self._path, _TABLES_FILE)
+    if not os.path.exists(path) or os.path.getsize(path) == self._tables_size:
+      return
+    with open(path, 'rb') as f:
+      f.seek(self._tables_size or 0)
+      while True:
+        try:
+          record = _Reader(f)
+        except EOFError:
+          break  # The last record is incomplete (e.g., an interrupted Store).
+        self._tables_size = f.tell()
+        addresses = record.ReadInts()
+        paths = record.ReadStrings()
+        offsets = record.ReadInts()
+        for address, exec_file_rel_path, offset in zip(addresses, paths,
+                                                        offsets):
+          if offset:
+            frame = (address, exec_file_rel_path, offset - 1)
+          else:
+            frame = (address, None, None)
+          self._frame_ids[frame] = len(self._frames)
+          self._frames.append(frame)
+        depths = record.ReadInts()
+        frame_ids = record.ReadInts()
+        pos = 0
+        for depth in depths:
+          stack_trace = tuple(frame_ids[pos:pos + depth])
+          pos += depth
+          self._stack_trace_ids[stack_trace] = len(self._stack_traces)
+          self._stack_traces.append(stack_trace)
+
+  def _InternStacktrace(self, stack_trace):
+    frame_ids = []
+    for frame in stack_trace.frames:
+      key = (frame.address, frame.exec_file_rel_path, frame.offset)
+      frame_id = self._frame_ids.get(key)
+      if frame_id is None:
+        frame_id = len(self._frames)
+        self._frames.append(key)
+        self._frame_ids[key] = frame_id
+      frame_ids.append(frame_id)
+    frame_ids = tuple(frame_ids)
+    stack_trace_id = self._stack_trace_ids.get(frame_ids)
+    if stack_trace_id is None:
+      stack_trace_id = len(self._stack_traces)
+      self._stack_traces.append(frame_ids)
+      self._stack_trace_ids[frame_ids] = stack_trace_id
+    return stack_trace_id
+
+  def _MakeStacktrace(self, nheap, stack_trace_id):
+    frames = [self._frames[i] for i in self._stack_traces[stack_trace_id]]
+    for address, exec_file_rel_path, offset in frames:
+      frame = nheap.GetStackFrame(address)
+      if offset is not None and frame.offset is None:
+        frame.SetExecFileInfo(exec_file_rel_path, offset)
+    return nheap.GetStacktrace([frame[0] for frame in frames])
+
+
+class _Allocations(object):
+  """The allocations of a snapshot, as columns of archive-wide ids."""
+
+  def __init__(self):
+    self.rows = []  # [(start, size, flags, stack_trace_id)].
+    self.resident_sizes = []
+
+  def Append(self, start, size, flags, stack_trace_id, resident_size):
+    self.rows.append((start, size, flags, stack_trace_id))
+    self.resident_sizes.append(resident_size)
+
+  def __len__(self):
+    return len(self.rows)
+
+  def GetColumns(self):
+    """Returns the (starts, sizes, flags, stack_trace_ids) columns."""
+    return zip(*self.rows) if self.rows else [()] * 4
+
+  def IterRows(self):
+    for row, resident_size in zip(self.rows, self.resident_sizes):
+      yield row + (resident_size,)
+
+  def GetTotalsByStacktrace(self):
+    """Returns a {stack_trace_id: [count, size, resident_size]} dict."""
+    totals = {}
+    for (_, size, _, stack_trace_id), resident_size in zip(
+        self.rows, self.resident_sizes):
+      total = totals.get(stack_trace_id)
+      if total is None:
+        total = totals[stack_trace_id] = [0, 0, 0]
+      total[0] += 1
+      total[1] += size
+      total[2] += resident_size
+    return totals
+
+  def Remove(self, indexes):
+    """Returns a copy without the allocations at |indexes|.
+
+    Resident sizes are not copied, as they are stored for every snapshot.
+    """
+    removed = set(indexes)
+    ret = _Allocations()
+    ret.rows = [row for i, row in enumerate(self.rows) if i not in removed]
+    return ret
+
+  def Diff(self, other):
+    """Computes the delta from this (the base) to |other|.
+
+    Returns:
+      A tuple (allocs, removed_indexes, added_indexes), where |allocs| are the
+      allocations of |other| in the order that decoding the delta produces,
+      |removed_indexes| are the indexes of the allocations of the base which
+      are not in |other| and |added_indexes| are the indexes (in |allocs|) of
+      the allocations which are not in the base.
+    """
+    other_indexes = collections.defaultdict(collections.deque)
+    for i, row in enumerate(other.rows):
+      other_indexes[row].append(i)
+    order = []
+    removed_indexes = []
+    for i, row in enumerate(self.rows):
+      if other_indexes.get(row):
+        order.append(other_indexes[row].popleft())
+      else:
+        removed_indexes.append(i)
+    num_kept = len(order)
+    order.extend(sorted(i for indexes in other_indexes.itervalues()
+                        for i in indexes))
+    allocs = _Allocations()
+    allocs.rows = [other.rows[i] for i in order]
+    allocs.resident_sizes = [other.resident_sizes[i] for i in order]
+    return allocs, removed_indexes, range(num_kept, len(order))
+
+
+class _Writer(object):
+  """Builds a compressed record out of arrays of integers and strings."""
+
+  def __init__(self):
+    self._parts = []
+
+  def WriteInts(self, values):
+    values = list(values)
+    self._parts.append(struct.pack('<I%dQ' % len(values), len(values), *values))
+
+  def WriteStrings(self, values):
+    values = list(values)
+    self.WriteInts(len(value) for value in values)
+    self._parts.append(''.join(values))
+
+  def GetCompressedRecord(self):
+    data = zlib.compress(''.join(self._parts))
+    return struct.pack('<I', len(data)) + data
+
+  @staticmethod
+  def EncodeString(value):
+    return struct.pack('<I', len(value)) + value
+
+
+class _Reader(object):
+  """Reads back a record built by |_Writer| from a file."""
+
+  def __init__(self, f):
+    self._data = zlib.decompress(_ReadExactly(f, _ReadUint32(f)))
+    self._pos = 0
+
+  def ReadInts(self):
+    count = struct.unpack_from('<I', self._data, self._pos)[0]
+    values = struct.unpack_from('<%dQ' % count, self._data, self._pos + 4)
+    self._pos += 4 + 8 * count
+    return list(values)
+
+  def ReadStrings(self):
+    lengths = self.ReadInts()
+    values = []
+    for length in lengths:
+      values.append(self._data[self._pos:self._pos + length])
+      self._pos += length
+    return values
+
+
+def _ReadExactly(f, size):
+  data = f.read(size)
+  if len(data) != size:
+    raise EOFError()
+  return data
+
+
+def _ReadUint32(f):
+  return struct.unpack('<I', _ReadExactly(f, 4))[0]
+
+
+def _ReadHeader(f):
+  """Returns the (chain_length, base_snapshot_name) of a snapshot file."""
+  magic, chain_length = struct.unpack('<8sI', _ReadExactly(f, 12))
+  assert(magic == _MAGIC), 'Not a native heap snapshot: %s' % f.name
+  return chain_length, _ReadExactly(f, _ReadUint32(f))
+
+
+def _AtomicWrite(path, data):
+  fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+  with os.fdopen(fd, 'wb') as f:
+    f.write(data)
+  os.rename(temp_path, path)
@@ -36,11 +36,15 @@ class Encoder(json.JSONEncoder):
     if isinstance(obj, native_heap.NativeHeap):
       # Just keep the list of (distinct) stack frames from the index. Encoding
       # it as a JSON dictionary would be redundant.
-      return {'stack_frames': obj.stack_frames.values(),
-              'allocations': obj.allocations}
+      return {'stack_frames': obj.frame_table,
+              'allocations': list(obj.allocations)}
 
     if isinstance(obj, native_heap.Allocation):
-      return obj.__dict__
+      return {'start': obj.start,
+              'size': obj.size,
+              'stack_trace': obj.stack_trace,
+              'flags': obj.flags,
+              'resident_size': obj.resident_size}
 
     if isinstance(obj, stacktrace.Stacktrace):
       # Keep just absolute addrs of stack frames. The full frame details will be
@@ -102,9 +106,7 @@ class NativeHeapDecoder(json.JSONDecoder):
                             frame_dict['offset'])
     # Then load backtraces (reusing stack frames from the index above).
     for alloc_dict in d['allocations']:
-      stack_trace = stacktrace.Stacktrace()
-      for absolute_addr in alloc_dict['stack_trace']:
-        stack_trace.Add(nh.GetStackFrame(absolute_addr))
+      stack_trace = nh.GetStacktrace(alloc_dict['stack_trace'])
       nh.Add(native_heap.Allocation(start=alloc_dict['start'],
                                     size=alloc_dict['size'],
                                     stack_trace=stack_trace,
@@ -198,7 +198,8 @@ def _CreateProfile(args, req_vars):  # pylint: disable=W0613
       if req_vars['type'] == 'mmap':
         dumps[time_delta] = archive.LoadMemMaps(timestamp)
       elif req_vars['type'] == 'nheap':
-        dumps[time_delta] = archive.LoadNativeHeap(timestamp)
+        # Classification needs just the totals for each stack trace.
+        dumps[time_delta] = archive.LoadNativeHeapSummary(timestamp)
 
   # Case 1b: Use a dump recently cached (only mmap, via _DumpMmapsForProcess).
   elif req_vars['source'] == 'cache':
@@ -12,13 +12,16 @@ import gdb_helper
 from collections import defaultdict
 import hashlib
 import logging
+import mmap
+import multiprocessing
 import optparse
 import os
 import re
 import subprocess
 import sys
 import time
-from xml.dom.minidom import parse
+from xml.dom.minidom import Document
+from xml.parsers import expat
 from xml.parsers.expat import ExpatError
 
 import common
@@ -103,12 +106,6 @@ def gatherFrames(node, source_dir):
       break
 
     frames += [frame_dict]
-
-    global TheAddressTable
-    if TheAddressTable != None and frame_dict[SRC_LINE] == "":
-      # Try using gdb
-      TheAddressTable.Add(frame_dict[OBJECT_FILE],
-                          frame_dict[INSTRUCTION_POINTER])
   return frames
 
 class ValgrindError:
@@ -356,29 +353,163 @@ class ValgrindError:
   def ErrorHash(self):
     return int(hashlib.md5(self.UniqueString()).hexdigest()[:16], 16)
 
+  def AddToAddressTable(self, address_table):
+    ''' Registers the frames without line numbers for lookup with gdb.'''
+    for backtrace in self._backtraces:
+      for frame in backtrace[1]:
+        if frame[SRC_LINE] == "":
+          address_table.Add(frame[OBJECT_FILE], frame[INSTRUCTION_POINTER])
+
   def __hash__(self):
     return hash(self.UniqueString())
   def __eq__(self, rhs):
     return self.UniqueString() == rhs
 
 def log_is_finished(f, force_finish):
-  f.seek(0)
-  prev_line = ""
-  while True:
-    line = f.readline()
-    if line == "":
-      if not force_finish:
-        return False
-      # Okay, the log is not finished but we can make it up to be parseable:
-      if prev_line.strip() in ["</error>", "</errorcounts>", "</status>"]:
-        f.write("</valgrindoutput>\n")
-        return True
-      return False
-    if '</valgrindoutput>' in line:
-      # Valgrind often has garbage after </valgrindoutput> upon crash.
-      f.truncate()
-      return True
-    prev_line = line
+  # Logs can be hundreds of MB, so search them with mmap rather than reading
+  # them line by line every time they are polled.
+  f.seek(0, os.SEEK_END)
+  size = f.tell()
+  if size == 0:
+    return False
+  m = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+  try:
+    end = m.find('</valgrindoutput>')
+    if end != -1:
+      end = m.find('\n', end)
+      end = size if end == -1 else end + 1
+    else:
+      last_line = m[m.rfind('\n', 0, size - 1) + 1:]
+  finally:
+    m.close()
+  if end != -1:
+    # Valgrind often has garbage after </valgrindoutput> upon crash.
+    f.truncate(end)
+    return True
+  if not force_finish:
+    return False
+  # Okay, the log is not finished but we can make it up to be parseable:
+  if last_line.strip() in ["</error>", "</errorcounts>", "</status>"]:
+    f.write("</valgrindoutput>\n")
+    return True
+  return False
+
+class _LogParser:
+  ''' Streams a Valgrind XML log through expat, building DOM nodes only for
+  the elements named in |tags|, one element at a time. Each of them is passed
+  to |callback| once complete and then freed, so the memory used does not
+  depend on the size of the log.
+  '''
+
+  def __init__(self, tags, callback):
+    self._tags = tags
+    self._callback = callback
+    self._document = Document()
+    self._stack = []
+    self._text = []
+    self._in_cdata = False
+
+  def Parse(self, f):
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = self._StartElement
+    parser.EndElementHandler = self._EndElement
+    parser.CharacterDataHandler = self._CharacterData
+    parser.StartCdataSectionHandler = self._StartCdataSection
+    parser.EndCdataSectionHandler = self._EndCdataSection
+    parser.ParseFile(f)
+
+  def _FlushText(self):
+    if self._text:
+      data = "".join(self._text)
+      if self._in_cdata:
+        node = self._document.createCDATASection(data)
+      else:
+        node = self._document.createTextNode(data)
+      self._stack[-1].appendChild(node)
+      self._text = []
+
+  def _StartElement(self, name, attrs):
+    if not self._stack and name not in self._tags:
+      return
+    self._FlushText()
+    element = self._document.createElement(name)
+    if self._stack:
+      self._stack[-1].appendChild(element)
+    self._stack.append(element)
+
+  def _EndElement(self, name):
+    if not self._stack:
+      return
+    self._FlushText()
+    element = self._stack.pop()
+    if not self._stack:
+      self._callback(element)
+      element.unlink()
+
+  def _CharacterData(self, data):
+    if self._stack:
+      self._text.append(data)
+
+  def _StartCdataSection(self):
+    self._FlushText()
+    self._in_cdata = True
+
+  def _EndCdataSection(self):
+    self._FlushText()
+    self._in_cdata = False
+
+def _ParseLog((file, source_dir, show_all_leaks, testcase)):
+  ''' Parses a Valgrind XML log, possibly in a worker process.
+
+  Returns:
+    A tuple of the unique errors of the log, its suppression counts, its
+    load_obj (binary, load address) pairs and the (message, line number) of
+    the ExpatError raised while parsing it, if any. The ExpatError itself
+    would lose its line number when passed back from a worker process.
+  '''
+  errors = []
+  unique_errors = set()
+  suppcounts = defaultdict(int)
+  load_objs = []
+  # Mutable, so that it can be set by the callback.
+  state = {"commandline": None, "seen_suppcounts": False}
+
+  def OnElement(element):
+    if element.localName == "load_obj":
+      load_objs.append((getTextOf(element, "obj"), getTextOf(element, "ip")))
+    elif element.localName == "preamble":
+      if state["commandline"] is None:
+        for node in element.getElementsByTagName("line"):
+          for x in node.childNodes:
+            if x.nodeType == node.TEXT_NODE and "Command" in x.data:
+              state["commandline"] = x.data
+              break
+    elif element.localName == "error":
+      # Ignore "possible" leaks for now by default.
+      if (show_all_leaks or
+          getTextOf(element, "kind") != "Leak_PossiblyLost"):
+        error = ValgrindError(source_dir, element, state["commandline"],
+                              testcase)
+        if error not in unique_errors:
+          unique_errors.add(error)
+          errors.append(error)
+    elif element.localName == "suppcounts":
+      if not state["seen_suppcounts"]:
+        state["seen_suppcounts"] = True
+        for node in element.getElementsByTagName("pair"):
+          count = getTextOf(node, "count");
+          name = getTextOf(node, "name");
+          suppcounts[name] += int(count)
+
+  parser = _LogParser(["load_obj", "preamble", "error", "suppcounts"],
+                      OnElement)
+  try:
+    with open(file, "r") as f:
+      parser.Parse(f)
+  except ExpatError, e:
+    return None, None, None, (str(e), e.lineno)
+  return errors, dict(suppcounts), load_objs, None
 
 class MemcheckAnalyzer:
   ''' Given a set of Valgrind XML files, parse all the errors out of them,
@@ -405,7 +536,8 @@ class MemcheckAnalyzer:
   # Max time to wait for memcheck logs to complete.
   LOG_COMPLETION_TIMEOUT = 180.0
 
-  def __init__(self, source_dir, show_all_leaks=False, use_gdb=False):
+  def __init__(self, source_dir, show_all_leaks=False, use_gdb=False,
+               jobs=None):
     '''Create a parser for Memcheck logs.
 
     Args:
@@ -413,10 +545,13 @@ class MemcheckAnalyzer:
       show_all_leaks: Whether to show even less important leaks
       use_gdb: Whether to use gdb to resolve source filenames and line numbers
                in the report stacktraces
+      jobs: Number of worker processes parsing the logs (defaults to the
+            number of CPUs)
     '''
     self._source_dir = source_dir
     self._show_all_leaks = show_all_leaks
     self._use_gdb = use_gdb
+    self._jobs = jobs or multiprocessing.cpu_count()
 
     # Contains the set of unique errors
     self._errors = set()
@@ -467,6 +602,7 @@ class MemcheckAnalyzer:
     start_time = self._analyze_start_time
 
     parse_failed = False
+    finished_files = []
     for file in files:
       # Wait up to three minutes for valgrind to finish writing all files,
       # but after that, just skip incomplete files and warn.
@@ -511,68 +647,64 @@ class MemcheckAnalyzer:
           logging.warn(str(origsize - newsize) +
                        " bytes of junk were after </valgrindoutput> in %s!" %
                        file)
-        try:
-          parsed_file = parse(file);
-        except ExpatError, e:
-          parse_failed = True
-          logging.warn("could not parse %s: %s" % (file, e))
-          lineno = e.lineno - 1
-          context_lines = 5
-          context_start = max(0, lineno - context_lines)
-          context_end = lineno + context_lines + 1
-          context_file = open(file, "r")
-          for i in range(0, context_start):
-            context_file.readline()
-          for i in range(context_start, context_end):
-            context_data = context_file.readline().rstrip()
-            if i != lineno:
-              logging.warn("  %s" % context_data)
-            else:
-              logging.warn("> %s" % context_data)
-          context_file.close()
-          continue
+        finished_files.append(file)
+
+    # Parse the finished logs in parallel; the results are merged in order.
+    parse_args = [(file, self._source_dir, self._show_all_leaks, testcase)
+                  for file in finished_files]
+    if self._jobs > 1 and len(finished_files) > 1:
+      pool = multiprocessing.Pool(min(self._jobs, len(finished_files)))
+      try:
+        results = pool.map(_ParseLog, parse_args)
+      finally:
+        pool.close()
+        pool.join()
+    else:
+      results = map(_ParseLog, parse_args)
+
+    for file, (errors, file_suppcounts, load_objs, parse_error) in zip(
+        finished_files, results):
+      if parse_error:
+        parse_failed = True
+        message, lineno = parse_error
+        logging.warn("could not parse %s: %s" % (file, message))
+        lineno = lineno - 1
+        context_lines = 5
+        context_start = max(0, lineno - context_lines)
+        context_end = lineno + context_lines + 1
+        context_file = open(file, "r")
+        for i in range(0, context_start):
+          context_file.readline()
+        for i in range(context_start, context_end):
+          context_data = context_file.readline().rstrip()
+          if i != lineno:
+            logging.warn("  %s" % context_data)
+          else:
+            logging.warn("> %s" % context_data)
+        context_file.close()
+        continue
+      if TheAddressTable != None:
+        for obj, ip in load_objs:
+          TheAddressTable.AddBinaryAt(obj, ip)
+
+      # Errors are deduplicated by their hash across the logs.
+      for error in errors:
         if TheAddressTable != None:
-          load_objs = parsed_file.getElementsByTagName("load_obj")
-          for load_obj in load_objs:
-            obj = getTextOf(load_obj, "obj")
-            ip = getTextOf(load_obj, "ip")
-            TheAddressTable.AddBinaryAt(obj, ip)
-
-        commandline = None
-        preamble = parsed_file.getElementsByTagName("preamble")[0];
-        for node in preamble.getElementsByTagName("line"):
-          if node.localName == "line":
-            for x in node.childNodes:
-              if x.nodeType == node.TEXT_NODE and "Command" in x.data:
-                commandline = x.data
-                break
-
-        raw_errors = parsed_file.getElementsByTagName("error")
-        for raw_error in raw_errors:
-          # Ignore "possible" leaks for now by default.
-          if (self._show_all_leaks or
-              getTextOf(raw_error, "kind") != "Leak_PossiblyLost"):
-            error = ValgrindError(self._source_dir,
-                                  raw_error, commandline, testcase)
-            if error not in cur_report_errors:
-              # We haven't seen such errors doing this report yet...
-              if error in self._errors:
-                # ... but we saw it in earlier reports, e.g. previous UI test
-                cur_report_errors.add("This error was already printed in "
-                                      "some other test, see 'hash=#%016X#'" % \
-                                      error.ErrorHash())
-              else:
-                # ... and we haven't seen it in other tests as well
-                self._errors.add(error)
-                cur_report_errors.add(error)
-
-        suppcountlist = parsed_file.getElementsByTagName("suppcounts")
-        if len(suppcountlist) > 0:
-          suppcountlist = suppcountlist[0]
-          for node in suppcountlist.getElementsByTagName("pair"):
-            count = getTextOf(node, "count");
-            name = getTextOf(node, "name");
-            suppcounts[name] += int(count)
+          error.AddToAddressTable(TheAddressTable)
+        if error not in cur_report_errors:
+          # We haven't seen such errors doing this report yet...
+          if error in self._errors:
+            # ... but we saw it in earlier reports, e.g. previous UI test
+            cur_report_errors.add("This error was already printed in "
+                                  "some other test, see 'hash=#%016X#'" % \
+                                  error.ErrorHash())
+          else:
+            # ... and we haven't seen it in other tests as well
+            self._errors.add(error)
+            cur_report_errors.add(error)
+
+      for name, count in file_suppcounts.iteritems():
+        suppcounts[name] += count
 
     if len(badfiles) > 0:
       logging.warn("valgrind didn't finish writing %d files?!" % len(badfiles))
@@ -168,13 +168,47 @@ def ReadSuppressionsFromFile(filename):
     raise
 
 
+def _WidenMemcheckTypes(regex):
+  """Makes the Memcheck:TYPE lines of |regex| match the aliased types."""
+  # In the recent version of valgrind-variant we've switched
+  # from memcheck's default Addr[1248]/Value[1248]/Cond suppression types
+  # to simply Unaddressable/Uninitialized.
+  # The suppression generator no longer gives us "old" types thus
+  # for the "new-type" suppressions:
+  #  * Memcheck:Unaddressable should also match Addr* reports,
+  #  * Memcheck:Uninitialized should also match Cond and Value reports,
+  #
+  # We also want to support legacy suppressions (e.g. copied from
+  # upstream bugs etc), so:
+  #  * Memcheck:Addr[1248] suppressions should match Unaddressable reports,
+  #  * Memcheck:Cond and Memcheck:Value[1248] should match Uninitialized.
+  # Please note the latest two rules only apply to the
+  # tools/valgrind/waterfall.sh suppression matcher and the real
+  # valgrind-variant Memcheck will not suppress
+  # e.g. Addr1 printed as Unaddressable with Addr4 suppression.
+  # Be careful to check the access size while copying legacy suppressions!
+  for sz in [1, 2, 4, 8]:
+    regex = regex.replace("\nMemcheck:Addr%d\n" % sz,
+                          "\nMemcheck:(Addr%d|Unaddressable)\n" % sz)
+    regex = regex.replace("\nMemcheck:Value%d\n" % sz,
+                          "\nMemcheck:(Value%d|Uninitialized)\n" % sz)
+  regex = regex.replace("\nMemcheck:Cond\n",
+                        "\nMemcheck:(Cond|Uninitialized)\n")
+  regex = regex.replace("\nMemcheck:Unaddressable\n",
+                        "\nMemcheck:(Addr.|Unaddressable)\n")
+  regex = regex.replace("\nMemcheck:Uninitialized\n",
+                        "\nMemcheck:(Cond|Value.|Uninitialized)\n")
+  return regex
+
+
 class ValgrindStyleSuppression(Suppression):
   """A suppression using the Valgrind syntax.
 
   Most tools, even ones that are not Valgrind-based, use this syntax.
 
   Attributes:
-    Same as Suppression.
+    type_regex: The regex matching the types of reports it may suppress.
+    Rest inherited from Suppression.
   """
 
   def __init__(self, description, type, stack, defined_at):
@@ -189,34 +223,11 @@ class ValgrindStyleSuppression(Suppression):
     regex += '(.*\n)*'
     regex += '}'
 
-    # In the recent version of valgrind-variant we've switched
-    # from memcheck's default Addr[1248]/Value[1248]/Cond suppression types
-    # to simply Unaddressable/Uninitialized.
-    # The suppression generator no longer gives us "old" types thus
-    # for the "new-type" suppressions:
-    #  * Memcheck:Unaddressable should also match Addr* reports,
-    #  * Memcheck:Uninitialized should also match Cond and Value reports,
-    #
-    # We also want to support legacy suppressions (e.g. copied from
-    # upstream bugs etc), so:
-    #  * Memcheck:Addr[1248] suppressions should match Unaddressable reports,
-    #  * Memcheck:Cond and Memcheck:Value[1248] should match Uninitialized.
-    # Please note the latest two rules only apply to the
-    # tools/valgrind/waterfall.sh suppression matcher and the real
-    # valgrind-variant Memcheck will not suppress
-    # e.g. Addr1 printed as Unaddressable with Addr4 suppression.
-    # Be careful to check the access size while copying legacy suppressions!
-    for sz in [1, 2, 4, 8]:
-      regex = regex.replace("\nMemcheck:Addr%d\n" % sz,
-                            "\nMemcheck:(Addr%d|Unaddressable)\n" % sz)
-      regex = regex.replace("\nMemcheck:Value%d\n" % sz,
-                            "\nMemcheck:(Value%d|Uninitialized)\n" % sz)
-    regex = regex.replace("\nMemcheck:Cond\n",
-                          "\nMemcheck:(Cond|Uninitialized)\n")
-    regex = regex.replace("\nMemcheck:Unaddressable\n",
-                          "\nMemcheck:(Addr.|Unaddressable)\n")
-    regex = regex.replace("\nMemcheck:Uninitialized\n",
-                          "\nMemcheck:(Cond|Value.|Uninitialized)\n")
+    regex = _WidenMemcheckTypes(regex)
+
+    # Used by SuppressionIndex to pick the suppressions for a report type.
+    self.type_regex = re.compile(
+        '%s$' % _WidenMemcheckTypes('\n%s\n' % type)[1:-1])
 
     return super(ValgrindStyleSuppression, self).__init__(
         description, type, stack, defined_at, regex)
@@ -510,6 +521,118 @@ def ParseSuppressionOfType(lines, supp_descriptor, def_line_no, report_type):
 
 
 
+def _IndexKey(stack):
+  """Returns the (kind, key) pair to index |stack| under, or None.
+
+  Literal frames must appear verbatim in the report stack, so the key is the
+  first literal frame: its kind is 'frame' and the key is (position, frame) if
+  no ellipsis precedes it, since it then has a fixed position in the report
+  stack, and the kind is 'any' otherwise.  Stacks with no literal frame are
+  keyed by the literal prefix of their first frame, of kind 'prefix', unless
+  that frame is an ellipsis.
+  """
+  fixed = True
+  for (position, frame) in enumerate(stack):
+    if frame == ELLIPSIS:
+      fixed = False
+    elif '*' not in frame and '?' not in frame:
+      if fixed:
+        return ('frame', (position, frame))
+      return ('any', frame)
+  if stack and stack[0] != ELLIPSIS:
+    return ('prefix', re.match('[^*?]*', stack[0]).group())
+  return None
+
+
+class SuppressionIndex(object):
+  """An index of suppressions, to match reports without trying them all.
+
+  Valgrind-style suppressions are bucketed by the report types they match,
+  then by the key returned by _IndexKey().  Other suppressions are candidates
+  for every report.  Candidates are returned in the order of the suppressions
+  given to the index, so that matching a report gives the same result as
+  trying each suppression in turn.
+  """
+
+  def __init__(self, suppressions):
+    # Suppressions with an empty stack never match.
+    self.suppressions = [s for s in suppressions if s.stack]
+    self._untyped = [i for (i, s) in enumerate(self.suppressions)
+                     if not hasattr(s, 'type_regex')]
+    # Maps the type line of reports to their buckets, built on first use.
+    self._buckets = {}
+
+  def _GetBucket(self, report_type):
+    """Returns the suppressions for a report type, indexed by kind and key.
+
+    The 'positions' and 'prefix_lengths' of the keys are included, as well as
+    the 'others' which can't be indexed.
+    """
+    bucket = self._buckets.get(report_type)
+    if bucket is not None:
+      return bucket
+    bucket = {'frame': {}, 'any': {}, 'prefix': {}}
+    others = list(self._untyped)
+    for (i, supp) in enumerate(self.suppressions):
+      if not hasattr(supp, 'type_regex') or (
+          not supp.type_regex.match(report_type)):
+        continue
+      kind_and_key = _IndexKey(supp.stack)
+      if kind_and_key:
+        kind, key = kind_and_key
+        bucket[kind].setdefault(key, []).append(i)
+      else:
+        others.append(i)
+    bucket['positions'] = sorted(set(p for (p, _) in bucket['frame']))
+    bucket['prefix_lengths'] = sorted(set(len(p) for p in bucket['prefix']))
+    bucket['others'] = others
+    self._buckets[report_type] = bucket
+    return bucket
+
+  def Candidates(self, suppression_from_report):
+    """Returns the suppressions which may match the report.
+
+    Args:
+      suppression_from_report: list of strings, as for Suppression.Match().
+    Returns:
+      A list of suppressions, which contains all those that match the report.
+    """
+    lines = [f.strip() for f in suppression_from_report]
+    if len(lines) < 3:
+      # Too short to have a type line, only other suppressions may match.
+      return [self.suppressions[i] for i in self._untyped]
+    bucket = self._GetBucket(lines[2])
+    stack = lines[3:]
+    found = list(bucket['others'])
+    for position in bucket['positions']:
+      if position >= len(stack):
+        break
+      found.extend(bucket['frame'].get((position, stack[position]), []))
+    for frame in set(stack):
+      found.extend(bucket['any'].get(frame, []))
+    if stack:
+      for length in bucket['prefix_lengths']:
+        found.extend(bucket['prefix'].get(stack[0][:length], []))
+    return [self.suppressions[i] for i in sorted(found)]
+
+  def Match(self, suppression_from_report):
+    """Returns the first suppression matching the report, or None."""
+    for supp in self.Candidates(suppression_from_report):
+      if supp.Match(suppression_from_report):
+        return supp
+    return None
+
+  def MatchReports(self, reports):
+    """Matches a batch of reports.
+
+    Args:
+      reports: list of reports, each a list of strings as for Match().
+    Returns:
+      A list with the first suppression matching each report, or None.
+    """
+    return [self.Match(report) for report in reports]
+
+
 def TestStack(stack, positive, negative, suppression_parser=None):
   """A helper function for SelfTest() that checks a single stack.
 
@@ -531,6 +654,18 @@ def TestStack(stack, positive, negative, suppression_parser=None):
     assert not parsed[0].Match(stack.split("\n")), (
         "Suppression:\n%s\ndid match stack:\n%s" % (supp, stack))
 
+  # The index must find the same suppressions as trying them all.
+  parsed = [suppression_parser(supp.split("\n"), "indexed_suppression")[0]
+            for supp in positive + negative]
+  index = SuppressionIndex(parsed)
+  candidates = index.Candidates(stack.split("\n"))
+  for supp in parsed[:len(positive)]:
+    assert supp in candidates, (
+        "Suppression:\n%s\nisn't a candidate for stack:\n%s" % (supp, stack))
+  expected = parsed[0] if positive else None
+  assert index.MatchReports([stack.split("\n")]) == [expected], (
+      "SuppressionIndex didn't match stack:\n%s" % stack)
+
 
 def TestFailPresubmit(supp_text, error_text, suppression_parser=None):
   """A helper function for SelfTest() that verifies a presubmit check fires.
@@ -136,22 +136,31 @@ def main(argv):
       all_reports[report] += [url]
       report_hashes[report] = hash
 
-  reports_count = 0
+  # Group the reports by the platform suppressions they are matched against.
+  platform_reports = defaultdict(list)
   for r in all_reports:
-    cur_supp = supp['common_suppressions']
+    platform = None
     if all([re.search("%20Mac%20|mac_valgrind", url)
             for url in all_reports[r]]):
       # Include mac suppressions if the report is only present on Mac
-      cur_supp += supp['mac_suppressions']
+      platform = 'mac_suppressions'
     elif all([re.search("Linux%20", url) for url in all_reports[r]]):
-      cur_supp += supp['linux_suppressions']
+      platform = 'linux_suppressions'
+    platform_reports[platform].append(r)
 
-    # Test if this report is already suppressed
-    skip = False
-    for s in cur_supp:
-      if s.Match(r.split("\n")):
-        skip = True
-        break
+  # Test which reports are already suppressed.
+  suppressed = set()
+  for platform, reports in platform_reports.iteritems():
+    cur_supp = supp['common_suppressions']
+    if platform:
+      cur_supp = cur_supp + supp[platform]
+    index = suppressions.SuppressionIndex(cur_supp)
+    matches = index.MatchReports([r.split("\n") for r in reports])
+    suppressed.update(r for (r, s) in zip(reports, matches) if s)
+
+  reports_count = 0
+  for r in all_reports:
+    skip = r in suppressed
 
     # Skip reports if none of the symbols are in the report.
     if args.symbol_filter and all(not s in r for s in args.symbol_filter):